@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Compare PX4 SITL startup time when compiling on start and from the SITL build cache.
+
+Needs Docker and PX4_IMAGE locally. Run from the agent directory:
+    python -m benchmarks.bench_sitl_startup --model iris --runs 3
+"""
+import argparse
+import statistics
+import time
+
+import docker
+
+from src.config import settings
+from src.sitl_cache import SitlCache
+
+
+def time_to_ready(client, image: str, command: str, marker: str, timeout: float) -> float:
+    """Seconds from container start until marker appears in its log"""
+    container = client.containers.create(
+        image,
+        command=["bash", "-lc", command],
+        environment={"HEADLESS": "1", "PX4_INSTANCE": "0", "PX4_SIM_UDP_PORT": "14560"},
+        network_mode="host"
+    )
+    try:
+        started = time.perf_counter()
+        container.start()
+        for line in container.logs(stream=True, follow=True):
+            if marker.encode() in line:
+                return time.perf_counter() - started
+            if time.perf_counter() - started > timeout:
+                break
+        raise RuntimeError(f"'{marker}' not seen within {timeout:.0f}s")
+    finally:
+        container.remove(force=True)
+
+
+def report(label: str, samples):
+    print(f"{label:<8} median={statistics.median(samples):7.1f}s min={min(samples):7.1f}s max={max(samples):7.1f}s")
+
+
+def main(args):
+    client = docker.from_env()
+    cache = SitlCache(client)
+    cache.load()
+
+    compile_command = f"make px4_sitl gazebo_{args.model}"
+    report("compile", [
+        time_to_ready(client, settings.px4_image, compile_command, args.marker, args.timeout)
+        for _ in range(args.runs)
+    ])
+
+    # Build the cache entry up front, so only the launch is timed
+    key = cache.key(args.model)
+    if key not in cache.entries:
+        cache._build(key, args.model)
+    if key not in cache.entries:
+        raise SystemExit("SITL cache build failed")
+    image = cache.entries[key].tag
+    report("cached", [
+        time_to_ready(client, image, settings.sitl_run_command.format(model=args.model), args.marker, args.timeout)
+        for _ in range(args.runs)
+    ])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SITL startup time benchmark")
+    parser.add_argument("--model", default="iris")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--marker", default="Ready for takeoff", help="Log line that means the vehicle is up")
+    parser.add_argument("--timeout", type=float, default=3600)
+    main(parser.parse_args())
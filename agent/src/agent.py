@@ -15,8 +15,9 @@ import httpx
 import uvicorn
 
 from src.config import settings
-from src.models import StartRequest, StopRequest, InstanceInfo, NodeStatus
+from src.models import StartRequest, GroupStartRequest, StopRequest, InstanceInfo, NodeStatus
 from src.docker_manager import DockerManager
+from src.events import EventPusher
 
 
 # Global Docker manager instance
@@ -30,19 +31,37 @@ async def lifespan(app: FastAPI):
     
     # Startup
     docker_manager = DockerManager()
+    # Docker calls run on worker threads; hand their events back to the event loop
+    loop = asyncio.get_running_loop()
+    docker_manager.on_event = lambda *args, **fields: loop.call_soon_threadsafe(
+        lambda: event_pusher.emit(*args, **fields)
+    )
+    await docker_manager.run(docker_manager.sitl_cache.load)
+    # Reserve the ports of containers still running from before a restart
+    await docker_manager.run(docker_manager.resync)
+    docker_manager.start_watching()
+    docker_manager.pool.start()
     
     # Register with controller
     await register_with_controller()
+    heartbeat_task = asyncio.create_task(heartbeat_loop())
+    event_pusher.start()
     
     yield
     
-    # Shutdown - cleanup any running containers
+    heartbeat_task.cancel()
+    await event_pusher.stop()
+    
+    # Shutdown - cleanup any running containers, stopping them in parallel
     if docker_manager:
-        for instance_info in docker_manager.list_instances():
-            try:
-                docker_manager.stop_instance(StopRequest(instance_id=instance_info.instance_id))
-            except:
-                pass
+        await docker_manager.pool.stop()
+        await docker_manager.run(docker_manager.pool.drain)
+        instances = docker_manager.list_instances()
+        await asyncio.gather(*(
+            docker_manager.run(docker_manager.stop_instance, StopRequest(instance_id=instance_info.instance_id))
+            for instance_info in instances
+        ), return_exceptions=True)
+        docker_manager.shutdown()
 
 
 app = FastAPI(
@@ -105,6 +124,36 @@ async def register_with_controller():
         print(f"Registration failed: {e}")
 
 
+def sample_load() -> dict:
+    return docker_manager.get_load() if docker_manager else {}
+
+
+# Lifecycle events and load samples pushed to the controller
+event_pusher = EventPusher(load_sampler=sample_load, on_unknown_node=register_with_controller)
+
+
+def heartbeat_url() -> str:
+    """Heartbeat endpoint next to the configured registration URL"""
+    base = settings.controller_url.rsplit("/register", 1)[0]
+    return f"{base}/nodes/{settings.node_id}/heartbeat"
+
+
+async def heartbeat_loop():
+    """Tell the controller this node is alive, re-registering if it doesn't know us"""
+    async with httpx.AsyncClient(verify=False, timeout=10) as client:
+        while True:
+            await asyncio.sleep(settings.heartbeat_interval)
+            try:
+                load = docker_manager.get_load() if docker_manager else {}
+                response = await client.post(heartbeat_url(), json={"api_key": settings.agent_api_key, **load})
+                if response.status_code == 404:
+                    await register_with_controller()
+                elif response.status_code >= 400:
+                    print(f"Heartbeat rejected: {response.status_code} - {response.text}")
+            except Exception as e:
+                print(f"Heartbeat failed: {e}")
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -135,7 +184,11 @@ async def get_agent_status():
         total_cpu_cores=resources["cpu_cores"],
         total_memory_gb=resources["memory_gb"],
         total_disk_gb=resources["disk_gb"],
-        available_ports=available_ports
+        available_ports=available_ports,
+        events=event_pusher.stats(),
+        ports=docker_manager.ports.stats(),
+        warm_pool=docker_manager.pool.stats(),
+        sitl_cache=docker_manager.sitl_cache.stats()
     )
 
 
@@ -155,12 +208,25 @@ async def start_instance(request: StartRequest):
         raise HTTPException(status_code=500, detail="Docker manager not initialized")
     
     try:
-        instance_info = docker_manager.start_px4_instance(request)
-        
-        # Update controller with instance info
-        await update_controller_instance(instance_info)
+        # The controller is told through the event push channel
+        return await docker_manager.run(docker_manager.start_px4_instance, request)
         
-        return instance_info
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/agent/start-group", response_model=List[InstanceInfo])
+async def start_group(request: GroupStartRequest):
+    """Start several PX4 vehicles in one container sharing a Gazebo world"""
+    if not docker_manager:
+        raise HTTPException(status_code=500, detail="Docker manager not initialized")
+    if not 1 <= request.count <= settings.density_max_vehicles:
+        raise HTTPException(status_code=400, detail=f"count must be between 1 and {settings.density_max_vehicles}")
+    if request.instance_ids is not None and len(request.instance_ids) != request.count:
+        raise HTTPException(status_code=400, detail="instance_ids must have one id per vehicle")
+    
+    try:
+        return await docker_manager.run(docker_manager.start_group, request)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -173,20 +239,13 @@ async def stop_instance(request: StopRequest):
         raise HTTPException(status_code=500, detail="Docker manager not initialized")
     
     try:
-        result = docker_manager.stop_instance(request)
+        result = await docker_manager.run(docker_manager.stop_instance, request)
         return result
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-async def update_controller_instance(instance_info: InstanceInfo):
-    """Update controller with instance information"""
-    # This could be used to send instance updates back to controller
-    # For now, we'll just log it
-    print(f"Instance {instance_info.name} started with ID {instance_info.instance_id}")
-
-
 def main():
     parser = argparse.ArgumentParser(description="PX4 Agent")
     parser.add_argument("--host", default=settings.host, help="Host to bind to")
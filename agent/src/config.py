@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Optional
 import socket
 import os
 
@@ -15,14 +15,53 @@ class Settings(BaseSettings):
     # Controller configuration
     controller_url: str = "https://localhost:8000/api/v1/register"
     agent_api_key: str = "agent-registration-key"
+    heartbeat_interval: int = 10  # Seconds between heartbeats to the controller
+    event_push_interval: float = 2.0  # Seconds between event batches (also the load sample period)
+    event_batch_size: int = 500  # Events per push; a full batch is sent straight away
+    event_buffer_size: int = 10000  # Events kept while the controller is unreachable
+    event_retry_max: float = 60.0  # Seconds; cap of the push retry backoff
     
     # Docker configuration
     docker_socket: str = "unix:///var/run/docker.sock"
     px4_image: str = "px4io/px4-dev-simulation:latest"
+    docker_workers: int = 16  # Docker SDK calls run at once (thread pool and connection pool size)
+    
+    # SITL build cache
+    px4_version: str = ""  # Part of the cache key; set it if PX4_IMAGE's tag doesn't pin the PX4 source
+    sitl_cache_enabled: bool = True
+    sitl_cache_max_gb: float = 20.0  # Cached images beyond this are removed, least recently used first
+    sitl_build_timeout: int = 3600  # Seconds
+    sitl_build_command: str = "DONT_RUN=1 make px4_sitl gazebo_{model}"
+    # Runs the prebuilt binary in a cached image (PX4_SIM_UDP_PORT, HEADLESS and PX4_INSTANCE come from the environment)
+    sitl_run_command: str = (
+        "Tools/sitl_run.sh build/px4_sitl_default/bin/px4 none gazebo {model} none "
+        "$PWD $PWD/build/px4_sitl_default"
+    )
     
     # Port allocation
     mav_port_start: int = 14560
     mav_port_end: int = 14570
+    ports_per_instance: int = 1  # Consecutive ports per instance; the first is its MAVLink UDP port
+    port_host_check: bool = True  # Skip ports something else on the host has bound
+    
+    # Warm pool
+    warm_pool: Dict[str, int] = {}  # Idle pre-booted containers to keep per model, e.g. {"iris": 2}
+    warm_pool_interval: float = 5.0  # Seconds between refill checks when nothing was claimed
+    warm_pool_max_load: float = 80.0  # No refills while host CPU or memory use is above this percent
+    warm_pool_ready_log: str = "Startup script returned successfully"  # PX4 log line marking a pool container booted
+    warm_pool_boot_timeout: float = 600.0  # Seconds a pool container may take to boot before it is replaced
+    instance_cpu_cores: float = 1.0  # Budgeted per container when refilling
+    instance_memory_gb: float = 2.0
+    
+    # Density mode: several vehicles per container against one Gazebo world
+    density_max_vehicles: int = 16
+    density_world: str = "empty"
+    density_spacing: int = 3  # Metres between spawned vehicles
+    # Replaces the built-in group script; gets PX4_VEHICLES, PX4_SIM_UDP_PORT, PX4_PORT_STRIDE,
+    # PX4_INSTANCE_BASE and GAZEBO_MASTER_URI from the environment
+    density_run_command: str = ""
+    # Vehicles run as PX4 instance (port block index + 1), which also binds 4560+i, 14580+i and
+    # 18570+i on the host: keep those ranges clear of MAV_PORT_START..MAV_PORT_END
     
     # System resources
     cpu_cores: int = 4
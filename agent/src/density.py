@@ -0,0 +1,62 @@
+from src.config import settings
+from src.ports import PortAllocator
+
+# Label on density group containers, set to the group id
+GROUP_LABEL = "px4.group"
+# Comma-separated instance ids of a group's vehicles, in PX4 instance order
+GROUP_INSTANCES_LABEL = "px4.instance_ids"
+# Gazebo's default master port; a group's gzserver listens PX4_INSTANCE_BASE above it
+GAZEBO_MASTER_PORT = 11345
+
+
+def px4_instance(ports: PortAllocator, mav_udp: int) -> int:
+    """PX4 instance number of the vehicle whose port block starts at mav_udp
+
+    PX4 derives its simulator TCP port (4560 + i), MAVLink offboard and GCS
+    ports (14580 + i, 18570 + i) and system id (1 + i) from -i, so the number
+    follows the vehicle's block to keep them unique across the node. Instance
+    0 is left to single-vehicle containers.
+    """
+    return ports.block_index(mav_udp) + 1
+
+
+def group_command(model: str, prebuilt: bool) -> str:
+    """Shell script running PX4_VEHICLES PX4 instances against one headless Gazebo world
+
+    Adapted from PX4's Tools/gazebo_sitl_multiple_run.sh: a single gzserver,
+    then per vehicle n a PX4 process with -i i, i = PX4_INSTANCE_BASE + n, in
+    its own working directory and a model spawned from the jinja template with
+    its MAVLink ports and system id. Vehicle n's simulator UDP port is
+    PX4_SIM_UDP_PORT + n * PX4_PORT_STRIDE, its port block on the agent.
+    """
+    if settings.density_run_command:
+        script = settings.density_run_command.format(model=model)
+    else:
+        script = f"""
+        build=$PWD/build/px4_sitl_default
+        source Tools/setup_gazebo.bash $PWD $build
+        gzserver Tools/sitl_gazebo/worlds/{settings.density_world}.world &
+        sleep 5
+        for n in $(seq 0 $((PX4_VEHICLES - 1))); do
+            i=$((PX4_INSTANCE_BASE + n))
+            mkdir -p $build/instance_$i
+            (cd $build/instance_$i && exec $build/bin/px4 -i $i -d $build/etc > out.log 2> err.log) &
+            python3 Tools/sitl_gazebo/scripts/jinja_gen.py \\
+                Tools/sitl_gazebo/models/{model}/{model}.sdf.jinja Tools/sitl_gazebo \\
+                --mavlink_tcp_port $((4560 + i)) \\
+                --mavlink_udp_port $((PX4_SIM_UDP_PORT + n * PX4_PORT_STRIDE)) \\
+                --mavlink_id $((1 + i)) --output-file /tmp/{model}_$i.sdf
+            gz model --spawn-file=/tmp/{model}_$i.sdf --model-name={model}_$i \\
+                -x 0.0 -y $(({settings.density_spacing} * n)) -z 0.0
+        done
+        wait
+        """
+    if not prebuilt:
+        script = f"{settings.sitl_build_command.format(model=model)} || exit 1\n{script}"
+    return script
+
+
+def stop_vehicle_command(model: str, px4_instance: int) -> str:
+    """Shell command stopping one vehicle of a running group"""
+    # The bracket keeps pkill from matching this command's own shell
+    return f"pkill -f 'px4 -[i] {px4_instance} -d'; gz model -m {model}_{px4_instance} -d"
@@ -1,66 +1,296 @@
+import asyncio
 import docker
+import threading
+import time
 import uuid
 import subprocess
 import psutil
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, List, Optional
 from src.config import settings
 from src.models import InstanceInfo
+from src.density import GAZEBO_MASTER_PORT, GROUP_LABEL, GROUP_INSTANCES_LABEL, group_command, px4_instance, stop_vehicle_command
+from src.ports import PortAllocator, PortInUse, container_ports
+from src.sitl_cache import SitlCache
+from src.warm_pool import WarmPool, POOL_LABEL, CLAIMED_PREFIX
+
+
+# Label on every container this agent starts; the others carry the instance's fields
+MANAGED_LABEL = "px4.agent.managed"
 
 
 class DockerManager:
+    """Runs PX4 containers through the Docker SDK
+
+    The SDK blocks, so the API calls these methods through run(), which uses
+    a bounded thread pool. Port and instance bookkeeping is guarded by a lock;
+    Docker calls themselves run outside it so starts and stops overlap.
+
+    Container state is kept current by a thread following the Docker events
+    stream for labelled containers, so listing instances needs no Docker calls.
+    Starts are served from the warm pool when it has a container for the model.
+    A density group runs several vehicles in one container, each tracked as
+    its own instance.
+    """
+
     def __init__(self):
-        self.client = docker.from_env()
-        self.used_ports = set()
+        self.client = docker.from_env(max_pool_size=settings.docker_workers)
+        self.executor = ThreadPoolExecutor(max_workers=settings.docker_workers, thread_name_prefix="docker")
+        self._lock = threading.RLock()
+        self.ports = PortAllocator(settings.mav_port_start, settings.mav_port_end,
+                                   settings.ports_per_instance, settings.port_host_check)
         self.running_instances: Dict[str, InstanceInfo] = {}
+        # Called with (event_type, instance_id, **fields) on lifecycle changes, from worker threads
+        self.on_event: Optional[Callable] = None
+        # Instances being stopped through the API, whose exit is reported as "stopped"
+        self._stopping = set()
+        self._oom_killed = set()
+        self._watching = False
+        self._events = None
+        self._watcher: Optional[threading.Thread] = None
+        # Container id -> instance id for claimed pool containers, whose labels name the pool entry
+        self._claimed: Dict[str, str] = {}
+        # Container id -> instance ids of the vehicles still running in a density group container
+        self._groups: Dict[str, List[str]] = {}
+        self.pool = WarmPool(self)
+        self.sitl_cache = SitlCache(self.client)
     
-    def get_available_port(self) -> int:
-        """Get an available MAVLink UDP port"""
-        for port in range(settings.mav_port_start, settings.mav_port_end + 1):
-            if port not in self.used_ports:
-                self.used_ports.add(port)
-                return port
-        raise Exception("No available ports")
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Run a blocking DockerManager method on the Docker thread pool"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(fn, *args, **kwargs))
+    
+    def shutdown(self):
+        self.stop_watching()
+        self.sitl_cache.shutdown()
+        self.executor.shutdown(wait=True)
+    
+    def start_watching(self):
+        """Follow the Docker events stream in a background thread"""
+        if self._watcher is None:
+            self._watching = True
+            self._watcher = threading.Thread(target=self._watch, name="docker-events", daemon=True)
+            self._watcher.start()
+    
+    def stop_watching(self):
+        self._watching = False
+        if self._events is not None:
+            self._events.close()
+    
+    def _watch(self):
+        delay = 0.0
+        while self._watching:
+            try:
+                self._events = self.client.events(
+                    decode=True, filters={"type": "container", "label": MANAGED_LABEL}
+                )
+                # Subscribed first, so nothing that happens during the resync is missed
+                self.resync()
+                delay = 0.0
+                for event in self._events:
+                    self._apply_event(event)
+            except Exception as e:
+                if not self._watching:
+                    break
+                print(f"Docker events stream failed: {e}")
+            if self._watching:
+                delay = min(30.0, max(1.0, delay * 2))
+                time.sleep(delay)
     
-    def release_port(self, port: int):
-        """Release a port back to the pool"""
-        self.used_ports.discard(port)
+    def _apply_event(self, event: dict):
+        action = event.get("Action") or event.get("status") or ""
+        actor = event.get("Actor", {})
+        attributes = actor.get("Attributes", {})
+        container_id = actor.get("ID") or event.get("id")
+        with self._lock:
+            if self.pool.container_event(container_id, action):
+                return
+            instance_ids = self._groups.get(container_id) or \
+                [self._claimed.get(container_id) or attributes.get("px4.instance_id")]
+            for instance_id in list(instance_ids):
+                self._apply_instance_event(instance_id, action, attributes)
+    
+    def _apply_instance_event(self, instance_id: str, action: str, attributes: dict):
+        with self._lock:
+            instance_info = self.running_instances.get(instance_id)
+            if instance_info is None:
+                return
+            if action == "start":
+                instance_info.status = "running"
+            elif action == "oom":
+                self._oom_killed.add(instance_id)
+            elif action == "die":
+                instance_info.status = "stopped"
+                oom_killed = instance_id in self._oom_killed
+                self._oom_killed.discard(instance_id)
+                if instance_id not in self._stopping:
+                    exit_code = attributes.get("exitCode")
+                    self._emit(
+                        "oom_killed" if oom_killed else "exited", instance_id,
+                        container_id=instance_info.container_id,
+                        exit_code=int(exit_code) if exit_code is not None else None
+                    )
+            elif action == "destroy" and instance_id not in self._stopping:
+                # Auto-removed after exiting; stop_instance cleans up its own
+                self._untrack(instance_id)
+    
+    def resync(self):
+        """Rebuild container state with one label-filtered list call"""
+        containers = self.client.containers.list(all=True, filters={"label": MANAGED_LABEL})
+        found = {}
+        pooled = []
+        for container in containers:
+            instance_ids = self._instance_ids_for(container)
+            for instance_id in instance_ids:
+                found[instance_id] = container
+            if not instance_ids and container.labels.get(POOL_LABEL):
+                pooled.append(container)
+        with self._lock:
+            for instance_id, instance_info in list(self.running_instances.items()):
+                container = found.get(instance_id)
+                running = container is not None and container.status == "running"
+                if instance_info.status == "running" and not running and instance_id not in self._stopping:
+                    self._emit("exited", instance_id, container_id=instance_info.container_id)
+                if container is None and instance_id not in self._stopping:
+                    self._untrack(instance_id)
+                else:
+                    instance_info.status = "running" if running else "stopped"
+            # Containers started before this agent (re)started
+            for instance_id, container in found.items():
+                if container.labels.get(GROUP_LABEL):
+                    continue
+                if instance_id not in self.running_instances and container.status == "running":
+                    labels = container.labels
+                    ports = container_ports(labels)
+                    mav_port = ports[0]
+                    if labels.get(POOL_LABEL):
+                        self._claimed[container.id] = instance_id
+                    try:
+                        # Already bound by the container itself, so skip the host check
+                        self.ports.reserve(mav_port, instance_id, count=len(ports), check_host=False)
+                    except Exception as e:
+                        print(f"Adopting {instance_id}: {e}")
+                    self.running_instances[instance_id] = InstanceInfo(
+                        instance_id=instance_id,
+                        container_id=container.id,
+                        name=labels.get("px4.name", instance_id[:8]),
+                        model=labels.get("px4.model", "iris"),
+                        vehicle_type=labels.get("px4.vehicle_type", "copter"),
+                        mav_udp=mav_port,
+                        ports=ports,
+                        status="running"
+                    )
+            self.pool.resync(pooled)
+        for container in {c.id: c for c in found.values() if c.labels.get(GROUP_LABEL)}.values():
+            if container.status == "running" and container.id not in self._groups:
+                self._adopt_group(container)
+    
+    def _adopt_group(self, container):
+        """Track the vehicles still running in a density group container"""
+        labels = container.labels
+        instance_ids = self._instance_ids_for(container)
+        ports = container_ports(labels)
+        stride = max(1, len(ports) // len(instance_ids))
+        # Vehicles stopped one by one are still in the label, so ask which PX4 processes are left
+        try:
+            processes = [" ".join(process) for process in container.top()["Processes"]]
+        except Exception as e:
+            print(f"Listing processes of group {labels[GROUP_LABEL][:8]}: {e}")
+            processes = None
+        vehicles = []
+        for n, instance_id in enumerate(instance_ids):
+            block = ports[n * stride:(n + 1) * stride]
+            number = px4_instance(self.ports, block[0])
+            if processes is not None and not any(f"px4 -i {number} -d" in process for process in processes):
+                continue
+            try:
+                self.ports.reserve(block[0], instance_id, count=len(block), check_host=False)
+            except Exception as e:
+                print(f"Adopting {instance_id}: {e}")
+            vehicles.append(InstanceInfo(
+                instance_id=instance_id,
+                container_id=container.id,
+                name=f"{labels.get('px4.name', labels[GROUP_LABEL][:8])}_{n}",
+                model=labels.get("px4.model", "iris"),
+                vehicle_type=labels.get("px4.vehicle_type", "copter"),
+                mav_udp=block[0],
+                ports=block,
+                status="running",
+                group_id=labels[GROUP_LABEL],
+                px4_instance=number
+            ))
+        with self._lock:
+            if vehicles and container.id not in self._groups:
+                self._groups[container.id] = [vehicle.instance_id for vehicle in vehicles]
+                for vehicle in vehicles:
+                    self.running_instances[vehicle.instance_id] = vehicle
+            else:
+                for vehicle in vehicles:
+                    self.release_port(vehicle.mav_udp, vehicle.instance_id)
+    
+    @staticmethod
+    def _instance_ids_for(container) -> List[str]:
+        """Instances a managed container runs; none for an unclaimed pool container"""
+        labels = container.labels
+        if labels.get(GROUP_LABEL):
+            return [instance_id for instance_id in labels.get(GROUP_INSTANCES_LABEL, "").split(",") if instance_id]
+        if labels.get(POOL_LABEL):
+            name = container.name or ""
+            return [name[len(CLAIMED_PREFIX):]] if name.startswith(CLAIMED_PREFIX) else []
+        return [labels["px4.instance_id"]] if labels.get("px4.instance_id") else []
+    
+    def _untrack(self, instance_id: str) -> Optional[InstanceInfo]:
+        """Forget an instance and release its ports"""
+        with self._lock:
+            instance_info = self.running_instances.pop(instance_id, None)
+            if instance_info:
+                self._claimed.pop(instance_info.container_id, None)
+                group = self._groups.get(instance_info.container_id)
+                if group is not None:
+                    if instance_id in group:
+                        group.remove(instance_id)
+                    if not group:
+                        del self._groups[instance_info.container_id]
+                self.release_port(instance_info.mav_udp, instance_id)
+        return instance_info
+    
+    def _emit(self, type_: str, instance_id: str, **fields):
+        if self.on_event and instance_id:
+            self.on_event(type_, instance_id, **fields)
+    
+    def release_port(self, port: int, instance_id: str):
+        """Release an instance's ports back to the pool"""
+        self.ports.free(port, instance_id)
     
     def start_px4_instance(self, request) -> InstanceInfo:
         """Start a new PX4 SITL instance in Docker"""
-        # Get available port
-        mav_port = request.mav_udp or self.get_available_port()
+        # A retried start of an instance that is already up returns it as is
+        if request.instance_id:
+            with self._lock:
+                existing = self.running_instances.get(request.instance_id)
+            if existing:
+                return existing
         
         # Generate unique identifiers
-        instance_id = str(uuid.uuid4())
-        container_name = f"px4_{request.name}_{instance_id[:8]}"
+        instance_id = request.instance_id or str(uuid.uuid4())
+        
+        # A pre-booted container from the warm pool is ready straight away
+        instance_info = self._claim_pooled(request, instance_id)
+        if instance_info:
+            return instance_info
         
-        # Build PX4 command
-        px4_cmd = [
-            "bash", "-lc",
-            f"""
-            HEADLESS=1 PX4_INSTANCE=0 make px4_sitl gazebo_{request.model} PX4_SIM_UDP_PORT={mav_port}
-            """
-        ]
+        ports = self._reserve_ports(request, instance_id)
+        mav_port = ports[0]
+        container_name = f"px4_{request.name}_{instance_id[:8]}"
         
+        container = None
         try:
-            # Create and run container
-            container = self.client.containers.run(
-                settings.px4_image,
-                command=px4_cmd,
-                name=container_name,
-                detach=True,
-                remove=True,
-                ports={f"{mav_port}/udp": mav_port},
-                environment={
-                    "PX4_SIM_UDP_PORT": str(mav_port),
-                    "HEADLESS": "1",
-                    "PX4_INSTANCE": "0"
-                },
-                volumes={
-                    "/tmp/.X11-unix": {"bind": "/tmp/.X11-unix", "mode": "ro"}
-                },
-                network_mode="host"  # Use host networking for simplicity
-            )
+            # Create the container first so its state is tracked before it can exit
+            container = self.create_container(container_name, request.model, ports, {
+                "px4.instance_id": instance_id,
+                "px4.name": request.name,
+                "px4.vehicle_type": request.vehicle_type
+            })
             
             # Create instance info
             instance_info = InstanceInfo(
@@ -70,45 +300,243 @@ class DockerManager:
                 model=request.model,
                 vehicle_type=request.vehicle_type,
                 mav_udp=mav_port,
+                ports=ports,
                 status="running"
             )
             
             # Store instance info
-            self.running_instances[instance_id] = instance_info
+            with self._lock:
+                self.running_instances[instance_id] = instance_info
+            container.start()
+            self._emit("started", instance_id, container_id=container.id, mav_udp=mav_port)
             
             return instance_info
             
         except Exception as e:
             # Release port if container creation failed
-            self.release_port(mav_port)
+            with self._lock:
+                self.running_instances.pop(instance_id, None)
+            self.release_port(mav_port, instance_id)
+            if container is not None:
+                try:
+                    container.remove(force=True)
+                except Exception:
+                    pass
             raise Exception(f"Failed to start PX4 container: {str(e)}")
     
-    def stop_instance(self, request) -> Dict[str, str]:
-        """Stop a PX4 instance"""
-        container_id = None
-        instance_id = None
+    def create_container(self, name: str, model: str, ports: List[int], labels: Dict[str, str],
+                         vehicles: Optional[int] = None):
+        """Create (but don't start) a PX4 SITL container for model on ports
+
+        With vehicles, the container runs a density group whose ports are
+        split evenly between that many vehicles.
+        """
+        mav_port = ports[0]
+        environment = {}
         
-        if request.container_id:
-            container_id = request.container_id
-        elif request.instance_id:
-            instance_info = self.running_instances.get(request.instance_id)
-            if instance_info:
-                container_id = instance_info.container_id
-                instance_id = request.instance_id
+        # Build PX4 command; an image from the SITL cache has the build already
+        image, prebuilt = self.sitl_cache.image_for(model)
+        if vehicles:
+            px4_cmd = ["bash", "-lc", group_command(model, prebuilt)]
+            base = px4_instance(self.ports, mav_port)
+            environment = {
+                "PX4_VEHICLES": str(vehicles),
+                "PX4_PORT_STRIDE": str(len(ports) // vehicles),
+                "PX4_INSTANCE": str(base),
+                "PX4_INSTANCE_BASE": str(base),
+                # Its own gzserver master, which `docker exec` (stopping a vehicle) inherits too
+                "GAZEBO_MASTER_URI": f"http://localhost:{GAZEBO_MASTER_PORT + base}"
+            }
+        elif prebuilt:
+            px4_cmd = ["bash", "-lc", settings.sitl_run_command.format(model=model)]
+        else:
+            px4_cmd = [
+                "bash", "-lc",
+                f"""
+                HEADLESS=1 PX4_INSTANCE=0 make px4_sitl gazebo_{model} PX4_SIM_UDP_PORT={mav_port}
+                """
+            ]
         
-        if not container_id:
-            raise Exception("Container ID or Instance ID required")
+        return self.client.containers.create(
+            image,
+            command=px4_cmd,
+            name=name,
+            auto_remove=True,
+            labels={
+                MANAGED_LABEL: "true",
+                "px4.model": model,
+                "px4.mav_udp": str(mav_port),
+                "px4.ports": ",".join(map(str, ports)),
+                **labels
+            },
+            ports={f"{port}/udp": port for port in ports},
+            environment={
+                "PX4_SIM_UDP_PORT": str(mav_port),
+                "PX4_PORTS": ",".join(map(str, ports)),
+                "HEADLESS": "1",
+                "PX4_INSTANCE": "0",
+                **environment
+            },
+            volumes={
+                "/tmp/.X11-unix": {"bind": "/tmp/.X11-unix", "mode": "ro"}
+            },
+            network_mode="host"  # Use host networking for simplicity
+        )
+    
+    def start_group(self, request) -> List[InstanceInfo]:
+        """Start a density group: count vehicles in one container sharing a Gazebo world"""
+        instance_ids = request.instance_ids or [str(uuid.uuid4()) for _ in range(request.count)]
+        # A retried start of a group that is already up returns it as is
+        with self._lock:
+            existing = [self.running_instances.get(instance_id) for instance_id in instance_ids]
+        if all(existing):
+            return existing
+        if any(existing):
+            raise Exception("Some of the group's instances are already running")
         
+        group_id = request.group_id or str(uuid.uuid4())
+        # Vehicle n's ports are derived from the first, so the blocks must be consecutive
+        while True:
+            try:
+                blocks = self.ports.allocate_run(instance_ids)
+                break
+            except PortInUse:
+                if not self.pool.evict():
+                    raise
+        
+        container = None
+        try:
+            container = self.create_container(
+                f"px4_{request.name}_group_{group_id[:8]}", request.model,
+                [port for block in blocks for port in block], {
+                    GROUP_LABEL: group_id,
+                    GROUP_INSTANCES_LABEL: ",".join(instance_ids),
+                    "px4.name": request.name,
+                    "px4.vehicle_type": request.vehicle_type
+                }, vehicles=len(instance_ids)
+            )
+            vehicles = [
+                InstanceInfo(
+                    instance_id=instance_id,
+                    container_id=container.id,
+                    name=f"{request.name}_{n}",
+                    model=request.model,
+                    vehicle_type=request.vehicle_type,
+                    mav_udp=block[0],
+                    ports=block,
+                    status="running",
+                    group_id=group_id,
+                    px4_instance=px4_instance(self.ports, block[0])
+                )
+                for n, (instance_id, block) in enumerate(zip(instance_ids, blocks))
+            ]
+            with self._lock:
+                self._groups[container.id] = list(instance_ids)
+                for vehicle in vehicles:
+                    self.running_instances[vehicle.instance_id] = vehicle
+            container.start()
+            for vehicle in vehicles:
+                self._emit("started", vehicle.instance_id, container_id=container.id, mav_udp=vehicle.mav_udp)
+            
+            return vehicles
+            
+        except Exception as e:
+            with self._lock:
+                if container is not None:
+                    self._groups.pop(container.id, None)
+                for instance_id in instance_ids:
+                    self.running_instances.pop(instance_id, None)
+            for instance_id, block in zip(instance_ids, blocks):
+                self.release_port(block[0], instance_id)
+            if container is not None:
+                try:
+                    container.remove(force=True)
+                except Exception:
+                    pass
+            raise Exception(f"Failed to start PX4 group: {str(e)}")
+    
+    def _claim_pooled(self, request, instance_id: str) -> Optional[InstanceInfo]:
+        """Hand an idle warm pool container to the instance, or None on a miss"""
+        with self._lock:
+            pooled = self.pool.take(request.model, request.mav_udp)
+            if pooled is None:
+                return None
+            self.ports.transfer(pooled.ports[0], pooled.pool_id, instance_id)
+            instance_info = InstanceInfo(
+                instance_id=instance_id,
+                container_id=pooled.container.id,
+                name=request.name,
+                model=request.model,
+                vehicle_type=request.vehicle_type,
+                mav_udp=pooled.ports[0],
+                ports=pooled.ports,
+                status="running"
+            )
+            # Tracked before the rename, so an exit in between is reported for the instance
+            self._claimed[pooled.container.id] = instance_id
+            self.running_instances[instance_id] = instance_info
+        try:
+            pooled.container.rename(CLAIMED_PREFIX + instance_id)
+        except Exception as e:
+            # Without the name a restarted agent couldn't tell whose it is; start cold instead
+            print(f"Claiming pool container {pooled.container.id[:12]} failed: {e}")
+            self._untrack(instance_id)
+            try:
+                pooled.container.remove(force=True)
+            except Exception:
+                pass
+            return None
+        self._emit("started", instance_id, container_id=pooled.container.id, mav_udp=pooled.ports[0])
+        return instance_info
+    
+    def _reserve_ports(self, request, instance_id: str) -> List[int]:
+        """Reserve the requested port, or the next free block, evicting an idle pool container if needed"""
+        for attempt in range(2):
+            try:
+                if request.mav_udp:
+                    return self.ports.reserve(request.mav_udp, instance_id)
+                return self.ports.allocate(instance_id)
+            except PortInUse:
+                if attempt or not self.pool.evict(request.mav_udp):
+                    raise
+    
+    def stop_instance(self, request) -> Dict[str, str]:
+        """Stop a PX4 instance"""
+        instance_id = request.instance_id
+        with self._lock:
+            # The tracked instance says which container it runs in, whatever the caller sent
+            instance_info = self.running_instances.get(instance_id) if instance_id else None
+            container_id = instance_info.container_id if instance_info else request.container_id
+            if not container_id:
+                raise Exception("Container ID or Instance ID required")
+            
+            # A vehicle sharing its group container with others is stopped on its own
+            group = self._groups.get(container_id)
+            vehicle = None
+            if instance_info and group and instance_id in group and len(group) > 1:
+                group.remove(instance_id)
+                vehicle = instance_info
+                stopping = [instance_id]
+            else:
+                # Everything the container runs goes down with it
+                stopping = [i for i, info in self.running_instances.items() if info.container_id == container_id]
+            self._stopping.update(stopping)
         try:
+            if vehicle is not None:
+                return self._stop_vehicle(vehicle)
+            
             # Stop and remove container
-            container = self.client.containers.get(container_id)
-            container.stop(timeout=10)
+            try:
+                container = self.client.containers.get(container_id)
+                container.stop(timeout=10)
+            except docker.errors.NotFound:
+                # Already exited and auto-removed
+                pass
             
-            # Release port
-            if instance_id and instance_id in self.running_instances:
-                instance_info = self.running_instances[instance_id]
-                self.release_port(instance_info.mav_udp)
-                del self.running_instances[instance_id]
+            # Release ports
+            for stopped_id in stopping:
+                self._untrack(stopped_id)
+                self._emit("stopped", stopped_id, container_id=container_id)
             
             return {
                 "status": "stopped",
@@ -118,18 +546,32 @@ class DockerManager:
             
         except Exception as e:
             raise Exception(f"Failed to stop container: {str(e)}")
+        finally:
+            with self._lock:
+                self._stopping.difference_update(stopping)
+    
+    def _stop_vehicle(self, vehicle: InstanceInfo) -> Dict[str, str]:
+        try:
+            container = self.client.containers.get(vehicle.container_id)
+            result = container.exec_run(["bash", "-lc", stop_vehicle_command(vehicle.model, vehicle.px4_instance)])
+            if result.exit_code:
+                print(f"Stopping vehicle {vehicle.px4_instance} of group {vehicle.group_id[:8]}: "
+                      f"{result.output.decode(errors='replace')}")
+        except docker.errors.APIError:
+            # The group container went away, taking the vehicle with it
+            pass
+        self._untrack(vehicle.instance_id)
+        self._emit("stopped", vehicle.instance_id, container_id=vehicle.container_id)
+        return {
+            "status": "stopped",
+            "container_id": vehicle.container_id,
+            "instance_id": vehicle.instance_id
+        }
     
     def list_instances(self) -> List[InstanceInfo]:
-        """List all running instances"""
-        # Update instance statuses
-        for instance_info in self.running_instances.values():
-            try:
-                container = self.client.containers.get(instance_info.container_id)
-                instance_info.status = "running" if container.status == "running" else "stopped"
-            except:
-                instance_info.status = "stopped"
-        
-        return list(self.running_instances.values())
+        """List all tracked instances, as last reported by the Docker events stream"""
+        with self._lock:
+            return list(self.running_instances.values())
     
     def get_system_resources(self) -> Dict[str, int]:
         """Get system resource information"""
@@ -139,10 +581,14 @@ class DockerManager:
             "disk_gb": int(psutil.disk_usage('/').total / (1024**3))
         }
     
+    def get_load(self) -> Dict[str, float]:
+        """Current host load for controller heartbeats"""
+        return {
+            "running_instances": len(self.running_instances),
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "memory_percent": psutil.virtual_memory().percent
+        }
+    
     def get_available_ports(self) -> List[int]:
-        """Get list of available ports"""
-        available = []
-        for port in range(settings.mav_port_start, settings.mav_port_end + 1):
-            if port not in self.used_ports:
-                available.append(port)
-        return available
+        """Get the MAVLink port of every free port block"""
+        return self.ports.available()
@@ -0,0 +1,122 @@
+import asyncio
+import gzip
+import json
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+from src.config import settings
+
+
+class EventPusher:
+    """Buffers instance lifecycle events and pushes them to the controller in batches
+
+    Events wait in a bounded buffer until the next push (every
+    event_push_interval, or as soon as a full batch is waiting). A batch is
+    only removed once the controller accepts it; while the controller is down
+    pushes are retried with jittered exponential backoff. When the buffer is
+    full the oldest events are dropped and the count is reported with the next
+    batch, so the controller knows to rely on reconciliation for this node.
+    """
+
+    def __init__(self, load_sampler: Optional[Callable[[], Dict[str, Any]]] = None,
+                 on_unknown_node: Optional[Callable] = None):
+        self.events: List[Dict[str, Any]] = []
+        self.seq = 0
+        self.dropped = 0
+        self.pushed = 0
+        self.failures = 0
+        self.load_sampler = load_sampler
+        # Awaited when the controller doesn't know this node (e.g. re-register)
+        self.on_unknown_node = on_unknown_node
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def emit(self, type_: str, instance_id: str, **fields):
+        """Queue an event (started, stopped, exited, oom_killed)"""
+        self.seq += 1
+        self.events.append({"seq": self.seq, "type": type_, "instance_id": instance_id,
+                            "time": time.time(), **fields})
+        overflow = len(self.events) - settings.event_buffer_size
+        if overflow > 0:
+            del self.events[:overflow]
+            self.dropped += overflow
+        if len(self.events) >= settings.event_batch_size:
+            self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def events_url(self) -> str:
+        base = settings.controller_url.rsplit("/register", 1)[0]
+        return f"{base}/nodes/{settings.node_id}/events"
+
+    def _payload(self, batch: List[Dict[str, Any]]) -> bytes:
+        payload = {"api_key": settings.agent_api_key, "events": batch, "dropped": self.dropped}
+        if self.load_sampler:
+            payload["load"] = self.load_sampler()
+        return gzip.compress(json.dumps(payload).encode(), compresslevel=1)
+
+    async def push(self, client: httpx.AsyncClient) -> int:
+        """Send one batch; raises if the controller didn't take it"""
+        batch = self.events[:settings.event_batch_size]
+        dropped = self.dropped
+        response = await client.post(
+            self.events_url(),
+            content=self._payload(batch),
+            headers={"Content-Type": "application/json", "Content-Encoding": "gzip"}
+        )
+        if response.status_code == 404 and self.on_unknown_node:
+            await self.on_unknown_node()
+        response.raise_for_status()
+        # Events queued (or dropped) while the request was in flight are matched by seq
+        if batch:
+            last = batch[-1]["seq"]
+            self.events = [event for event in self.events if event["seq"] > last]
+        self.dropped -= dropped
+        self.pushed += len(batch)
+        return len(batch)
+
+    async def _run(self):
+        delay = 0.0
+        attempt = 0
+        async with httpx.AsyncClient(verify=False, timeout=10) as client:
+            while True:
+                if delay:
+                    await asyncio.sleep(delay)
+                else:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=settings.event_push_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                self._wakeup.clear()
+                try:
+                    await self.push(client)
+                    delay = 0.0
+                    attempt = 0
+                    if len(self.events) >= settings.event_batch_size:
+                        self._wakeup.set()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.failures += 1
+                    attempt += 1
+                    # Exponential backoff with full jitter, capped at event_retry_max
+                    delay = random.uniform(0.5, min(settings.event_retry_max, 2 ** attempt))
+                    print(f"Event push failed ({len(self.events)} buffered, retry in {delay:.1f}s): {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {"buffered": len(self.events), "dropped": self.dropped,
+                "pushed": self.pushed, "failures": self.failures}
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 
 class StartRequest(BaseModel):
@@ -7,6 +7,16 @@ class StartRequest(BaseModel):
     model: str = "iris"
     vehicle_type: str = "copter"
     mav_udp: Optional[int] = None
+    instance_id: Optional[str] = None  # assigned by the controller so retries map to one record
+
+
+class GroupStartRequest(BaseModel):
+    name: str
+    model: str = "iris"
+    vehicle_type: str = "copter"
+    count: int
+    group_id: Optional[str] = None
+    instance_ids: Optional[List[str]] = None  # one per vehicle, assigned by the controller
 
 
 class StopRequest(BaseModel):
@@ -21,7 +31,10 @@ class InstanceInfo(BaseModel):
     model: str
     vehicle_type: str
     mav_udp: int
+    ports: List[int] = []  # All ports reserved for the instance, starting with mav_udp
     status: str
+    group_id: Optional[str] = None  # Set for vehicles sharing a density group container
+    px4_instance: int = 0  # PX4 -i number, unique on the node (0 outside density groups)
 
 
 class NodeStatus(BaseModel):
@@ -33,3 +46,7 @@ class NodeStatus(BaseModel):
     total_memory_gb: int
     total_disk_gb: int
     available_ports: list[int]
+    events: Optional[Dict[str, int]] = None  # Event push buffer: buffered, dropped, pushed, failures
+    ports: Optional[Dict[str, int]] = None  # Port blocks: blocks, block_size, used, free
+    warm_pool: Optional[Dict[str, Any]] = None  # Idle containers per model, targets, hits, misses
+    sitl_cache: Optional[Dict[str, Any]] = None  # Cached SITL builds: entries, size_gb, hits, misses, ...
@@ -0,0 +1,171 @@
+import socket
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Set
+
+
+class PortInUse(Exception):
+    pass
+
+
+def host_port_free(port: int) -> bool:
+    """True if nothing on the host is bound to this UDP port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        try:
+            s.bind(("0.0.0.0", port))
+        except OSError:
+            return False
+    return True
+
+
+def container_ports(labels: Dict[str, str]) -> List[int]:
+    """Ports recorded in a container's px4.ports (or px4.mav_udp) label"""
+    ports = [int(port) for port in labels.get("px4.ports", "").split(",") if port]
+    return ports or [int(labels.get("px4.mav_udp", 0))]
+
+
+class PortAllocator:
+    """Hands out blocks of consecutive ports from [start, end]
+
+    The range is cut into blocks of block_size ports; an instance gets one
+    block, and its first port is the instance's MAVLink UDP port. Free blocks
+    wait in a FIFO queue, so allocate and free are O(1) whatever the range
+    size, and a freed block is the last to be handed out again. Ports chosen
+    by the caller are reserved along with every block they overlap.
+    """
+
+    def __init__(self, start: int, end: int, block_size: int = 1, host_check: bool = True):
+        self.start = start
+        self.block_size = max(1, block_size)
+        self.blocks = max(0, (end - start + 1) // self.block_size)
+        self.host_check = host_check
+        self._lock = threading.Lock()
+        self._free = deque(self._block_base(i) for i in range(self.blocks))
+        # Blocks currently in _free; a reserved block stays queued and is skipped
+        self._queued: Set[int] = set(self._free)
+        self._taken: Set[int] = set()
+        # Reserved ports outside the range, which no block covers
+        self._outside: Set[int] = set()
+        # First port of each reservation -> (owner, ports, blocks it covers)
+        self._reservations: Dict[int, tuple] = {}
+
+    def _block_base(self, index: int) -> int:
+        return self.start + index * self.block_size
+
+    def block_index(self, port: int) -> int:
+        """Index of the block port falls in, counting from the start of the range"""
+        return (port - self.start) // self.block_size
+
+    def _in_range(self, port: int) -> bool:
+        return self.start <= port < self._block_base(self.blocks)
+
+    def _blocks_for(self, port: int, count: int) -> List[int]:
+        """In-range blocks overlapping ports [port, port + count)"""
+        first = max(port, self.start)
+        last = min(port + count - 1, self._block_base(self.blocks) - 1)
+        if first > last:
+            return []
+        return [self._block_base(i) for i in range((first - self.start) // self.block_size,
+                                                    (last - self.start) // self.block_size + 1)]
+
+    def _requeue(self, block: int):
+        if block not in self._queued:
+            self._queued.add(block)
+            self._free.append(block)
+
+    def _ports_free(self, ports: List[int]) -> bool:
+        return not self.host_check or all(host_port_free(port) for port in ports)
+
+    def allocate(self, owner: str) -> List[int]:
+        """Reserve the next free block that is also free on the host"""
+        with self._lock:
+            for _ in range(len(self._free)):
+                block = self._free.popleft()
+                self._queued.discard(block)
+                if block in self._taken:
+                    continue
+                ports = list(range(block, block + self.block_size))
+                if not self._ports_free(ports):
+                    # Bound by something outside the agent; try it again later
+                    self._requeue(block)
+                    continue
+                self._taken.add(block)
+                self._reservations[block] = (owner, ports, [block])
+                return ports
+        raise PortInUse("No available ports")
+
+    def allocate_run(self, owners: List[str]) -> List[List[int]]:
+        """Reserve consecutive free blocks, one per owner, so ports follow from the first
+
+        Density groups need this to derive each vehicle's ports from its index.
+        It scans the range, so unlike allocate() it is O(blocks).
+        """
+        count = len(owners)
+        with self._lock:
+            run = 0
+            for index in range(self.blocks):
+                block = self._block_base(index)
+                if block in self._taken or not self._ports_free(list(range(block, block + self.block_size))):
+                    run = 0
+                    continue
+                run += 1
+                if run == count:
+                    first = index - count + 1
+                    blocks = []
+                    for owner, base in zip(owners, map(self._block_base, range(first, index + 1))):
+                        ports = list(range(base, base + self.block_size))
+                        self._taken.add(base)
+                        self._reservations[base] = (owner, ports, [base])
+                        blocks.append(ports)
+                    return blocks
+        raise PortInUse(f"No run of {count} free port blocks")
+
+    def reserve(self, port: int, owner: str, count: Optional[int] = None, check_host: bool = True) -> List[int]:
+        """Reserve ports the caller chose, starting at port"""
+        ports = list(range(port, port + (count or self.block_size)))
+        with self._lock:
+            existing = self._reservations.get(port)
+            if existing is not None:
+                if existing[0] == owner:
+                    return existing[1]
+                raise PortInUse(f"Port {port} is already in use")
+            blocks = self._blocks_for(port, len(ports))
+            outside = [p for p in ports if not self._in_range(p)]
+            if any(block in self._taken for block in blocks) or any(p in self._outside for p in outside):
+                raise PortInUse(f"Port {port} is already in use")
+            if check_host and not self._ports_free(ports):
+                raise PortInUse(f"Port {port} is already bound on this host")
+            self._taken.update(blocks)
+            self._outside.update(outside)
+            self._reservations[port] = (owner, ports, blocks)
+            return ports
+
+    def free(self, port: int, owner: Optional[str] = None):
+        """Release the reservation starting at port, if owner (when given) holds it"""
+        with self._lock:
+            reservation = self._reservations.get(port)
+            if reservation is None or (owner is not None and reservation[0] != owner):
+                return
+            del self._reservations[port]
+            for block in reservation[2]:
+                self._taken.discard(block)
+                self._requeue(block)
+            self._outside.difference_update(reservation[1])
+
+    def transfer(self, port: int, owner: str, new_owner: str):
+        """Hand the reservation starting at port from owner to new_owner"""
+        with self._lock:
+            reservation = self._reservations.get(port)
+            if reservation is None or reservation[0] != owner:
+                raise PortInUse(f"Port {port} is not reserved by {owner}")
+            self._reservations[port] = (new_owner,) + reservation[1:]
+
+    def available(self) -> List[int]:
+        """First port of every free block, in the order they will be handed out"""
+        with self._lock:
+            return [block for block in self._free if block not in self._taken]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            used = len(self._taken)
+        return {"blocks": self.blocks, "block_size": self.block_size, "used": used, "free": self.blocks - used}
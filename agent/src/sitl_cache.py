@@ -0,0 +1,163 @@
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Set, Tuple
+
+from src.config import settings
+
+# Label on cached images, set to their cache key
+CACHE_KEY_LABEL = "px4.sitl.key"
+# Label on the containers that build them
+BUILD_LABEL = "px4.sitl.build"
+CACHE_REPOSITORY = "px4-sitl-cache"
+
+
+class CachedImage:
+    __slots__ = ("key", "model", "tag", "size", "last_used")
+
+    def __init__(self, key: str, model: str, tag: str, size: int, last_used: float = 0.0):
+        self.key = key
+        self.model = model
+        self.tag = tag
+        self.size = size
+        self.last_used = last_used
+
+
+class SitlCache:
+    """Derived images with PX4 SITL already built, one per (base image, PX4 version, model)
+
+    The key hashes the base image's content id with PX4_VERSION, the model
+    and the build command, so a new base image or build command gets new
+    entries. A start for a model with no entry still compiles in its own
+    container from the base image, while a single builder thread bakes the
+    build into an image for later starts. Once the entries take more than
+    sitl_cache_max_gb, the least recently used are removed.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.entries: Dict[str, CachedImage] = {}
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.build_failures = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._building: Set[str] = set()
+        self._base_size = 0
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sitl-build")
+
+    def key(self, model: str) -> str:
+        base = self.client.images.get(settings.px4_image)
+        self._base_size = base.attrs.get("Size", 0)
+        material = "\0".join((base.id, settings.px4_version, model, settings.sitl_build_command))
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def load(self):
+        """Index cached images left by earlier runs and remove interrupted builds (blocking)"""
+        for container in self.client.containers.list(all=True, filters={"label": BUILD_LABEL}):
+            try:
+                container.remove(force=True)
+            except Exception:
+                pass
+        try:
+            self._base_size = self.client.images.get(settings.px4_image).attrs.get("Size", 0)
+        except Exception:
+            pass
+        images = self.client.images.list(filters={"label": CACHE_KEY_LABEL})
+        with self._lock:
+            for image in images:
+                labels = image.labels
+                key = labels[CACHE_KEY_LABEL]
+                tag = f"{CACHE_REPOSITORY}:{key[:16]}"
+                size = max(0, image.attrs.get("Size", 0) - self._base_size)
+                self.entries.setdefault(key, CachedImage(key, labels.get("px4.sitl.model", ""), tag, size))
+
+    def image_for(self, model: str) -> Tuple[str, bool]:
+        """Image to launch model from, and whether its build is already in it"""
+        if not settings.sitl_cache_enabled:
+            return settings.px4_image, False
+        try:
+            key = self.key(model)
+        except Exception as e:
+            print(f"SITL cache key for {model} failed: {e}")
+            return settings.px4_image, False
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry:
+                entry.last_used = time.time()
+                self.hits += 1
+                return entry.tag, True
+            self.misses += 1
+            if key not in self._building:
+                self._building.add(key)
+                self.executor.submit(self._build, key, model)
+        return settings.px4_image, False
+
+    def _build(self, key: str, model: str):
+        container = None
+        try:
+            container = self.client.containers.create(
+                settings.px4_image,
+                command=["bash", "-lc", settings.sitl_build_command.format(model=model)],
+                name=f"px4_sitl_build_{key[:12]}",
+                labels={BUILD_LABEL: key}
+            )
+            container.start()
+            status = container.wait(timeout=settings.sitl_build_timeout).get("StatusCode")
+            if status:
+                raise Exception(f"build exited with status {status}")
+            tag = key[:16]
+            image = container.commit(repository=CACHE_REPOSITORY, tag=tag, conf={"Labels": {
+                CACHE_KEY_LABEL: key, "px4.sitl.model": model, "px4.sitl.version": settings.px4_version
+            }})
+            size = max(0, image.attrs.get("Size", 0) - self._base_size)
+            with self._lock:
+                self.entries[key] = CachedImage(key, model, f"{CACHE_REPOSITORY}:{tag}", size, time.time())
+                self.builds += 1
+            print(f"Cached SITL build for {model} ({size / 1024 ** 3:.1f} GB)")
+            self.evict()
+        except Exception as e:
+            self.build_failures += 1
+            print(f"SITL build for {model} failed: {e}")
+        finally:
+            with self._lock:
+                self._building.discard(key)
+            if container is not None:
+                try:
+                    container.remove(force=True)
+                except Exception:
+                    pass
+
+    def evict(self):
+        """Remove least recently used images until the cache fits in sitl_cache_max_gb"""
+        limit = settings.sitl_cache_max_gb * 1024 ** 3
+        with self._lock:
+            total = sum(entry.size for entry in self.entries.values())
+            # The newest entry always stays, however large it is
+            victims = sorted(self.entries.values(), key=lambda entry: entry.last_used)[:-1]
+        for entry in victims:
+            if total <= limit:
+                break
+            try:
+                self.client.images.remove(entry.tag)
+            except Exception as e:
+                # Still used by a container
+                print(f"Evicting {entry.tag} failed: {e}")
+                continue
+            with self._lock:
+                self.entries.pop(entry.key, None)
+                self.evictions += 1
+            total -= entry.size
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = sum(entry.size for entry in self.entries.values())
+            return {"entries": len(self.entries), "size_gb": round(size / 1024 ** 3, 2),
+                    "building": len(self._building), "hits": self.hits, "misses": self.misses,
+                    "builds": self.builds, "build_failures": self.build_failures,
+                    "evictions": self.evictions}
@@ -0,0 +1,285 @@
+import asyncio
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from src.config import settings
+from src.ports import container_ports
+
+# Label marking a warm pool container; its value is the container's model
+POOL_LABEL = "px4.pool"
+# Labels can't change after creation, so a claimed pool container is renamed to this plus its instance id
+CLAIMED_PREFIX = "px4_claimed_"
+
+
+class PooledContainer:
+    __slots__ = ("pool_id", "model", "container", "ports", "ready")
+
+    def __init__(self, pool_id: str, model: str, container, ports: List[int]):
+        self.pool_id = pool_id
+        self.model = model
+        self.container = container
+        self.ports = ports
+        # Booted, and so in the idle list where starts can claim it
+        self.ready = False
+
+
+class WarmPool:
+    """Pre-booted PX4 containers per model, claimed by starts for that model
+
+    Each pooled container runs with its own port block and waits idle until a
+    start for its model claims it; a start that asks for a port no pooled
+    container has is a miss and launches a fresh container as before. A
+    container only joins the idle list once its log shows warm_pool_ready_log,
+    so a claim never gets a SITL that is still building or booting. A
+    background task tops every model back up to its warm_pool target while
+    the host has room within the per-instance CPU/memory budget. The idle
+    lists are guarded by the DockerManager's lock.
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.idle: Dict[str, Deque[PooledContainer]] = {}
+        self._by_container: Dict[str, PooledContainer] = {}
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self._wakeup = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def depth(self) -> int:
+        return len(self._by_container)
+
+    def _add(self, pooled: PooledContainer):
+        self._by_container[pooled.container.id] = pooled
+        if pooled.ready:
+            self.idle.setdefault(pooled.model, deque()).append(pooled)
+
+    def _remove(self, pooled: PooledContainer):
+        if self._by_container.pop(pooled.container.id, None) is not None and pooled.ready:
+            self.idle[pooled.model].remove(pooled)
+
+    def _discard(self, pooled: PooledContainer):
+        """Drop a pool container and free its ports (blocking)"""
+        with self.manager._lock:
+            self._remove(pooled)
+        try:
+            pooled.container.remove(force=True)
+        except Exception as e:
+            print(f"Removing pool container {pooled.container.id[:12]}: {e}")
+        self.manager.ports.free(pooled.ports[0], pooled.pool_id)
+
+    def _wake(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def take(self, model: str, mav_udp: Optional[int] = None) -> Optional[PooledContainer]:
+        """Claim an idle container for model (on mav_udp, if given); call with the manager's lock held"""
+        idle = self.idle.get(model)
+        pooled = None
+        if idle:
+            if mav_udp is None:
+                pooled = idle[0]
+            else:
+                pooled = next((p for p in idle if p.ports[0] == mav_udp), None)
+        if pooled is None:
+            self.misses += 1
+            return None
+        self._remove(pooled)
+        self.hits += 1
+        self._wake()
+        return pooled
+
+    def container_event(self, container_id: str, action: str) -> bool:
+        """Apply a Docker event if it is for an idle pool container; call with the manager's lock held"""
+        pooled = self._by_container.get(container_id)
+        if pooled is None:
+            return False
+        if action in ("die", "destroy"):
+            self._remove(pooled)
+            self.manager.ports.free(pooled.ports[0], pooled.pool_id)
+            self._wake()
+        return True
+
+    def resync(self, containers: List):
+        """Match the idle lists to the unclaimed pool containers Docker reports; call with the manager's lock held"""
+        running = {c.id: c for c in containers if c.status == "running"}
+        for pooled in list(self._by_container.values()):
+            if pooled.container.id not in running:
+                self._remove(pooled)
+                self.manager.ports.free(pooled.ports[0], pooled.pool_id)
+        # Containers pooled before the agent (re)started
+        for container in running.values():
+            if container.id in self._by_container:
+                continue
+            labels = container.labels
+            pool_id = labels.get("px4.instance_id", container.id)
+            ports = container_ports(labels)
+            try:
+                self.manager.ports.reserve(ports[0], pool_id, count=len(ports), check_host=False)
+            except Exception as e:
+                print(f"Adopting pool container {container.id[:12]}: {e}")
+                continue
+            # Claimable once the refill loop has seen it boot
+            self._add(PooledContainer(pool_id, labels[POOL_LABEL], container, ports))
+
+    def launch(self, model: str):
+        """Start one pool container for model and wait for it to boot (blocking; runs on the Docker thread pool)"""
+        pool_id = str(uuid.uuid4())
+        ports = self.manager.ports.allocate(pool_id)
+        try:
+            container = self.manager.create_container(
+                f"px4_pool_{model}_{pool_id[:8]}", model, ports,
+                {POOL_LABEL: model, "px4.instance_id": pool_id}
+            )
+        except Exception:
+            self.manager.ports.free(ports[0], pool_id)
+            raise
+        pooled = PooledContainer(pool_id, model, container, ports)
+        # Pooled before it starts, so an early exit is seen
+        with self.manager._lock:
+            self._add(pooled)
+        try:
+            container.start()
+            self.boot(pooled)
+        except Exception:
+            self._discard(pooled)
+            raise
+
+    def booting(self) -> Optional[PooledContainer]:
+        """A pool container not yet seen to boot, e.g. one adopted after a restart"""
+        with self.manager._lock:
+            return next((pooled for pooled in self._by_container.values() if not pooled.ready), None)
+
+    def boot(self, pooled: PooledContainer):
+        """Wait for PX4 in a pool container to finish booting, then make it claimable (blocking)
+
+        Polls the container log for warm_pool_ready_log; raises if the
+        container exits first or takes longer than warm_pool_boot_timeout.
+        """
+        marker = settings.warm_pool_ready_log.encode()
+        deadline = time.monotonic() + settings.warm_pool_boot_timeout
+        since = None
+        while True:
+            with self.manager._lock:
+                if pooled.container.id not in self._by_container:
+                    raise Exception(f"Pool container {pooled.container.id[:12]} exited while booting")
+            checked = int(time.time())
+            logs = pooled.container.logs(since=since) if since else pooled.container.logs()
+            if marker in logs:
+                break
+            if time.monotonic() >= deadline:
+                raise Exception(f"Pool container {pooled.container.id[:12]} did not boot within "
+                                f"{settings.warm_pool_boot_timeout:.0f}s")
+            # Log timestamps are compared in whole seconds; re-reading one is cheaper than missing a line
+            since = checked - 1
+            time.sleep(1.0)
+        with self.manager._lock:
+            if pooled.container.id not in self._by_container:
+                raise Exception(f"Pool container {pooled.container.id[:12]} exited while booting")
+            pooled.ready = True
+            self.idle.setdefault(pooled.model, deque()).append(pooled)
+
+    def evict(self, mav_udp: Optional[int] = None) -> bool:
+        """Remove an idle container (the one holding mav_udp, if given) to free its ports"""
+        with self.manager._lock:
+            candidates = [p for p in self._by_container.values()
+                          if p.ready and (mav_udp is None or mav_udp in p.ports)]
+            if not candidates:
+                return False
+            # The model with the deepest pool loses one
+            pooled = max(candidates, key=lambda p: len(self.idle[p.model]))
+            # Out of the idle list before the lock is released, so no start can claim it
+            self._remove(pooled)
+        self._discard(pooled)
+        return True
+
+    def drain(self):
+        """Remove every pool container, booting or idle (blocking)"""
+        with self.manager._lock:
+            pooled = list(self._by_container.values())
+            for p in pooled:
+                self._remove(p)
+        for p in pooled:
+            self._discard(p)
+
+    def fits(self) -> bool:
+        """Whether the host has room (and a free port block) for one more container"""
+        if not self.manager.ports.stats()["free"]:
+            return False
+        resources = self.manager.get_system_resources()
+        # Vehicles of a density group share one container
+        with self.manager._lock:
+            running = len({info.container_id for info in self.manager.running_instances.values()})
+        containers = running + self.depth() + 1
+        if containers * settings.instance_cpu_cores > resources["cpu_cores"]:
+            return False
+        if containers * settings.instance_memory_gb > resources["memory_gb"]:
+            return False
+        load = self.manager.get_load()
+        return load["cpu_percent"] < settings.warm_pool_max_load and \
+            load["memory_percent"] < settings.warm_pool_max_load
+
+    def wanted(self) -> Optional[str]:
+        """The model furthest below its target, if the host has room for another container"""
+        with self.manager._lock:
+            shortfall = {model: target - len(self.idle.get(model, ()))
+                         for model, target in settings.warm_pool.items()}
+        model = max(shortfall, key=shortfall.get, default=None)
+        if model is None or shortfall[model] <= 0 or not self.fits():
+            return None
+        return model
+
+    def start(self):
+        if self._task is None and settings.warm_pool:
+            self._loop = asyncio.get_running_loop()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                booting = self.booting()
+                if booting:
+                    await self.manager.run(self._boot_adopted, booting)
+                    continue
+                model = self.wanted()
+                if model:
+                    await self.manager.run(self.launch, model)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                print(f"Warm pool refill failed: {e}")
+            # asyncio.wait rather than wait_for, which can swallow a cancel that races a wakeup
+            waiter = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait((waiter,), timeout=settings.warm_pool_interval)
+            finally:
+                waiter.cancel()
+            self._wakeup.clear()
+
+    def _boot_adopted(self, pooled: PooledContainer):
+        try:
+            self.boot(pooled)
+        except Exception:
+            self._discard(pooled)
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        with self.manager._lock:
+            depth = {model: len(idle) for model, idle in self.idle.items() if idle}
+            booting = sum(not pooled.ready for pooled in self._by_container.values())
+        return {"depth": depth, "booting": booting, "target": dict(settings.warm_pool),
+                "hits": self.hits, "misses": self.misses, "failures": self.failures}
@@ -0,0 +1,137 @@
+"""Density groups against a fake Docker client (no daemon needed)"""
+import itertools
+
+import docker
+import pytest
+
+from src.config import settings
+from src.docker_manager import DockerManager
+from src.models import GroupStartRequest, StopRequest
+
+
+class FakeExecResult:
+    exit_code = 0
+    output = b""
+
+
+class FakeContainer:
+    def __init__(self, client, container_id, name, labels):
+        self.client = client
+        self.id = container_id
+        self.name = name
+        self.labels = labels
+        self.status = "created"
+        self.execs = []
+
+    def start(self):
+        self.status = "running"
+
+    def stop(self, timeout=10):
+        self.status = "exited"
+        self.client.by_id.pop(self.id, None)
+
+    def remove(self, force=False):
+        self.stop()
+
+    def exec_run(self, cmd):
+        self.execs.append(cmd[-1])
+        return FakeExecResult()
+
+
+class FakeContainers:
+    def __init__(self, client):
+        self.client = client
+
+    def create(self, image, name, labels, **kwargs):
+        container = FakeContainer(self.client, f"cid{next(self.client.ids):061d}", name, labels)
+        container.environment = kwargs.get("environment", {})
+        self.client.by_id[container.id] = container
+        return container
+
+    def get(self, container_id):
+        if container_id not in self.client.by_id:
+            raise docker.errors.NotFound("gone")
+        return self.client.by_id[container_id]
+
+    def list(self, all=False, filters=None):
+        return list(self.client.by_id.values())
+
+
+class FakeClient:
+    def __init__(self):
+        self.by_id = {}
+        self.ids = itertools.count()
+        self.containers = FakeContainers(self)
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(docker, "from_env", lambda **kwargs: client)
+    monkeypatch.setattr(settings, "port_host_check", False)
+    monkeypatch.setattr(settings, "sitl_cache_enabled", False)
+    monkeypatch.setattr(settings, "mav_port_start", 14560)
+    monkeypatch.setattr(settings, "mav_port_end", 14579)
+    manager = DockerManager()
+    manager.events = []
+    manager.on_event = lambda type_, instance_id, **fields: manager.events.append((type_, instance_id))
+    yield manager
+    manager.shutdown()
+
+
+def start_group(manager, name="swarm", instance_ids=("a", "b", "c")):
+    return manager.start_group(GroupStartRequest(name=name, count=len(instance_ids),
+                                                 instance_ids=list(instance_ids)))
+
+
+def test_stopping_one_vehicle_leaves_the_others_running(manager):
+    vehicles = start_group(manager)
+    container = manager.client.containers.get(vehicles[0].container_id)
+    manager.events.clear()
+
+    # The controller sends both ids
+    result = manager.stop_instance(StopRequest(instance_id="b", container_id=container.id))
+
+    assert result["instance_id"] == "b"
+    assert container.status == "running"
+    assert len(container.execs) == 1 and f"-[i] {vehicles[1].px4_instance} -d" in container.execs[0]
+    assert sorted(manager.running_instances) == ["a", "c"]
+    assert all(info.status == "running" for info in manager.list_instances())
+    assert manager.events == [("stopped", "b")]
+    assert manager.ports.stats()["used"] == 2
+
+
+def test_stopping_the_last_vehicle_stops_the_container(manager):
+    vehicles = start_group(manager, instance_ids=("a", "b"))
+    container = manager.client.containers.get(vehicles[0].container_id)
+
+    manager.stop_instance(StopRequest(instance_id="a", container_id=container.id))
+    manager.stop_instance(StopRequest(instance_id="b", container_id=container.id))
+
+    assert container.status == "exited"
+    assert manager.running_instances == {}
+    assert manager.ports.stats()["used"] == 0
+
+
+def test_stopping_a_group_container_stops_every_vehicle(manager):
+    vehicles = start_group(manager)
+    manager.events.clear()
+
+    manager.stop_instance(StopRequest(container_id=vehicles[0].container_id))
+
+    assert manager.running_instances == {}
+    assert sorted(manager.events) == [("stopped", "a"), ("stopped", "b"), ("stopped", "c")]
+
+
+def test_vehicle_ports_and_px4_instances_are_unique_per_node(manager):
+    first = start_group(manager, name="one")
+    second = start_group(manager, name="two", instance_ids=("d", "e"))
+    vehicles = first + second
+
+    assert len({v.mav_udp for v in vehicles}) == len(vehicles)
+    # PX4 derives its simulator, GCS and offboard ports from -i, so the index must not repeat either
+    assert len({v.px4_instance for v in vehicles}) == len(vehicles)
+    # Instance 0 belongs to single-vehicle containers
+    assert min(v.px4_instance for v in vehicles) > 0
+    environments = [manager.client.containers.get(v.container_id).environment for v in (first[0], second[0])]
+    assert environments[0]["GAZEBO_MASTER_URI"] != environments[1]["GAZEBO_MASTER_URI"]
@@ -1,65 +1,299 @@
 import httpx
 import asyncio
-from typing import Dict, Any, Optional
+import random
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
 from app.config import settings
+from app.metrics import registry, for_agent
+
+try:
+    import h2  # noqa: F401 - only needed to enable HTTP/2 in httpx
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class AgentError(Exception):
+    """A failed agent call; status_code is None when the agent could not be reached
+
+    Calls refused locally (circuit open, too many in flight) were never sent
+    and carry status_code 503.
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retryable: bool = False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+
+
+# Responses that say the agent (or a proxy in front of it) is unhealthy rather than refusing the call
+UNHEALTHY_STATUS_CODES = (502, 503, 504)
+
+
+class CircuitBreaker:
+    """Health of one agent as seen by this controller
+
+    Opens after agent_breaker_failures consecutive timeouts, connection
+    errors or 502/503/504s, failing calls fast for agent_breaker_cooldown
+    seconds. Then a single probe call is let through (half-open): success
+    closes the breaker, failure opens it again. Also bounds the calls in
+    flight to the agent.
+    """
+
+    def __init__(self):
+        self.state = "closed"  # closed, open, half_open
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.slots = asyncio.Semaphore(settings.agent_max_in_flight)
+        self.in_flight = 0
+
+    def retry_in(self) -> float:
+        if self.state != "open":
+            return 0.0
+        return max(0.0, self.opened_at + settings.agent_breaker_cooldown - time.monotonic())
+
+    @property
+    def accepting(self) -> bool:
+        """False while open and cooling down; placement avoids such nodes"""
+        return self.state != "open" or self.retry_in() <= 0
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if self.retry_in() > 0:
+                return False
+            self.state = "half_open"
+            self.probing = False
+        if self.state == "half_open":
+            if self.probing:
+                return False
+            self.probing = True
+        return True
+
+    def success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.probing = False
+
+    def failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == "half_open" or self.failures >= settings.agent_breaker_failures:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def abandon(self):
+        """The call ended without an outcome (cancelled); let another probe through"""
+        self.probing = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "in_flight": self.in_flight,
+                "retry_in": round(self.retry_in(), 1)}
+
+
+def agent_url_for(address: str) -> str:
+    """Base URL of the agent API on a node"""
+    return f"{settings.agent_scheme}://{address}:{settings.agent_port}"
 
 
 class AgentClient:
     def __init__(self, timeout: int = None):
         self.timeout = timeout or settings.agent_timeout
         self.verify_ssl = settings.agent_verify_ssl
+        # One long-lived connection pool per agent base URL, least recently used first
+        self._clients: "OrderedDict[str, httpx.AsyncClient]" = OrderedDict()
+        # Calls using each client; an evicted client is closed once this drops to 0
+        self._users: Dict[httpx.AsyncClient, int] = {}
+        self._lock = asyncio.Lock()
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.in_flight = 0
 
-    async def start_instance(self, agent_url: str, request_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Start a PX4 instance on an agent"""
-        async with httpx.AsyncClient(verify=self.verify_ssl, timeout=self.timeout) as client:
+    def _new_client(self) -> httpx.AsyncClient:
+        """Create a keep-alive client for a single agent host"""
+        limits = httpx.Limits(
+            max_connections=settings.agent_pool_max_connections,
+            max_keepalive_connections=settings.agent_pool_max_keepalive,
+            keepalive_expiry=settings.agent_pool_keepalive_expiry
+        )
+        return httpx.AsyncClient(
+            verify=self.verify_ssl,
+            timeout=self._timeout(self.timeout),
+            limits=limits,
+            http2=settings.agent_http2 and HTTP2_AVAILABLE
+        )
+
+    @staticmethod
+    def _timeout(read: float) -> httpx.Timeout:
+        """A short connect timeout so unreachable agents fail fast, whatever the read timeout"""
+        return httpx.Timeout(read, connect=min(read, settings.agent_connect_timeout))
+
+    def breaker(self, agent_url: str) -> CircuitBreaker:
+        breaker = self.breakers.get(agent_url)
+        if breaker is None:
+            breaker = self.breakers[agent_url] = CircuitBreaker()
+        return breaker
+
+    def accepting(self, agent_url: str) -> bool:
+        """Whether calls to an agent would be attempted right now"""
+        breaker = self.breakers.get(agent_url)
+        return breaker is None or breaker.accepting
+
+    async def _get_client(self, agent_url: str) -> httpx.AsyncClient:
+        """Return the pooled client for an agent, creating it on first use
+
+        The caller must hand it back with _put_client when its call is done.
+        """
+        client = self._clients.get(agent_url)
+        if client is not None:
+            self._clients.move_to_end(agent_url)
+        else:
+            async with self._lock:
+                client = self._clients.get(agent_url)
+                if client is None:
+                    client = self._new_client()
+                    self._clients[agent_url] = client
+                    # Drop the pools of agents we have not talked to for the longest time;
+                    # one still serving a call is closed by _put_client when that call ends
+                    while len(self._clients) > settings.agent_pool_max_clients:
+                        _, evicted = self._clients.popitem(last=False)
+                        if not self._users.get(evicted):
+                            await evicted.aclose()
+        self._users[client] = self._users.get(client, 0) + 1
+        return client
+
+    async def _put_client(self, agent_url: str, client: httpx.AsyncClient):
+        """End a call's use of a client, closing it if it was evicted meanwhile"""
+        users = self._users.pop(client) - 1
+        if users:
+            self._users[client] = users
+        elif self._clients.get(agent_url) is not client:
+            await client.aclose()
+
+    async def _request(self, method: str, agent_url: str, path: str, retries: int = 0,
+                       **kwargs) -> Dict[str, Any]:
+        """Send a request to an agent, retrying up to `retries` times if it is safe to
+
+        Only pass retries for idempotent calls: a timed out request may still
+        have been carried out by the agent.
+        """
+        for attempt in range(retries + 1):
             try:
-                response = await client.post(
-                    f"{agent_url}/agent/start",
-                    json=request_data
+                return await self._send(method, agent_url, path, **kwargs)
+            except AgentError as e:
+                if attempt >= retries or not e.retryable:
+                    raise
+            # Exponential backoff with full jitter
+            await asyncio.sleep(random.uniform(0, settings.agent_retry_backoff * 2 ** attempt))
+
+    async def _send(self, method: str, agent_url: str, path: str, **kwargs) -> Dict[str, Any]:
+        """One request to an agent over its pooled connection, guarded by its breaker"""
+        metrics = for_agent(agent_url)
+        breaker = self.breaker(agent_url)
+        try:
+            await asyncio.wait_for(breaker.slots.acquire(), timeout=settings.agent_queue_timeout)
+        except asyncio.TimeoutError:
+            metrics.error(path, "busy").inc()
+            raise AgentError(f"Too many requests in flight to agent {agent_url}", status_code=503)
+        try:
+            if not breaker.allow():
+                metrics.error(path, "circuit_open").inc()
+                raise AgentError(
+                    f"Agent {agent_url} is failing; circuit open for another {breaker.retry_in():.0f}s",
+                    status_code=503
                 )
-                response.raise_for_status()
-                return response.json()
-            except httpx.RequestError as e:
-                raise Exception(f"Failed to communicate with agent: {e}")
-            except httpx.HTTPStatusError as e:
-                raise Exception(f"Agent returned error {e.response.status_code}: {e.response.text}")
+            return await self._call(breaker, metrics, method, agent_url, path, **kwargs)
+        finally:
+            breaker.slots.release()
+
+    async def _call(self, breaker: CircuitBreaker, metrics, method: str, agent_url: str, path: str,
+                    **kwargs) -> Dict[str, Any]:
+        client = await self._get_client(agent_url)
+        self.in_flight += 1
+        breaker.in_flight += 1
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, f"{agent_url}{path}", **kwargs)
+            if response.status_code in UNHEALTHY_STATUS_CODES:
+                breaker.failure()
+            else:
+                # Any other answer means the agent is up, even if it refused the call
+                breaker.success()
+            response.raise_for_status()
+            return response.json()
+        except httpx.TimeoutException as e:
+            breaker.failure()
+            metrics.error(path, "timeout").inc()
+            raise AgentError(f"Failed to communicate with agent: {e}", retryable=True)
+        except httpx.RequestError as e:
+            breaker.failure()
+            metrics.error(path, "connect").inc()
+            raise AgentError(f"Failed to communicate with agent: {e}", retryable=True)
+        except httpx.HTTPStatusError as e:
+            metrics.error(path, "http").inc()
+            raise AgentError(
+                f"Agent returned error {e.response.status_code}: {e.response.text}",
+                status_code=e.response.status_code,
+                retryable=e.response.status_code in UNHEALTHY_STATUS_CODES
+            )
+        except BaseException:
+            # Cancelled mid-call: no verdict on the agent
+            breaker.abandon()
+            raise
+        finally:
+            self.in_flight -= 1
+            breaker.in_flight -= 1
+            metrics.duration(path).observe(time.perf_counter() - start)
+            await self._put_client(agent_url, client)
+
+    async def start_instance(self, agent_url: str, request_data: Dict[str, Any],
+                             timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Start a PX4 instance on an agent"""
+        return await self._request("POST", agent_url, "/agent/start", json=request_data,
+                                   timeout=self._timeout(timeout or self.timeout))
+
+    async def start_group(self, agent_url: str, request_data: Dict[str, Any],
+                          timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Start a density group of PX4 vehicles in one container on an agent"""
+        return await self._request("POST", agent_url, "/agent/start-group", json=request_data,
+                                   timeout=self._timeout(timeout or self.timeout))
 
     async def stop_instance(self, agent_url: str, request_data: Dict[str, Any]) -> Dict[str, Any]:
         """Stop a PX4 instance on an agent"""
-        async with httpx.AsyncClient(verify=self.verify_ssl, timeout=self.timeout) as client:
-            try:
-                response = await client.post(
-                    f"{agent_url}/agent/stop",
-                    json=request_data
-                )
-                response.raise_for_status()
-                return response.json()
-            except httpx.RequestError as e:
-                raise Exception(f"Failed to communicate with agent: {e}")
-            except httpx.HTTPStatusError as e:
-                raise Exception(f"Agent returned error {e.response.status_code}: {e.response.text}")
+        return await self._request("POST", agent_url, "/agent/stop", json=request_data)
 
     async def get_status(self, agent_url: str) -> Dict[str, Any]:
         """Get status from an agent"""
-        async with httpx.AsyncClient(verify=self.verify_ssl, timeout=self.timeout) as client:
-            try:
-                response = await client.get(f"{agent_url}/agent/status")
-                response.raise_for_status()
-                return response.json()
-            except httpx.RequestError as e:
-                raise Exception(f"Failed to communicate with agent: {e}")
-            except httpx.HTTPStatusError as e:
-                raise Exception(f"Agent returned error {e.response.status_code}: {e.response.text}")
+        return await self._request("GET", agent_url, "/agent/status", retries=settings.agent_retries)
+
+    async def list_instances(self, agent_url: str) -> List[Dict[str, Any]]:
+        """List the instances an agent is tracking"""
+        return await self._request("GET", agent_url, "/agent/instances", retries=settings.agent_retries)
 
     async def health_check(self, agent_url: str) -> bool:
         """Check if agent is healthy"""
-        async with httpx.AsyncClient(verify=self.verify_ssl, timeout=5) as client:
-            try:
-                response = await client.get(f"{agent_url}/health")
-                return response.status_code == 200
-            except:
-                return False
+        try:
+            await self._request("GET", agent_url, "/health", retries=settings.agent_retries,
+                                timeout=self._timeout(5))
+            return True
+        except AgentError:
+            return False
+
+    async def aclose(self):
+        """Close every pooled agent connection"""
+        async with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            await client.aclose()
 
 
 # Global agent client instance
 agent_client = AgentClient()
+
+registry.gauge("controller_agent_clients", "Agents with a pooled connection",
+               lambda: len(agent_client._clients))
+registry.gauge("controller_agent_requests_in_flight", "Agent RPCs awaiting a response",
+               lambda: agent_client.in_flight)
+registry.gauge("controller_agent_circuits_open", "Agents whose circuit breaker is open or half-open",
+               lambda: sum(breaker.state != "closed" for breaker in agent_client.breakers.values()))
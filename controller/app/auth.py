@@ -1,12 +1,18 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select, event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db, User
+from app.cache import TTLCache
 from app.config import settings
+from app.metrics import registry
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -14,6 +20,10 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 # JWT token scheme
 security = HTTPBearer()
 
+# Validated token -> username, and username -> User loaded by an earlier request
+token_cache = TTLCache(settings.auth_cache_max_size, settings.auth_cache_ttl)
+user_cache = TTLCache(settings.auth_cache_max_size, settings.auth_cache_ttl)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -23,6 +33,41 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+# bcrypt is CPU bound (and releases the GIL), so it runs on a small dedicated pool
+# instead of the event loop; requests beyond the queue limit are rejected
+hash_executor = ThreadPoolExecutor(
+    max_workers=settings.password_hash_workers, thread_name_prefix="password-hash"
+)
+hash_pending = 0
+
+
+async def run_in_hash_pool(fn, *args):
+    global hash_pending
+    if hash_pending >= settings.password_hash_workers + settings.password_hash_queue:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent password operations, retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    hash_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(hash_executor, fn, *args)
+    finally:
+        hash_pending -= 1
+
+
+registry.gauge("controller_password_hash_pending", "Password hash jobs running or queued",
+               lambda: hash_pending)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await run_in_hash_pool(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await run_in_hash_pool(get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -34,47 +79,111 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-def verify_token(token: str) -> Optional[str]:
+def decode_token(token: str) -> Optional[dict]:
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        username: str = payload.get("sub")
-        if username is None:
+        if payload.get("sub") is None:
             return None
-        return username
+        return payload
     except JWTError:
         return None
 
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
-    user = db.query(User).filter(User.username == username).first()
+def verify_token(token: str) -> Optional[str]:
+    payload = decode_token(token)
+    return payload["sub"] if payload else None
+
+
+def invalidate_user(username: str):
+    """Drop a user from the auth cache so the next request reloads it"""
+    user_cache.pop(username)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target):
+    # Covers deactivation and any other change flushed through the ORM in this process;
+    # other workers pick the change up when their entry expires
+    invalidate_user(target.username)
+    for old_username in inspect(target).attrs.username.history.deleted or ():
+        invalidate_user(old_username)
+
+
+def auth_cache_stats() -> dict:
+    return {"tokens": token_cache.stats(), "users": user_cache.stats()}
+
+
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
+    result = await db.execute(select(User).where(User.username == username))
+    return result.scalars().first()
+
+
+async def authenticate_user(db: AsyncSession, username: str, password: str) -> Optional[User]:
+    user = await get_user_by_username(db, username)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         return None
     return user
 
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    credentials_exception = HTTPException(
+def credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
-    username = verify_token(credentials.credentials)
+
+
+async def user_from_token(token: str, db: AsyncSession) -> User:
+    """Resolve a bearer token to its user, using the auth cache when possible"""
+    username = token_cache.get(token) if settings.auth_cache_enabled else None
     if username is None:
-        raise credentials_exception
+        payload = decode_token(token)
+        if payload is None:
+            raise credentials_exception()
+        username = payload["sub"]
+        if settings.auth_cache_enabled:
+            # Never cache a token past its own expiry
+            expires_in = payload["exp"] - time.time() if "exp" in payload else settings.auth_cache_ttl
+            token_cache.set(token, username, ttl=expires_in)
     
-    user = db.query(User).filter(User.username == username).first()
+    user = user_cache.get(username) if settings.auth_cache_enabled else None
     if user is None:
-        raise credentials_exception
+        user = await get_user_by_username(db, username)
+        if user is None:
+            raise credentials_exception()
+        if settings.auth_cache_enabled:
+            user_cache.set(username, user)
     
     return user
 
 
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    return await user_from_token(credentials.credentials, db)
+
+
+async def get_stream_user(
+    request: Request,
+    access_token: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """Like get_current_active_user, but also accepts ?access_token= for EventSource clients"""
+    token = access_token
+    authorization = request.headers.get("Authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    if not token:
+        raise credentials_exception()
+    user = await user_from_token(token, db)
+    if not user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return user
+
+
 async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
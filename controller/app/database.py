@@ -1,16 +1,152 @@
-from sqlalchemy import create_engine, Column, String, Integer, DateTime, Boolean, Text
+from sqlalchemy import create_engine, event, inspect, select, text, Column, String, Integer, Float, DateTime, Boolean, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from datetime import datetime
+import asyncio
+import json
+import weakref
+from typing import Optional
 from app.config import settings
+from app.metrics import registry, instrument_engine
 
-# Create database engine
+
+def async_database_url(url: str) -> str:
+    """Map a sync database URL onto its async driver (aiosqlite / asyncpg)"""
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    if url.startswith("postgresql+psycopg2://"):
+        return "postgresql+asyncpg://" + url[len("postgresql+psycopg2://"):]
+    if url.startswith("postgresql://"):
+        return "postgresql+asyncpg://" + url[len("postgresql://"):]
+    return url
+
+
+# Create database engine (used for schema creation and maintenance scripts)
 engine = create_engine(
     settings.database_url,
     connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {}
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engine used by the API so slow queries don't block the event loop
+async_engine = create_async_engine(
+    async_database_url(settings.database_url),
+    **({"connect_args": {"timeout": settings.sqlite_busy_timeout}} if "sqlite" in settings.database_url else {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": True
+    })
+)
+
+instrument_engine(async_engine.sync_engine)
+
+
+if "sqlite" in settings.database_url:
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def sqlite_pragmas(dbapi_connection, connection_record):
+        """WAL lets readers run alongside the writer; busy_timeout makes writers wait instead of failing
+
+        synchronous=NORMAL is safe with WAL and skips the fsync on every commit.
+        """
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout * 1000)}")
+        cursor.close()
+
+
+def pool_stat(name: str):
+    """A QueuePool statistic, or None for pools that don't track it (sqlite)"""
+    stat = getattr(async_engine.pool, name, None)
+    return stat() if callable(stat) else None
+
+
+def pool_saturation():
+    checked_out = pool_stat("checkedout")
+    size = pool_stat("size")
+    if checked_out is None or not size:
+        return None
+    return checked_out / (size + max(settings.db_max_overflow, 0))
+
+
+registry.gauge("controller_db_pool_checked_out", "Database connections in use", lambda: pool_stat("checkedout"))
+registry.gauge("controller_db_pool_size", "Database connections the pool keeps open", lambda: pool_stat("size"))
+registry.gauge("controller_db_pool_overflow", "Database connections opened beyond pool_size",
+               lambda: pool_stat("overflow"))
+registry.gauge("controller_db_pool_saturation", "Fraction of pool_size + max_overflow in use", pool_saturation)
+
+# One per event loop; asyncio locks can't be shared between loops
+_sqlite_write_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+
+
+class SQLiteSession(AsyncSession):
+    """Holds a process-wide lock from a transaction's first write until it ends
+
+    SQLite allows one writer at a time and its busy handler retries with
+    growing sleeps, so under contention some writers wait for seconds.
+    Queueing them on an asyncio lock hands the database over in order;
+    busy_timeout still covers writers in other processes.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._write_lock: Optional[asyncio.Lock] = None
+
+    def _has_writes(self) -> bool:
+        return bool(self.new or self.dirty or self.deleted)
+
+    async def _lock_writes(self):
+        if self._write_lock is None:
+            loop = asyncio.get_running_loop()
+            lock = _sqlite_write_locks.get(loop)
+            if lock is None:
+                lock = _sqlite_write_locks[loop] = asyncio.Lock()
+            await lock.acquire()
+            self._write_lock = lock
+
+    def _unlock_writes(self):
+        if self._write_lock is not None:
+            self._write_lock.release()
+            self._write_lock = None
+
+    async def execute(self, statement, *args, **kwargs):
+        if getattr(statement, "is_dml", False):
+            await self._lock_writes()
+        return await super().execute(statement, *args, **kwargs)
+
+    async def flush(self, *args, **kwargs):
+        if self._has_writes():
+            await self._lock_writes()
+        await super().flush(*args, **kwargs)
+
+    async def commit(self):
+        if self._has_writes():
+            await self._lock_writes()
+        await super().commit()
+        self._unlock_writes()
+
+    async def rollback(self):
+        try:
+            await super().rollback()
+        finally:
+            self._unlock_writes()
+
+    async def close(self):
+        try:
+            await super().close()
+        finally:
+            self._unlock_writes()
+
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=SQLiteSession if "sqlite" in settings.database_url else AsyncSession,
+    autoflush=False, expire_on_commit=False
+)
 Base = declarative_base()
 
 
@@ -20,12 +156,34 @@ class Node(Base):
     id = Column(String, primary_key=True, index=True)
     name = Column(String, nullable=False)
     address = Column(String, nullable=False)
-    tags = Column(Text)  # JSON string of tags
+    tags = Column(Text)  # JSON string of tags, mirrored in node_tags for filtering
     last_seen = Column(DateTime, default=datetime.utcnow)
     status = Column(String, default="unknown")  # online, offline, error
     cpu_cores = Column(Integer, default=0)
     memory_gb = Column(Integer, default=0)
     disk_gb = Column(Integer, default=0)
+    # Load reported by the latest heartbeat
+    running_instances = Column(Integer, nullable=True)
+    cpu_percent = Column(Float, nullable=True)
+    memory_percent = Column(Float, nullable=True)
+
+    __table_args__ = (
+        # Keyset pagination and per-status counts of nodes
+        Index("ix_nodes_status_id", "status", "id"),
+    )
+
+
+class NodeTag(Base):
+    """One row per tag of a node, so tag filters are index lookups instead of JSON scans"""
+    __tablename__ = "node_tags"
+    
+    node_id = Column(String, primary_key=True)
+    tag = Column(String, primary_key=True)
+
+    __table_args__ = (
+        # Nodes carrying a tag
+        Index("ix_node_tags_tag_node", "tag", "node_id"),
+    )
 
 
 class Instance(Base):
@@ -38,10 +196,63 @@ class Instance(Base):
     vehicle_type = Column(String, default="copter")
     model = Column(String, default="iris")
     mav_udp = Column(Integer, nullable=True)
+    group_id = Column(String, nullable=True, index=True)  # Density group sharing one container
     status = Column(String, default="starting")  # starting, running, stopping, stopped, error
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        # Keyset pagination on (created_at, id), optionally narrowed by status and/or node
+        Index("ix_instances_created_id", "created_at", "id"),
+        Index("ix_instances_status_created_id", "status", "created_at", "id"),
+        Index("ix_instances_node_status_created_id", "node_id", "status", "created_at", "id"),
+        # Finding rows old enough to archive
+        Index("ix_instances_status_updated", "status", "updated_at"),
+    )
+
+
+class InstanceArchive(Base):
+    """Stopped and failed instances moved out of `instances` by the archiver"""
+    __tablename__ = "instance_archive"
+    
+    id = Column(String, primary_key=True)
+    node_id = Column(String, nullable=False)
+    container_id = Column(String, nullable=True)
+    name = Column(String, nullable=False)
+    vehicle_type = Column(String)
+    model = Column(String)
+    mav_udp = Column(Integer, nullable=True)
+    group_id = Column(String, nullable=True)
+    status = Column(String)  # stopped, error
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Keyset pagination, optionally per node, and purging by age
+        Index("ix_instance_archive_created_id", "created_at", "id"),
+        Index("ix_instance_archive_node_created_id", "node_id", "created_at", "id"),
+        Index("ix_instance_archive_archived_at", "archived_at"),
+    )
+
+
+class Operation(Base):
+    __tablename__ = "operations"
+    
+    id = Column(String, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # start, stop
+    status = Column(String, default="pending")  # pending, running, succeeded, failed
+    # "<user_id>:<Idempotency-Key header>", so retries map back to the same operation
+    idempotency_key = Column(String, unique=True, nullable=True)
+    user_id = Column(String, nullable=True)
+    node_id = Column(String, nullable=True)
+    instance_id = Column(String, nullable=True, index=True)
+    request = Column(Text)  # JSON agent request
+    result = Column(Text, nullable=True)  # JSON agent response
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 
 class User(Base):
     __tablename__ = "users"
@@ -54,13 +265,71 @@ class User(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
+class FleetVersion(Base):
+    """Change counter per resource, bumped in every transaction that writes it"""
+    __tablename__ = "fleet_versions"
+    
+    resource = Column(String, primary_key=True)  # nodes, instances
+    version = Column(Integer, nullable=False, default=0)
+
+
+FLEET_RESOURCES = ("nodes", "instances")
+
+
 # Create tables
 Base.metadata.create_all(bind=engine)
 
 
-def get_db():
-    db = SessionLocal()
+def ensure_columns():
+    """Add nullable columns added after a table was first created"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+
+def ensure_indexes():
+    """Create indexes added after a table was first created (create_all skips existing tables)"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def ensure_fleet_versions():
+    try:
+        with engine.begin() as conn:
+            existing = set(conn.execute(select(FleetVersion.resource)).scalars())
+            missing = [{"resource": r, "version": 0} for r in FLEET_RESOURCES if r not in existing]
+            if missing:
+                conn.execute(FleetVersion.__table__.insert(), missing)
+    except IntegrityError:
+        pass  # Another worker created them first
+
+
+def ensure_node_tags():
+    """Fill node_tags for nodes registered before the table existed"""
     try:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(Node.id, Node.tags).where(Node.tags.isnot(None), Node.id.not_in(select(NodeTag.node_id)))
+            ).all()
+            values = [{"node_id": node_id, "tag": tag} for node_id, tags in rows for tag in set(json.loads(tags))]
+            if values:
+                conn.execute(NodeTag.__table__.insert(), values)
+    except IntegrityError:
+        pass  # Another worker filled them first
+
+
+ensure_columns()
+ensure_indexes()
+ensure_fleet_versions()
+ensure_node_tags()
+
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
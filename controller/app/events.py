@@ -0,0 +1,146 @@
+import asyncio
+import json
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional, Set, Tuple
+from app.database import Node, Instance
+from app.models import NodeResponse, InstanceResponse
+from app.heartbeats import heartbeats
+from app.serializers import dumps
+from app.metrics import registry
+from app.config import settings
+
+
+def node_response(node: Node) -> NodeResponse:
+    """API view of a node, including heartbeats not yet written to the database"""
+    fields = dict(
+        id=node.id,
+        name=node.name,
+        address=node.address,
+        tags=json.loads(node.tags) if node.tags else [],
+        last_seen=node.last_seen,
+        status=node.status,
+        cpu_cores=node.cpu_cores,
+        memory_gb=node.memory_gb,
+        disk_gb=node.disk_gb,
+        running_instances=node.running_instances,
+        cpu_percent=node.cpu_percent,
+        memory_percent=node.memory_percent
+    )
+    heartbeat = heartbeats.view(node.id, node.last_seen)
+    if heartbeat:
+        fields.update((key, value) for key, value in heartbeat.items() if key != "id")
+    return NodeResponse(**fields)
+
+
+def node_payload(node: Node) -> Dict[str, Any]:
+    return node_response(node).model_dump(mode="json")
+
+
+def instance_payload(instance: Instance) -> Dict[str, Any]:
+    return InstanceResponse.model_validate(instance).model_dump(mode="json")
+
+
+class Subscriber:
+    """One stream consumer; pending changes are coalesced per entity"""
+
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self.pending: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self.resync = False
+        self.wakeup = asyncio.Event()
+
+    def offer(self, event: Dict[str, Any]):
+        if self.resync:
+            return
+        key = (event["type"], event["id"])
+        queued = self.pending.get(key)
+        if queued is None:
+            if len(self.pending) >= self.max_pending:
+                # Too far behind: drop everything and send a fresh snapshot instead
+                self.pending.clear()
+                self.resync = True
+            else:
+                self.pending[key] = event
+        else:
+            # A newer change to the same entity replaces the queued one
+            queued["data"] = {**queued["data"], **event["data"]}
+            queued["seq"] = event["seq"]
+        self.wakeup.set()
+
+    def drain(self):
+        events = list(self.pending.values())
+        self.pending.clear()
+        self.wakeup.clear()
+        return events
+
+
+class EventBroker:
+    """Fans node/instance change events out to stream subscribers
+
+    publish() only appends to a queue; a dispatcher task does the per-subscriber
+    work so request handlers never wait on consumers.
+    """
+
+    def __init__(self):
+        self.subscribers: Set[Subscriber] = set()
+        self.seq = 0
+        self._queue: Deque[Dict[str, Any]] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def publish(self, type_: str, id_: str, data: Dict[str, Any]):
+        """Record a change; data is merged into the entity by consumers"""
+        self.seq += 1
+        if not self.subscribers:
+            return
+        self._queue.append({"seq": self.seq, "type": type_, "id": id_, "data": data})
+        self._wakeup.set()
+
+    def publish_node(self, node: Node):
+        self.publish("node", node.id, node_payload(node))
+
+    def publish_instance(self, instance: Instance):
+        self.publish("instance", instance.id, instance_payload(instance))
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(settings.events_max_pending)
+        self.subscribers.add(subscriber)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._dispatch())
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    async def _dispatch(self):
+        while self.subscribers:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._queue:
+                event = self._queue.popleft()
+                for i, subscriber in enumerate(list(self.subscribers)):
+                    subscriber.offer(dict(event))
+                    # Let request handlers run between large fan-outs
+                    if i % 100 == 99:
+                        await asyncio.sleep(0)
+        self._queue.clear()
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def format_sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
+
+
+# Global event broker
+broker = EventBroker()
+
+registry.gauge("controller_event_subscribers", "Connected event stream clients",
+               lambda: len(broker.subscribers))
@@ -0,0 +1,99 @@
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, Optional
+from sqlalchemy import update
+from app.database import AsyncSessionLocal, Node
+from app.metrics import registry
+from app.config import settings
+
+heartbeats_received = registry.counter("controller_heartbeats_received_total", "Agent heartbeats received")
+
+
+class HeartbeatBuffer:
+    """Write-behind buffer for agent heartbeats
+
+    Heartbeats update an in-memory view straight away and are written to the
+    nodes table by a background task, one batched UPDATE per interval, so a
+    large fleet doesn't cost a transaction per heartbeat.
+    """
+
+    def __init__(self):
+        # Newest heartbeat per node, read by the list endpoints and the scheduler
+        self.latest: Dict[str, Dict[str, Any]] = {}
+        # Heartbeats received since the last flush
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self._received = heartbeats_received.labels()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, node_id: str, running_instances: Optional[int] = None,
+               cpu_percent: Optional[float] = None, memory_percent: Optional[float] = None) -> Dict[str, Any]:
+        values = {
+            "id": node_id,
+            "last_seen": datetime.utcnow(),
+            "status": "online",
+            "running_instances": running_instances,
+            "cpu_percent": cpu_percent,
+            "memory_percent": memory_percent,
+        }
+        self.latest[node_id] = values
+        self.pending[node_id] = values
+        self._received.inc()
+        return values
+
+    def view(self, node_id: str, last_seen: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """The buffered heartbeat of a node if it is newer than last_seen"""
+        values = self.latest.get(node_id)
+        if values is None or (last_seen is not None and values["last_seen"] <= last_seen):
+            return None
+        return values
+
+    def forget(self, node_id: str):
+        self.latest.pop(node_id, None)
+        self.pending.pop(node_id, None)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.heartbeat_flush_interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Heartbeat flush failed: {e}")
+
+    async def flush(self) -> int:
+        """Write buffered heartbeats with one executemany UPDATE keyed by node id"""
+        if not self.pending:
+            return 0
+        batch, self.pending = self.pending, {}
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(update(Node), list(batch.values()))
+                await db.commit()
+        except Exception:
+            # Keep the batch for the next flush unless newer heartbeats replaced it
+            for node_id, values in batch.items():
+                self.pending.setdefault(node_id, values)
+            raise
+        return len(batch)
+
+
+# Global heartbeat buffer
+heartbeats = HeartbeatBuffer()
+
+registry.gauge("controller_heartbeats_pending", "Heartbeats buffered for the next flush",
+               lambda: len(heartbeats.pending))
@@ -0,0 +1,65 @@
+from typing import Dict, List, Optional
+from sqlalchemy import select
+from app.database import AsyncSessionLocal, Instance
+from app.models import AgentEvent
+from app.scheduler import capacity_index, Placement, ACTIVE_STATUSES
+from app.events import broker
+from app.metrics import registry
+
+agent_events = registry.counter("controller_agent_events_total", "Instance events pushed by agents", ("type",))
+agent_events_dropped = registry.counter(
+    "controller_agent_events_dropped_total", "Events agents discarded because their push buffer was full"
+)
+
+EXIT_EVENTS = ("stopped", "exited", "oom_killed")
+
+
+def exit_status(event: AgentEvent) -> str:
+    if event.type == "stopped" or (event.type == "exited" and event.exit_code in (0, None)):
+        return "stopped"
+    return "error"
+
+
+async def apply_events(node_id: str, events: List[AgentEvent], dropped: int = 0) -> int:
+    """Apply a batch of agent events in one transaction; returns the number of rows changed
+
+    Only rows of this node move, and only out of states the event can explain:
+    rows being stopped belong to their stop operation, and instances the
+    controller doesn't know are left for the reconciler to adopt.
+    """
+    if dropped:
+        agent_events_dropped.inc(dropped)
+    if not events:
+        return 0
+
+    # Port of each instance whose capacity changes once the transaction commits
+    ports: Dict[str, Optional[int]] = {}
+    async with AsyncSessionLocal() as db:
+        instances = {instance.id: instance for instance in (await db.execute(
+            select(Instance).where(Instance.node_id == node_id,
+                                   Instance.id.in_({event.instance_id for event in events}))
+        )).scalars()}
+        for event in sorted(events, key=lambda event: event.seq):
+            agent_events.labels(event.type).inc()
+            instance = instances.get(event.instance_id)
+            if instance is None:
+                continue
+            if event.type == "started" and instance.status == "starting":
+                instance.status = "running"
+                instance.container_id = event.container_id or instance.container_id
+                instance.mav_udp = event.mav_udp or instance.mav_udp
+                ports[instance.id] = instance.mav_udp
+            elif event.type in EXIT_EVENTS and instance.status in ("starting", "running"):
+                instance.status = exit_status(event)
+                ports[instance.id] = instance.mav_udp
+        changed = [instance for instance in instances.values() if instance in db.dirty]
+        await db.commit()
+
+    for instance in changed:
+        if instance.status in ACTIVE_STATUSES:
+            # Started: record the port the agent assigned; the instance keeps its reservation
+            capacity_index.confirm(Placement(node_id, None), ports.get(instance.id))
+        else:
+            capacity_index.release(node_id, ports.get(instance.id))
+        broker.publish_instance(instance)
+    return len(changed)
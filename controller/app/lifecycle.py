@@ -0,0 +1,222 @@
+import asyncio
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import Node, Instance
+from app.models import StartRequest, BulkStartItem, BulkItemResult, GroupStartRequest
+from app.agent_client import agent_client, agent_url_for
+from app.events import broker
+from app.scheduler import capacity_index, Placement, PlacementPolicy, PlacementError, ACTIVE_STATUSES
+from app.config import settings
+
+
+def build_agent_request(body: StartRequest) -> Dict:
+    """Agent /agent/start payload for a start request"""
+    return {
+        # Generate instance name if not provided
+        "name": body.name or f"sim-{uuid.uuid4().hex[:6]}",
+        "model": body.model,
+        "vehicle_type": body.vehicle_type,
+        "mav_udp": body.mav_udp
+    }
+
+
+def instance_from_response(node_id: str, agent_request: Dict, response: Dict) -> Instance:
+    """Instance row for an instance the agent reported as started"""
+    return Instance(
+        id=response.get("instance_id", str(uuid.uuid4())),
+        node_id=node_id,
+        container_id=response.get("container_id"),
+        name=agent_request["name"],
+        vehicle_type=agent_request["vehicle_type"],
+        model=agent_request["model"],
+        mav_udp=response.get("mav_udp"),
+        status="running"
+    )
+
+
+class FanOutLimiter:
+    """Bounds concurrent agent calls globally and per node across all bulk requests"""
+
+    def __init__(self, max_concurrency: int, max_per_node: int):
+        self.max_per_node = max_per_node
+        self.global_slots = asyncio.Semaphore(max_concurrency)
+        self.node_slots: Dict[str, asyncio.Semaphore] = {}
+
+    async def run(self, node_id: str, coro_fn, *args):
+        node_slots = self.node_slots.get(node_id)
+        if node_slots is None:
+            node_slots = self.node_slots[node_id] = asyncio.Semaphore(self.max_per_node)
+        # Take the node slot first so a busy node doesn't hold global slots while waiting
+        async with node_slots:
+            async with self.global_slots:
+                return await coro_fn(*args)
+
+
+fan_out = FanOutLimiter(settings.bulk_max_concurrency, settings.bulk_max_per_node)
+
+
+async def bulk_start(items: List[BulkStartItem], policy: PlacementPolicy, db: AsyncSession) -> List[BulkItemResult]:
+    """Start many instances concurrently and record them in one transaction
+
+    Items with a node_id go to that node, the rest are placed by the scheduler.
+    """
+    await capacity_index.ensure_loaded(db)
+    results: List[Optional[BulkItemResult]] = [None] * len(items)
+
+    pinned_ids = {item.node_id for item in items if item.node_id}
+    pinned_nodes = {
+        node.id: node for node in (
+            await db.execute(select(Node).where(Node.id.in_(pinned_ids)))
+        ).scalars()
+    } if pinned_ids else {}
+
+    # Resolve every placement before the first await so the batch sees a consistent index
+    targets: List[Tuple[int, str, str, Optional[Placement], Dict]] = []
+    for index, item in enumerate(items):
+        if item.node_id:
+            node = pinned_nodes.get(item.node_id)
+            if node is None or node.status != "online":
+                results[index] = BulkItemResult(
+                    index=index, status="error", node_id=item.node_id,
+                    error="Node not found" if node is None else "Node is not online"
+                )
+                continue
+            targets.append((index, node.id, node.address, None, build_agent_request(item)))
+        else:
+            try:
+                placement = capacity_index.reserve(policy, item.tags, item.mav_udp)
+            except PlacementError as e:
+                results[index] = BulkItemResult(index=index, status="error", error=str(e))
+                continue
+            targets.append((index, placement.node_id, placement.address, placement, build_agent_request(item)))
+
+    async def start_one(index: int, node_id: str, address: str, placement: Optional[Placement],
+                        agent_request: Dict):
+        try:
+            response = await fan_out.run(
+                node_id, agent_client.start_instance, agent_url_for(address), agent_request
+            )
+        except Exception as e:
+            if placement:
+                capacity_index.release(node_id, placement.mav_udp)
+            results[index] = BulkItemResult(index=index, status="error", node_id=node_id, error=str(e))
+            return None
+
+        if placement:
+            capacity_index.confirm(placement, response.get("mav_udp"))
+        else:
+            capacity_index.add_instance(node_id, response.get("mav_udp"))
+        instance = instance_from_response(node_id, agent_request, response)
+        results[index] = BulkItemResult(
+            index=index, status="started", node_id=node_id, instance_id=instance.id,
+            container_id=instance.container_id, name=instance.name, mav_udp=instance.mav_udp
+        )
+        return instance
+
+    started = await asyncio.gather(*(start_one(*target) for target in targets))
+
+    rows = [instance for instance in started if instance is not None]
+    if rows:
+        db.add_all(rows)
+        await db.commit()
+        for instance in rows:
+            broker.publish_instance(instance)
+    return results
+
+
+async def group_start(body: GroupStartRequest, policy: PlacementPolicy, db: AsyncSession) -> List[BulkItemResult]:
+    """Start a density group: body.count vehicles in one container on one node
+
+    Each vehicle gets its own instance row, tied together by group_id, and
+    reserves density_vehicle_weight of an instance's CPU and memory.
+    Raises PlacementError if no node fits and AgentError if the agent fails;
+    a group the agent started after the call timed out is adopted by the
+    reconciler.
+    """
+    await capacity_index.ensure_loaded(db)
+    placement = capacity_index.reserve_group(policy, body.count, body.tags, body.node_id)
+    agent_request = build_agent_request(body)
+    agent_request.pop("mav_udp")
+    agent_request.update({
+        "count": body.count,
+        "group_id": str(uuid.uuid4()),
+        # Assigned here so a retried call maps to the same vehicles
+        "instance_ids": [str(uuid.uuid4()) for _ in range(body.count)]
+    })
+    try:
+        vehicles = await agent_client.start_group(
+            agent_url_for(placement.address), agent_request, timeout=settings.agent_start_timeout
+        )
+    except Exception:
+        capacity_index.release_group(placement.node_id, body.count)
+        raise
+
+    capacity_index.confirm_group(placement.node_id, [v["mav_udp"] for v in vehicles if v.get("mav_udp")])
+    rows = []
+    for vehicle in vehicles:
+        instance = instance_from_response(placement.node_id, {**agent_request, "name": vehicle["name"]}, vehicle)
+        instance.group_id = vehicle.get("group_id") or agent_request["group_id"]
+        rows.append(instance)
+    db.add_all(rows)
+    await db.commit()
+    for instance in rows:
+        broker.publish_instance(instance)
+    return [
+        BulkItemResult(
+            index=index, status="started", node_id=instance.node_id, instance_id=instance.id,
+            container_id=instance.container_id, name=instance.name, mav_udp=instance.mav_udp
+        )
+        for index, instance in enumerate(rows)
+    ]
+
+
+async def bulk_stop(instances: List[Instance], db: AsyncSession) -> List[BulkItemResult]:
+    """Stop many instances concurrently and mark them stopped in one transaction"""
+    await capacity_index.ensure_loaded(db)
+    node_ids = {instance.node_id for instance in instances}
+    nodes = {
+        node.id: node for node in (
+            await db.execute(select(Node).where(Node.id.in_(node_ids)))
+        ).scalars()
+    } if node_ids else {}
+
+    async def stop_one(index: int, instance: Instance) -> BulkItemResult:
+        result = BulkItemResult(
+            index=index, status="error", node_id=instance.node_id, instance_id=instance.id,
+            container_id=instance.container_id, name=instance.name, mav_udp=instance.mav_udp
+        )
+        node = nodes.get(instance.node_id)
+        if node is None:
+            result.error = "Node not found"
+            return result
+        try:
+            await fan_out.run(node.id, agent_client.stop_instance, agent_url_for(node.address), {
+                "container_id": instance.container_id,
+                "instance_id": instance.id
+            })
+        except Exception as e:
+            result.error = str(e)
+            return result
+        result.status = "stopped"
+        return result
+
+    results = await asyncio.gather(*(stop_one(i, inst) for i, inst in enumerate(instances)))
+
+    now = datetime.utcnow()
+    stopped = False
+    for instance, result in zip(instances, results):
+        if result.status == "stopped":
+            if instance.status in ACTIVE_STATUSES:
+                capacity_index.release(instance.node_id, instance.mav_udp)
+            instance.status = "stopped"
+            instance.updated_at = now
+            stopped = True
+    if stopped:
+        await db.commit()
+        for instance, result in zip(instances, results):
+            if result.status == "stopped":
+                broker.publish_instance(instance)
+    return list(results)
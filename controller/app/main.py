@@ -1,29 +1,87 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from contextlib import asynccontextmanager
+from pydantic import ValidationError
 from typing import List, Optional
+import asyncio
 import uuid
 import json
 from datetime import datetime, timedelta
 
-from app.database import get_db, Node, Instance, User, engine
+from app.database import (
+    get_db, AsyncSessionLocal, Node, Instance, InstanceArchive, Operation, User, engine, FLEET_RESOURCES
+)
 from app.models import (
-    NodeRegister, NodeResponse, StartRequest, StopRequest, InstanceResponse,
-    UserCreate, UserResponse, Token, LoginRequest
+    NodeRegister, NodeResponse, HeartbeatRequest, StartRequest, StopRequest, InstanceResponse,
+    UserCreate, UserResponse, Token, LoginRequest, ScheduleRequest,
+    BulkStartItem, BulkStartRequest, BulkStopRequest, BulkResponse, GroupStartRequest,
+    FleetSummary, StatusCounts, OperationResponse, ArchivedInstanceResponse, AgentEventBatch
 )
 from app.auth import (
     create_access_token, authenticate_user, get_current_active_user,
-    get_password_hash, verify_password
+    get_password_hash_async, get_user_by_username, auth_cache_stats, get_stream_user
+)
+from app.agent_client import agent_client, agent_url_for, AgentError
+from app.scheduler import capacity_index, get_policy, Placement, PlacementError, ACTIVE_STATUSES
+from app.lifecycle import bulk_start, bulk_stop, group_start
+from app.operations import (
+    operation_queue, operation_response, find_operation, submit_start, submit_stop,
+    DuplicateOperation
+)
+from app.reconciler import reconciler
+from app.retention import archiver
+from app.ingest import apply_events
+from app.events import broker, node_response, format_sse
+from app.heartbeats import heartbeats
+from app.serializers import (
+    NODE_COLUMNS, INSTANCE_COLUMNS, ARCHIVE_COLUMNS, node_row, instance_row, archive_row, json_response,
+    decode_body
 )
-from app.agent_client import agent_client
+from app.snapshot import fleet_versions, snapshot_cache
+from app.tags import tagged_node_ids, sync_node_tags
+from app.metrics import registry, MetricsMiddleware, loop_lag_monitor
+from app.pagination import encode_cursor, decode_cursor, after_created, page_limit, split_values
 from app.config import settings
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application lifespan manager"""
+    # Startup
+    if settings.metrics_enabled:
+        loop_lag_monitor.start()
+    heartbeats.start()
+    fleet_versions.start()
+    operation_queue.start()
+    await operation_queue.recover()
+    if settings.reconcile_enabled:
+        reconciler.start()
+    if settings.archive_enabled:
+        archiver.start()
+    
+    yield
+
+    # Shutdown - stop background work and close pooled agent connections
+    await reconciler.stop()
+    await archiver.stop()
+    await operation_queue.stop()
+    await heartbeats.stop()
+    await fleet_versions.stop()
+    await loop_lag_monitor.stop()
+    await broker.stop()
+    await agent_client.aclose()
+
+
 # Create FastAPI app
 app = FastAPI(
     title="PX4 Cloud Controller",
     description="Central controller for managing PX4 SITL instances on Azure VMs",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -33,25 +91,29 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Location", "ETag"],
 )
 
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+
 security = HTTPBearer()
 
 
 # --- Authentication Endpoints ---
 
 @app.post("/auth/register", response_model=UserResponse)
-async def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     """Register a new user"""
     # Check if user already exists
-    db_user = db.query(User).filter(User.username == user.username).first()
+    db_user = await get_user_by_username(db, user.username)
     if db_user:
         raise HTTPException(
             status_code=400,
             detail="Username already registered"
         )
     
-    db_user = db.query(User).filter(User.email == user.email).first()
+    db_user = (await db.execute(select(User).where(User.email == user.email))).scalars().first()
     if db_user:
         raise HTTPException(
             status_code=400,
@@ -59,7 +121,7 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     db_user = User(
         id=str(uuid.uuid4()),
         username=user.username,
@@ -67,15 +129,15 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
         hashed_password=hashed_password
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 
 @app.post("/auth/login", response_model=Token)
-async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
+async def login(login_data: LoginRequest, db: AsyncSession = Depends(get_db)):
     """Login and get access token"""
-    user = authenticate_user(db, login_data.username, login_data.password)
+    user = await authenticate_user(db, login_data.username, login_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -93,7 +155,7 @@ async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
 # --- Node Management ---
 
 @app.post("/api/v1/register")
-async def register_node(reg: NodeRegister, db: Session = Depends(get_db)):
+async def register_node(reg: NodeRegister, db: AsyncSession = Depends(get_db)):
     """Register a worker node with the controller"""
     if reg.api_key != settings.agent_api_key:
         raise HTTPException(
@@ -102,7 +164,8 @@ async def register_node(reg: NodeRegister, db: Session = Depends(get_db)):
         )
     
     # Check if node already exists
-    existing_node = db.query(Node).filter(Node.id == reg.node_id).first()
+    existing_node = await db.get(Node, reg.node_id)
+    node = existing_node
     
     if existing_node:
         # Update existing node
@@ -127,70 +190,167 @@ async def register_node(reg: NodeRegister, db: Session = Depends(get_db)):
             disk_gb=reg.disk_gb
         )
         db.add(new_node)
+        node = new_node
     
-    db.commit()
+    await sync_node_tags(db, reg.node_id, reg.tags or [], new=existing_node is None)
+    await db.commit()
+    # The registration supersedes any buffered heartbeat
+    heartbeats.forget(node.id)
+    await capacity_index.ensure_loaded(db)
+    capacity_index.update_node(node)
+    broker.publish_node(node)
     return {"status": "registered", "node_id": reg.node_id}
 
 
+@app.post("/api/v1/nodes/{node_id}/heartbeat", status_code=204)
+async def node_heartbeat(node_id: str, hb: HeartbeatRequest, db: AsyncSession = Depends(get_db)):
+    """Record that a node is alive, with its current load
+
+    Written to the database in batches; returns 404 if the node must register first.
+    """
+    if hb.api_key != settings.agent_api_key:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid agent API key"
+        )
+    
+    # Another worker may have handled the registration
+    capacity = await capacity_index.ensure_node(db, node_id)
+    if capacity is None:
+        raise HTTPException(status_code=404, detail="Node not registered")
+    
+    was_online = capacity.status == "online"
+    values = heartbeats.record(node_id, hb.running_instances, hb.cpu_percent, hb.memory_percent)
+    capacity_index.heartbeat(node_id, values)
+    if not was_online:
+        broker.publish("node", node_id, {"status": "online", "last_seen": values["last_seen"].isoformat()})
+    return Response(status_code=204)
+
+
+@app.post("/api/v1/nodes/{node_id}/events")
+async def ingest_node_events(node_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+    """Apply a batch of instance events (and a load sample) pushed by an agent
+
+    The body may be gzip-compressed (Content-Encoding: gzip). The whole batch
+    is applied in one transaction; returns 404 if the node must register first.
+    """
+    try:
+        body = decode_body(await request.body(), request.headers.get("content-encoding", ""),
+                           settings.event_batch_max_bytes)
+        batch = AgentEventBatch.model_validate_json(body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if batch.api_key != settings.agent_api_key:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid agent API key"
+        )
+    
+    capacity = await capacity_index.ensure_node(db, node_id)
+    if capacity is None:
+        raise HTTPException(status_code=404, detail="Node not registered")
+    
+    # A batch doubles as a heartbeat
+    was_online = capacity.status == "online"
+    load = batch.load.model_dump() if batch.load else {}
+    values = heartbeats.record(node_id, **load)
+    capacity_index.heartbeat(node_id, values)
+    if not was_online:
+        broker.publish("node", node_id, {"status": "online", "last_seen": values["last_seen"].isoformat()})
+    
+    changed = await apply_events(node_id, batch.events, batch.dropped)
+    return {"accepted": len(batch.events), "changed": changed}
+
+
 @app.get("/api/v1/nodes", response_model=List[NodeResponse])
 async def list_nodes(
+    request: Request,
+    status_filter: Optional[str] = Query(None, alias="status", description="Comma-separated statuses"),
+    tag: Optional[str] = Query(None, description="Comma-separated tags the node must all carry"),
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """List all registered nodes"""
-    nodes = db.query(Node).all()
-    return [
-        NodeResponse(
-            id=node.id,
-            name=node.name,
-            address=node.address,
-            tags=json.loads(node.tags) if node.tags else [],
-            last_seen=node.last_seen,
-            status=node.status,
-            cpu_cores=node.cpu_cores,
-            memory_gb=node.memory_gb,
-            disk_gb=node.disk_gb
-        )
-        for node in nodes
-    ]
+    """List registered nodes, ordered by id
+
+    When more nodes match than fit on a page, the X-Next-Cursor response
+    header holds the cursor for the next page. Answers 304 when If-None-Match
+    holds the current ETag.
+    """
+    limit = page_limit(limit)
+    versions = await snapshot_cache.versions(request, ("nodes",))
+    cached = await snapshot_cache.lookup(request, versions)
+    if cached:
+        return cached
+    
+    query = select(*NODE_COLUMNS)
+    statuses = split_values(status_filter)
+    if statuses:
+        query = query.where(Node.status.in_(statuses))
+    tags = split_values(tag)
+    if tags:
+        query = query.where(Node.id.in_(tagged_node_ids(tags)))
+    if cursor:
+        try:
+            (after_id,) = decode_cursor(cursor, 1)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        query = query.where(Node.id > after_id)
+    
+    # Plain column rows serialized straight to bytes; no ORM objects or per-row validation
+    rows = (await db.execute(query.order_by(Node.id).limit(limit + 1))).mappings().all()
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1]["id"])
+    
+    return await snapshot_cache.store(request, versions, [node_row(row) for row in rows], headers)
 
 
 @app.get("/api/v1/nodes/{node_id}", response_model=NodeResponse)
 async def get_node(
     node_id: str,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get details of a specific node"""
-    node = db.query(Node).filter(Node.id == node_id).first()
+    node = await db.get(Node, node_id)
     if not node:
         raise HTTPException(status_code=404, detail="Node not found")
     
-    return NodeResponse(
-        id=node.id,
-        name=node.name,
-        address=node.address,
-        tags=json.loads(node.tags) if node.tags else [],
-        last_seen=node.last_seen,
-        status=node.status,
-        cpu_cores=node.cpu_cores,
-        memory_gb=node.memory_gb,
-        disk_gb=node.disk_gb
-    )
+    return node_response(node)
 
 
 # --- Instance Management ---
 
-@app.post("/api/v1/nodes/{node_id}/start")
+def accepted(operation: Operation) -> JSONResponse:
+    """202 response pointing the client at an operation to poll"""
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=operation_response(operation).model_dump(mode="json"),
+        headers={"Location": f"/api/v1/operations/{operation.id}"}
+    )
+
+
+@app.post("/api/v1/nodes/{node_id}/start", status_code=202, response_model=OperationResponse)
 async def start_instance(
     node_id: str,
     body: StartRequest,
+    idempotency_key: Optional[str] = Header(None),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Start a PX4 instance on a specific node"""
+    """Queue a PX4 instance start on a specific node"""
+    existing = await find_operation(db, current_user, idempotency_key)
+    if existing:
+        return accepted(existing)
+    
     # Find node
-    node = db.query(Node).filter(Node.id == node_id).first()
+    node = await db.get(Node, node_id)
     if not node:
         raise HTTPException(status_code=404, detail="Node not found")
     
@@ -198,111 +358,449 @@ async def start_instance(
     if node.status != "online":
         raise HTTPException(status_code=400, detail="Node is not online")
     
-    # Generate instance name if not provided
-    instance_name = body.name or f"sim-{uuid.uuid4().hex[:6]}"
+    await capacity_index.ensure_loaded(db)
+    capacity_index.add_instance(node.id, body.mav_udp)
+    placement = Placement(node.id, node.address, body.mav_udp)
     
-    # Prepare request for agent
-    agent_request = {
-        "name": instance_name,
-        "model": body.model,
-        "vehicle_type": body.vehicle_type,
-        "mav_udp": body.mav_udp
-    }
+    try:
+        operation = await submit_start(db, current_user, body, placement, idempotency_key)
+    except DuplicateOperation as e:
+        capacity_index.release(node.id, body.mav_udp)
+        operation = e.operation
+    except Exception:
+        capacity_index.release(node.id, body.mav_udp)
+        raise
+    return accepted(operation)
+
+
+@app.post("/api/v1/instances/start", status_code=202, response_model=OperationResponse)
+async def schedule_instance(
+    body: ScheduleRequest,
+    idempotency_key: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Queue a PX4 instance start on a node chosen by the controller"""
+    existing = await find_operation(db, current_user, idempotency_key)
+    if existing:
+        return accepted(existing)
     
     try:
-        # Call agent to start instance
-        agent_url = f"https://{node.address}:8443"
-        response = await agent_client.start_instance(agent_url, agent_request)
-        
-        # Create instance record
-        instance_id = response.get("instance_id", str(uuid.uuid4()))
-        new_instance = Instance(
-            id=instance_id,
-            node_id=node_id,
-            container_id=response.get("container_id"),
-            name=instance_name,
-            vehicle_type=body.vehicle_type,
-            model=body.model,
-            mav_udp=response.get("mav_udp"),
-            status="running"
-        )
-        db.add(new_instance)
-        db.commit()
-        
-        return response
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to start instance: {str(e)}")
+        policy = get_policy(body.policy)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    await capacity_index.ensure_loaded(db)
+    
+    # Reserve capacity up front so concurrent starts can't oversubscribe a node
+    try:
+        placement = capacity_index.reserve(policy, body.tags, body.mav_udp)
+    except PlacementError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    try:
+        operation = await submit_start(db, current_user, body, placement, idempotency_key)
+    except DuplicateOperation as e:
+        capacity_index.release(placement.node_id, placement.mav_udp)
+        operation = e.operation
+    except Exception:
+        capacity_index.release(placement.node_id, placement.mav_udp)
+        raise
+    return accepted(operation)
 
 
-@app.post("/api/v1/nodes/{node_id}/stop")
+@app.post("/api/v1/nodes/{node_id}/stop", status_code=202, response_model=OperationResponse)
 async def stop_instance(
     node_id: str,
     body: StopRequest,
+    idempotency_key: Optional[str] = Header(None),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Stop a PX4 instance on a specific node"""
+    """Queue a PX4 instance stop on a specific node"""
+    existing = await find_operation(db, current_user, idempotency_key)
+    if existing:
+        return accepted(existing)
+    
     # Find node
-    node = db.query(Node).filter(Node.id == node_id).first()
+    node = await db.get(Node, node_id)
     if not node:
         raise HTTPException(status_code=404, detail="Node not found")
     
     # Find instance
     instance = None
     if body.instance_id:
-        instance = db.query(Instance).filter(Instance.id == body.instance_id).first()
+        instance = await db.get(Instance, body.instance_id)
     elif body.container_id:
-        instance = db.query(Instance).filter(Instance.container_id == body.container_id).first()
+        instance = (await db.execute(
+            select(Instance).where(Instance.container_id == body.container_id)
+        )).scalars().first()
     
     if not instance:
         raise HTTPException(status_code=404, detail="Instance not found")
     
+    await capacity_index.ensure_loaded(db)
+    
+    try:
+        operation = await submit_stop(db, current_user, node, instance, idempotency_key)
+    except DuplicateOperation as e:
+        operation = e.operation
+    return accepted(operation)
+
+
+@app.get("/api/v1/operations/{operation_id}", response_model=OperationResponse)
+async def get_operation(
+    operation_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get the status of a queued start/stop operation"""
+    operation = await db.get(Operation, operation_id)
+    if not operation:
+        raise HTTPException(status_code=404, detail="Operation not found")
+    return operation_response(operation)
+
+
+def bulk_response(results) -> BulkResponse:
+    succeeded = len([r for r in results if r.status != "error"])
+    return BulkResponse(
+        requested=len(results),
+        succeeded=succeeded,
+        failed=len(results) - succeeded,
+        results=results
+    )
+
+
+@app.post("/api/v1/instances/bulk/start", response_model=BulkResponse)
+async def bulk_start_instances(
+    body: BulkStartRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Start many PX4 instances concurrently"""
+    if body.instances is not None:
+        items = body.instances
+    elif body.count is not None:
+        template = body.template or BulkStartItem()
+        items = [
+            template.model_copy(update={"name": f"{template.name}-{i}" if template.name else None})
+            for i in range(body.count)
+        ]
+    else:
+        raise HTTPException(status_code=400, detail="Provide either instances or count")
+    
+    if not items:
+        raise HTTPException(status_code=400, detail="No instances requested")
+    if len(items) > settings.bulk_max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.bulk_max_items} instances per request"
+        )
+    
     try:
-        # Call agent to stop instance
-        agent_url = f"https://{node.address}:8443"
-        response = await agent_client.stop_instance(agent_url, {
-            "container_id": instance.container_id,
-            "instance_id": instance.id
-        })
-        
-        # Update instance status
-        instance.status = "stopped"
-        instance.updated_at = datetime.utcnow()
-        db.commit()
-        
-        return response
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to stop instance: {str(e)}")
+        policy = get_policy(body.policy)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    results = await bulk_start(items, policy, db)
+    return bulk_response(results)
+
+
+@app.post("/api/v1/instances/group", response_model=BulkResponse)
+async def start_instance_group(
+    body: GroupStartRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Start several PX4 vehicles in one container sharing a simulator world"""
+    if not 1 <= body.count <= settings.density_max_vehicles:
+        raise HTTPException(
+            status_code=400,
+            detail=f"count must be between 1 and {settings.density_max_vehicles}"
+        )
+    if body.node_id and not await db.get(Node, body.node_id):
+        raise HTTPException(status_code=404, detail="Node not found")
+    
+    try:
+        policy = get_policy(body.policy)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        results = await group_start(body, policy, db)
+    except PlacementError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except AgentError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    return bulk_response(results)
+
+
+@app.post("/api/v1/instances/bulk/stop", response_model=BulkResponse)
+async def bulk_stop_instances(
+    body: BulkStopRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Stop every instance matching a filter"""
+    if not any([body.node_id, body.model, body.status, body.name_prefix]):
+        raise HTTPException(status_code=400, detail="At least one filter is required")
+    
+    query = select(Instance)
+    if body.node_id:
+        query = query.where(Instance.node_id == body.node_id)
+    if body.model:
+        query = query.where(Instance.model == body.model)
+    if body.status:
+        query = query.where(Instance.status == body.status)
+    else:
+        query = query.where(Instance.status.in_(ACTIVE_STATUSES))
+    if body.name_prefix:
+        query = query.where(Instance.name.startswith(body.name_prefix, autoescape=True))
+    
+    instances = (await db.execute(query.limit(settings.bulk_max_items))).scalars().all()
+    results = await bulk_stop(instances, db)
+    return bulk_response(results)
 
 
 @app.get("/api/v1/instances", response_model=List[InstanceResponse])
 async def list_instances(
+    request: Request,
+    status_filter: Optional[str] = Query(None, alias="status", description="Comma-separated statuses"),
+    node_id: Optional[str] = None,
+    model: Optional[str] = None,
+    vehicle_type: Optional[str] = None,
+    tag: Optional[str] = Query(None, description="Only instances on nodes carrying all these tags (comma-separated)"),
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """List instances, oldest first
+
+    When more instances match than fit on a page, the X-Next-Cursor
+    response header holds the cursor for the next page. Answers 304 when
+    If-None-Match holds the current ETag.
+    """
+    limit = page_limit(limit)
+    versions = await snapshot_cache.versions(request, ("instances", "nodes") if tag else ("instances",))
+    cached = await snapshot_cache.lookup(request, versions)
+    if cached:
+        return cached
+    
+    query = select(*INSTANCE_COLUMNS)
+    statuses = split_values(status_filter)
+    if statuses:
+        query = query.where(Instance.status.in_(statuses))
+    if node_id:
+        query = query.where(Instance.node_id == node_id)
+    if model:
+        query = query.where(Instance.model == model)
+    if vehicle_type:
+        query = query.where(Instance.vehicle_type == vehicle_type)
+    tags = split_values(tag)
+    if tags:
+        query = query.where(Instance.node_id.in_(tagged_node_ids(tags)))
+    if cursor:
+        try:
+            query = query.where(after_created(Instance.created_at, Instance.id, cursor))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    query = query.order_by(Instance.created_at, Instance.id).limit(limit + 1)
+    rows = (await db.execute(query)).all()
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return await snapshot_cache.store(request, versions, [instance_row(row) for row in rows], headers)
+
+
+@app.get("/api/v1/summary", response_model=FleetSummary)
+async def fleet_summary(
+    request: Request,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """List all instances"""
-    instances = db.query(Instance).all()
-    return instances
+    """Node and instance counts by status"""
+    versions = await snapshot_cache.versions(request, FLEET_RESOURCES)
+    cached = await snapshot_cache.lookup(request, versions)
+    if cached:
+        return cached
+    
+    node_counts = dict((await db.execute(
+        select(Node.status, func.count()).group_by(Node.status)
+    )).all())
+    instance_counts = dict((await db.execute(
+        select(Instance.status, func.count()).group_by(Instance.status)
+    )).all())
+    summary = FleetSummary(
+        nodes=StatusCounts(total=sum(node_counts.values()), by_status=node_counts),
+        instances=StatusCounts(total=sum(instance_counts.values()), by_status=instance_counts)
+    )
+    return await snapshot_cache.store(request, versions, summary.model_dump(mode="json"))
+
+
+@app.get("/api/v1/instances/archive", response_model=List[ArchivedInstanceResponse])
+async def list_archived_instances(
+    request: Request,
+    status_filter: Optional[str] = Query(None, alias="status", description="Comma-separated statuses"),
+    node_id: Optional[str] = None,
+    model: Optional[str] = None,
+    vehicle_type: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """List archived (stopped or failed) instances, oldest first
+
+    Paginated with the X-Next-Cursor response header like the instance list.
+    """
+    limit = page_limit(limit)
+    query = select(*ARCHIVE_COLUMNS)
+    statuses = split_values(status_filter)
+    if statuses:
+        query = query.where(InstanceArchive.status.in_(statuses))
+    if node_id:
+        query = query.where(InstanceArchive.node_id == node_id)
+    if model:
+        query = query.where(InstanceArchive.model == model)
+    if vehicle_type:
+        query = query.where(InstanceArchive.vehicle_type == vehicle_type)
+    if cursor:
+        try:
+            query = query.where(after_created(InstanceArchive.created_at, InstanceArchive.id, cursor))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    query = query.order_by(InstanceArchive.created_at, InstanceArchive.id).limit(limit + 1)
+    rows = (await db.execute(query)).all()
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return await json_response(request, [archive_row(row) for row in rows], headers=headers)
+
+
+@app.get("/api/v1/instances/archive/{instance_id}", response_model=ArchivedInstanceResponse)
+async def get_archived_instance(
+    instance_id: str,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get an archived instance"""
+    row = (await db.execute(select(*ARCHIVE_COLUMNS).where(InstanceArchive.id == instance_id))).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Instance not found in archive")
+    
+    return archive_row(row)
 
 
 @app.get("/api/v1/instances/{instance_id}", response_model=InstanceResponse)
 async def get_instance(
     instance_id: str,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get details of a specific instance"""
-    instance = db.query(Instance).filter(Instance.id == instance_id).first()
+    instance = await db.get(Instance, instance_id)
     if not instance:
         raise HTTPException(status_code=404, detail="Instance not found")
     
     return instance
 
 
+# --- Live Updates ---
+
+async def fleet_snapshot() -> dict:
+    """Nodes and non-stopped instances, as sent at the start of an event stream"""
+    seq = broker.seq
+    async with AsyncSessionLocal() as db:
+        nodes = (await db.execute(select(*NODE_COLUMNS).order_by(Node.id))).mappings().all()
+        instances = (await db.execute(
+            select(*INSTANCE_COLUMNS).where(Instance.status != "stopped").order_by(Instance.created_at, Instance.id)
+        )).all()
+    return {
+        "seq": seq,
+        "nodes": [node_row(row) for row in nodes],
+        "instances": [instance_row(row) for row in instances]
+    }
+
+
+@app.get("/api/v1/events")
+async def stream_events(current_user: User = Depends(get_stream_user)):
+    """Server-Sent Events stream of node and instance changes
+
+    Sends a `snapshot` event first, then `node` / `instance` events whose `data`
+    fields are merged into the entity with that id. Changes queued for a slow
+    client are coalesced per entity; a client that falls too far behind gets a
+    fresh `snapshot` instead.
+    """
+    subscriber = broker.subscribe()
+
+    async def stream():
+        try:
+            yield format_sse("snapshot", await fleet_snapshot())
+            while True:
+                try:
+                    await asyncio.wait_for(subscriber.wakeup.wait(), timeout=settings.events_keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if subscriber.resync:
+                    subscriber.resync = False
+                    subscriber.drain()
+                    yield format_sse("snapshot", await fleet_snapshot())
+                    continue
+                for event in subscriber.drain():
+                    yield format_sse(event["type"], event)
+        finally:
+            broker.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# --- Diagnostics ---
+
+@app.get("/api/v1/agents/circuits")
+async def agent_circuits(
+    all_nodes: bool = Query(False, alias="all", description="Include nodes whose breaker is closed"),
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Circuit breaker state of each node's agent, as seen by this controller worker"""
+    await capacity_index.ensure_loaded(db)
+    circuits = []
+    for capacity in capacity_index.nodes.values():
+        breaker = agent_client.breakers.get(agent_url_for(capacity.address))
+        if breaker is None and not all_nodes:
+            continue
+        state = breaker.snapshot() if breaker else {"state": "closed", "failures": 0, "in_flight": 0, "retry_in": 0.0}
+        if state["state"] != "closed" or all_nodes:
+            circuits.append({"node_id": capacity.node_id, "address": capacity.address, **state})
+    return circuits
+
+
+@app.get("/api/v1/cache/stats")
+async def cache_stats(current_user: User = Depends(get_current_active_user)):
+    """Hit/miss counters of the in-process caches"""
+    return {"auth": auth_cache_stats(), "snapshot": snapshot_cache.stats()}
+
+
 # --- Health Check ---
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return Response(content=registry.expose(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
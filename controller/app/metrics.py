@@ -0,0 +1,396 @@
+import asyncio
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import event
+from app.config import settings
+
+# Seconds; covers sub-millisecond cache hits up to slow agent starts
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metric:
+    """A metric family whose labelled children are created once and then reused
+
+    Hot paths keep a reference to the child returned by labels(), so recording a
+    sample is an attribute update with no allocation.
+    """
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children: Dict[Tuple[str, ...], object] = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self._new_child()
+        return child
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def samples(self):
+        for values, child in list(self.children.items()):
+            yield f"{self.name}{format_labels(self.labelnames, values)} {format_value(child.value)}"
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def samples(self):
+        bucket_names = self.labelnames + ("le",)
+        for values, child in list(self.children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                labels = format_labels(bucket_names, values + (format_value(bound),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {format_value(child.sum)}"
+            yield f"{self.name}_count{labels} {child.count}"
+
+
+class Gauge(Metric):
+    """A gauge read from a callback at scrape time, so nothing is tracked per request"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], Optional[float]]):
+        super().__init__(name, documentation)
+        self.callback = callback
+
+    def samples(self):
+        value = self.callback()
+        if value is not None:
+            yield f"{self.name} {format_value(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, callback: Callable[[], Optional[float]]) -> Gauge:
+        return self.register(Gauge(name, documentation, callback))
+
+    def expose(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines: List[str] = []
+        for metric in list(self.metrics.values()):
+            try:
+                lines.extend(metric.expose())
+            except Exception as e:
+                # One broken gauge callback must not take down the whole scrape
+                print(f"Metric {metric.name} failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.histogram(
+    "controller_http_request_duration_seconds", "HTTP request latency by route",
+    ("method", "route")
+)
+http_requests = registry.counter(
+    "controller_http_requests_total", "HTTP responses by route and status code",
+    ("method", "route", "status")
+)
+http_request_db_queries = registry.histogram(
+    "controller_http_request_db_queries", "Database queries issued per HTTP request",
+    ("method", "route"), buckets=COUNT_BUCKETS
+)
+http_request_db_duration = registry.histogram(
+    "controller_http_request_db_seconds", "Time spent in database queries per HTTP request",
+    ("method", "route")
+)
+db_query_duration = registry.histogram(
+    "controller_db_query_duration_seconds", "Database query latency (all callers)"
+)
+agent_request_duration = registry.histogram(
+    "controller_agent_request_duration_seconds", "Agent RPC latency by agent and endpoint",
+    ("agent", "path")
+)
+agent_request_errors = registry.counter(
+    "controller_agent_request_errors_total", "Failed agent RPCs by agent, endpoint and kind",
+    ("agent", "path", "kind")
+)
+loop_lag = registry.histogram(
+    "controller_event_loop_lag_seconds", "How late the event loop ran a periodic timer"
+)
+
+
+class RouteMetrics:
+    """Children of the per-route metric families for one method + route"""
+
+    __slots__ = ("method", "route", "duration", "db_queries", "db_duration", "responses")
+
+    def __init__(self, method: str, route: str):
+        self.method = method
+        self.route = route
+        self.duration = http_request_duration.labels(method, route)
+        self.db_queries = http_request_db_queries.labels(method, route)
+        self.db_duration = http_request_db_duration.labels(method, route)
+        self.responses: Dict[int, CounterChild] = {}
+
+    def response(self, status_code: int) -> CounterChild:
+        counter = self.responses.get(status_code)
+        if counter is None:
+            counter = self.responses[status_code] = http_requests.labels(
+                self.method, self.route, str(status_code)
+            )
+        return counter
+
+
+class RequestStats:
+    """Database work done on behalf of the current request"""
+
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request against its route template
+
+    Children are allocated per (endpoint, method) the first time a route is hit,
+    so steady-state requests only do dict lookups and counter updates.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.routes: Dict[Tuple[Callable, str], RouteMetrics] = {}
+        self.route_paths: Dict[Callable, str] = {}
+        self.unmatched: Dict[str, RouteMetrics] = {}
+
+    def _route_metrics(self, scope) -> RouteMetrics:
+        method = scope["method"]
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            # 404s and CORS preflights: one shared series per method instead of one per path
+            metrics = self.unmatched.get(method)
+            if metrics is None:
+                metrics = self.unmatched[method] = RouteMetrics(method, "unmatched")
+            return metrics
+        metrics = self.routes.get((endpoint, method))
+        if metrics is None:
+            route = self.route_paths.get(endpoint)
+            if route is None:
+                route = self._find_route(scope, endpoint)
+            metrics = self.routes[(endpoint, method)] = RouteMetrics(method, route)
+        return metrics
+
+    def _find_route(self, scope, endpoint) -> str:
+        for route in scope["app"].routes:
+            if getattr(route, "endpoint", None) is endpoint:
+                self.route_paths[endpoint] = route.path
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_request.reset(token)
+            metrics = self._route_metrics(scope)
+            metrics.duration.observe(elapsed)
+            metrics.db_queries.observe(stats.queries)
+            metrics.db_duration.observe(stats.db_time)
+            metrics.response(status_code).inc()
+
+
+class AgentMetrics:
+    """Per-agent children, created when the controller first talks to an agent"""
+
+    __slots__ = ("agent", "durations", "errors")
+
+    def __init__(self, agent: str):
+        self.agent = agent
+        self.durations: Dict[str, HistogramChild] = {}
+        self.errors: Dict[Tuple[str, str], CounterChild] = {}
+
+    def duration(self, path: str) -> HistogramChild:
+        child = self.durations.get(path)
+        if child is None:
+            child = self.durations[path] = agent_request_duration.labels(self.agent, path)
+        return child
+
+    def error(self, path: str, kind: str) -> CounterChild:
+        key = (path, kind)
+        child = self.errors.get(key)
+        if child is None:
+            child = self.errors[key] = agent_request_errors.labels(self.agent, path, kind)
+        return child
+
+
+agent_metrics: Dict[str, AgentMetrics] = {}
+
+
+def for_agent(agent_url: str) -> AgentMetrics:
+    metrics = agent_metrics.get(agent_url)
+    if metrics is None:
+        metrics = agent_metrics[agent_url] = AgentMetrics(agent_url)
+    return metrics
+
+
+def instrument_engine(sync_engine):
+    """Count and time every query run through an engine"""
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_start
+        db_query_duration.observe(elapsed)
+        stats = current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+
+
+class LoopLagMonitor:
+    """Measures how late a periodic sleep wakes up; lag means something is blocking the loop"""
+
+    def __init__(self):
+        self.last_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        interval = settings.metrics_loop_lag_interval
+        child = loop_lag.labels()
+        while True:
+            due = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            self.last_lag = max(0.0, time.perf_counter() - due)
+            child.observe(self.last_lag)
+
+
+loop_lag_monitor = LoopLagMonitor()
+registry.gauge(
+    "controller_event_loop_lag_last_seconds", "Lag measured by the most recent loop timer",
+    lambda: loop_lag_monitor.last_lag
+)
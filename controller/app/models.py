@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from datetime import datetime
 
 
@@ -24,11 +24,44 @@ class NodeResponse(BaseModel):
     cpu_cores: int
     memory_gb: int
     disk_gb: int
+    running_instances: Optional[int] = None
+    cpu_percent: Optional[float] = None
+    memory_percent: Optional[float] = None
 
     class Config:
         from_attributes = True
 
 
+class HeartbeatRequest(BaseModel):
+    api_key: str
+    running_instances: Optional[int] = None
+    cpu_percent: Optional[float] = None  # 0-100
+    memory_percent: Optional[float] = None  # 0-100
+
+
+class AgentEvent(BaseModel):
+    seq: int
+    type: str  # started, stopped, exited, oom_killed
+    instance_id: str
+    time: Optional[float] = None  # Unix time on the agent
+    container_id: Optional[str] = None
+    mav_udp: Optional[int] = None
+    exit_code: Optional[int] = None
+
+
+class AgentLoad(BaseModel):
+    running_instances: Optional[int] = None
+    cpu_percent: Optional[float] = None
+    memory_percent: Optional[float] = None
+
+
+class AgentEventBatch(BaseModel):
+    api_key: str
+    events: List[AgentEvent] = []
+    dropped: int = 0  # Events the agent discarded because its buffer was full
+    load: Optional[AgentLoad] = None
+
+
 class StartRequest(BaseModel):
     vehicle_type: str = "copter"
     name: Optional[str] = None
@@ -36,6 +69,53 @@ class StartRequest(BaseModel):
     mav_udp: Optional[int] = None
 
 
+class ScheduleRequest(StartRequest):
+    tags: Optional[List[str]] = []  # Node must carry all of these tags
+    policy: Optional[str] = None  # Placement policy, defaults to settings.placement_policy
+
+
+class BulkStartItem(ScheduleRequest):
+    node_id: Optional[str] = None  # Pin to a node instead of automatic placement
+
+
+class BulkStartRequest(BaseModel):
+    instances: Optional[List[BulkStartItem]] = None
+    # Alternatively start `count` copies of `template`
+    count: Optional[int] = None
+    template: Optional[BulkStartItem] = None
+    policy: Optional[str] = None
+
+
+class GroupStartRequest(ScheduleRequest):
+    count: int  # Vehicles sharing one container and simulator world
+    node_id: Optional[str] = None  # Pin to a node instead of automatic placement
+
+
+class BulkStopRequest(BaseModel):
+    node_id: Optional[str] = None
+    model: Optional[str] = None
+    status: Optional[str] = None  # Defaults to starting and running instances
+    name_prefix: Optional[str] = None
+
+
+class BulkItemResult(BaseModel):
+    index: int
+    status: str  # started, stopped, error
+    node_id: Optional[str] = None
+    instance_id: Optional[str] = None
+    container_id: Optional[str] = None
+    name: Optional[str] = None
+    mav_udp: Optional[int] = None
+    error: Optional[str] = None
+
+
+class BulkResponse(BaseModel):
+    requested: int
+    succeeded: int
+    failed: int
+    results: List[BulkItemResult]
+
+
 class StopRequest(BaseModel):
     container_id: Optional[str] = None
     instance_id: Optional[str] = None
@@ -49,6 +129,7 @@ class InstanceResponse(BaseModel):
     vehicle_type: str
     model: str
     mav_udp: Optional[int]
+    group_id: Optional[str] = None
     status: str
     created_at: datetime
     updated_at: datetime
@@ -57,6 +138,32 @@ class InstanceResponse(BaseModel):
         from_attributes = True
 
 
+class ArchivedInstanceResponse(InstanceResponse):
+    archived_at: datetime
+
+
+class OperationResponse(BaseModel):
+    operation_id: str
+    kind: str
+    status: str
+    node_id: Optional[str]
+    instance_id: Optional[str]
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+
+class StatusCounts(BaseModel):
+    total: int
+    by_status: Dict[str, int]
+
+
+class FleetSummary(BaseModel):
+    nodes: StatusCounts
+    instances: StatusCounts
+
+
 class UserCreate(BaseModel):
     username: str
     email: str
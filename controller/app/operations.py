@@ -0,0 +1,349 @@
+import asyncio
+import json
+import uuid
+from datetime import datetime
+from functools import partial
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import AsyncSessionLocal, Node, Instance, Operation, User
+from app.models import StartRequest, OperationResponse
+from app.agent_client import agent_client, agent_url_for, AgentError
+from app.events import broker
+from app.lifecycle import build_agent_request
+from app.scheduler import capacity_index, Placement, ACTIVE_STATUSES
+from app.metrics import registry
+from app.config import settings
+
+
+def operation_response(operation: Operation) -> OperationResponse:
+    return OperationResponse(
+        operation_id=operation.id,
+        kind=operation.kind,
+        status=operation.status,
+        node_id=operation.node_id,
+        instance_id=operation.instance_id,
+        result=json.loads(operation.result) if operation.result else None,
+        error=operation.error,
+        created_at=operation.created_at,
+        updated_at=operation.updated_at
+    )
+
+
+def scoped_key(user: User, idempotency_key: Optional[str]) -> Optional[str]:
+    return f"{user.id}:{idempotency_key}" if idempotency_key else None
+
+
+async def find_operation(db: AsyncSession, user: User, idempotency_key: Optional[str]) -> Optional[Operation]:
+    """The operation an earlier request with the same Idempotency-Key created, if any"""
+    key = scoped_key(user, idempotency_key)
+    if key is None:
+        return None
+    return (await db.execute(select(Operation).where(Operation.idempotency_key == key))).scalars().first()
+
+
+class DuplicateOperation(Exception):
+    """A concurrent request with the same idempotency key won the insert"""
+
+    def __init__(self, operation: Operation):
+        super().__init__(operation.id)
+        self.operation = operation
+
+
+class OperationQueue:
+    """In-process worker pool that carries out queued start/stop operations"""
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        # Capacity reservations of queued starts, released or confirmed by the worker
+        self._placements: Dict[str, Placement] = {}
+        # Agent answers of operations in flight, so a worker crash after the call can settle the instance
+        self._answers: Dict[str, Dict] = {}
+
+    def start(self):
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(settings.operation_workers)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        for worker in self._workers:
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+        self._workers = []
+
+    def submit(self, operation_id: str, placement: Optional[Placement] = None):
+        self.start()
+        if placement:
+            self._placements[operation_id] = placement
+        self._queue.put_nowait(operation_id)
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def recover(self):
+        """Requeue operations left pending by a previous controller process
+
+        Operations that were already running when it died are failed; the
+        reconciler settles their instances from what the agent reports.
+        """
+        async with AsyncSessionLocal() as db:
+            operations = (await db.execute(
+                select(Operation).where(Operation.status.in_(("pending", "running")))
+                .order_by(Operation.created_at)
+            )).scalars().all()
+            for operation in operations:
+                if operation.status != "running":
+                    continue
+                operation.status = "failed"
+                operation.error = "Interrupted by controller restart"
+                if operation.kind == "stop":
+                    # Hand the instance back to the reconciler, which skips "stopping" rows
+                    instance = await db.get(Instance, operation.instance_id)
+                    if instance is not None and instance.status == "stopping":
+                        instance.status = json.loads(operation.request).get("previous_status") or "running"
+            await db.commit()
+        for operation in operations:
+            if operation.status == "pending":
+                self.submit(operation.id)
+
+    async def _worker(self):
+        while True:
+            operation_id = await self._queue.get()
+            try:
+                await self._run(operation_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Operation {operation_id} failed unexpectedly: {e}")
+                await self._abandon(operation_id, str(e))
+            finally:
+                self._answers.pop(operation_id, None)
+                self._queue.task_done()
+
+    async def _abandon(self, operation_id: str, error: str):
+        """Fail an operation whose worker crashed so clients don't poll it forever
+
+        Its instance takes the agent's answer if there was one. A stop the
+        agent never answered hands the instance back to the reconciler,
+        which skips "stopping" rows; an unconfirmed start stays "starting"
+        for the reconciler to promote or expire.
+        """
+        answer = self._answers.get(operation_id)
+        try:
+            async with AsyncSessionLocal() as db:
+                operation = await db.get(Operation, operation_id)
+                if operation is None or operation.status not in ("pending", "running"):
+                    return
+                operation.status = "failed"
+                operation.error = error
+                operation.updated_at = datetime.utcnow()
+                instance = await db.get(Instance, operation.instance_id)
+                settle = None
+                if instance is not None and instance.status in ("starting", "stopping"):
+                    if operation.kind == "start" and answer is not None:
+                        settle = self._started(instance, answer, Placement(instance.node_id, None))
+                    elif operation.kind == "stop" and answer is not None:
+                        settle = self._stopped(operation, instance)
+                    elif operation.kind == "stop":
+                        instance.status = json.loads(operation.request).get("previous_status") or "running"
+                instance_updated = instance is not None and instance in db.dirty
+                await db.commit()
+            if settle:
+                settle()
+            broker.publish("operation", operation.id, operation_response(operation).model_dump(mode="json"))
+            if instance_updated:
+                broker.publish_instance(instance)
+        except Exception as e:
+            print(f"Could not mark operation {operation_id} failed: {e}")
+
+    async def _run(self, operation_id: str):
+        placement = self._placements.pop(operation_id, None)
+        async with AsyncSessionLocal() as db:
+            operation = await db.get(Operation, operation_id)
+            if operation is None or operation.status != "pending":
+                # Already run (or gone); a reservation made for it is not needed
+                if placement:
+                    capacity_index.release(placement.node_id, placement.mav_udp)
+                return
+            instance = await db.get(Instance, operation.instance_id)
+            node = await db.get(Node, operation.node_id)
+            operation.status = "running"
+            await db.commit()
+            broker.publish("operation", operation.id, {"status": operation.status})
+
+            settle = None
+            if instance is None or node is None:
+                operation.status = "failed"
+                operation.error = "Instance or node no longer exists"
+                if placement:
+                    capacity_index.release(placement.node_id, placement.mav_udp)
+            elif operation.kind == "start":
+                settle = await self._start(db, operation, instance, node, placement)
+            else:
+                settle = await self._stop(operation, instance, node)
+
+            operation.updated_at = datetime.utcnow()
+            instance_updated = instance is not None and instance in db.dirty
+            await db.commit()
+            # Capacity follows the committed rows, so a failed commit leaves it to _abandon
+            if settle:
+                settle()
+            broker.publish("operation", operation.id, operation_response(operation).model_dump(mode="json"))
+            if instance_updated:
+                broker.publish_instance(instance)
+
+    async def _start(self, db: AsyncSession, operation: Operation, instance: Instance, node: Node,
+                     placement: Optional[Placement]) -> Optional[Callable]:
+        """Call the agent and update the rows; returns the capacity change to apply once they commit"""
+        request = json.loads(operation.request)
+        try:
+            response = await agent_client.start_instance(
+                agent_url_for(node.address), request, timeout=settings.agent_start_timeout
+            )
+        except AgentError as e:
+            operation.status = "failed"
+            operation.error = str(e)
+            if e.status_code is not None:
+                # The agent refused; nothing was started
+                instance.status = "error"
+                return partial(capacity_index.release, instance.node_id, instance.mav_udp)
+            # Otherwise the container may still come up: the row stays "starting"
+            # and the reconciler promotes or expires it
+            return None
+        self._answers[operation.id] = response
+
+        operation.status = "succeeded"
+        operation.result = json.dumps(response)
+        # An agent event may have moved the row on while the call was in flight
+        await db.refresh(instance, ["status"])
+        # Operations requeued after a restart lost their reservation; the reloaded index counts the row
+        return self._started(instance, response, placement or Placement(node.id, node.address))
+
+    @staticmethod
+    def _started(instance: Instance, response: Dict, placement: Placement) -> Optional[Callable]:
+        instance.container_id = response.get("container_id")
+        instance.mav_udp = response.get("mav_udp")
+        if instance.status == "starting":
+            instance.status = "running"
+        if instance.status in ACTIVE_STATUSES:
+            return partial(capacity_index.confirm, placement, instance.mav_udp)
+        return None
+
+    async def _stop(self, operation: Operation, instance: Instance, node: Node) -> Optional[Callable]:
+        """Call the agent and update the rows; returns the capacity change to apply once they commit"""
+        request = json.loads(operation.request)
+        try:
+            await agent_client.stop_instance(agent_url_for(node.address), {
+                "container_id": instance.container_id,
+                "instance_id": instance.id
+            })
+        except AgentError as e:
+            operation.status = "failed"
+            operation.error = str(e)
+            instance.status = request.get("previous_status") or "running"
+            return None
+        self._answers[operation.id] = {"status": "stopped"}
+
+        operation.status = "succeeded"
+        operation.result = json.dumps({"status": "stopped", "instance_id": instance.id,
+                                       "container_id": instance.container_id})
+        return self._stopped(operation, instance)
+
+    @staticmethod
+    def _stopped(operation: Operation, instance: Instance) -> Optional[Callable]:
+        instance.status = "stopped"
+        if json.loads(operation.request).get("previous_status") in ACTIVE_STATUSES:
+            return partial(capacity_index.release, instance.node_id, instance.mav_udp)
+        return None
+
+
+# Global operation queue
+operation_queue = OperationQueue()
+
+registry.gauge("controller_operations_queued", "Start/stop operations waiting for a worker",
+               lambda: operation_queue.depth)
+
+
+async def create_operation(db: AsyncSession, operation: Operation, instance: Optional[Instance] = None):
+    """Insert an operation (and the instance row it creates), mapping key clashes to DuplicateOperation"""
+    db.add(operation)
+    if instance is not None:
+        db.add(instance)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        existing = (await db.execute(
+            select(Operation).where(Operation.idempotency_key == operation.idempotency_key)
+        )).scalars().first()
+        if existing is None:
+            raise
+        raise DuplicateOperation(existing)
+
+
+async def submit_start(db: AsyncSession, user: User, body: StartRequest, placement: Placement,
+                       idempotency_key: Optional[str]) -> Operation:
+    """Record a starting instance and queue the agent call"""
+    instance_id = str(uuid.uuid4())
+    agent_request = {**build_agent_request(body), "instance_id": instance_id}
+    instance = Instance(
+        id=instance_id,
+        node_id=placement.node_id,
+        name=agent_request["name"],
+        vehicle_type=agent_request["vehicle_type"],
+        model=agent_request["model"],
+        mav_udp=agent_request["mav_udp"],
+        status="starting"
+    )
+    operation = Operation(
+        id=str(uuid.uuid4()),
+        kind="start",
+        status="pending",
+        idempotency_key=scoped_key(user, idempotency_key),
+        user_id=user.id,
+        node_id=placement.node_id,
+        instance_id=instance_id,
+        request=json.dumps(agent_request)
+    )
+    await create_operation(db, operation, instance)
+    broker.publish_instance(instance)
+    operation_queue.submit(operation.id, placement)
+    return operation
+
+
+async def submit_stop(db: AsyncSession, user: User, node: Node, instance: Instance,
+                      idempotency_key: Optional[str]) -> Operation:
+    """Mark an instance stopping and queue the agent call"""
+    if instance.status == "stopping":
+        # A stop is already in flight; hand back that operation instead of queueing another
+        in_flight = (await db.execute(
+            select(Operation)
+            .where(Operation.instance_id == instance.id, Operation.kind == "stop",
+                   Operation.status.in_(("pending", "running")))
+            .order_by(Operation.created_at.desc())
+        )).scalars().first()
+        if in_flight:
+            return in_flight
+    operation = Operation(
+        id=str(uuid.uuid4()),
+        kind="stop",
+        status="pending",
+        idempotency_key=scoped_key(user, idempotency_key),
+        user_id=user.id,
+        node_id=node.id,
+        instance_id=instance.id,
+        request=json.dumps({"previous_status": instance.status})
+    )
+    instance.status = "stopping"
+    await create_operation(db, operation)
+    broker.publish_instance(instance)
+    operation_queue.submit(operation.id)
+    return operation
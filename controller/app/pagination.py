@@ -0,0 +1,49 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional
+from sqlalchemy import and_, or_
+from app.config import settings
+
+
+def encode_cursor(*values: Any) -> str:
+    """Opaque cursor for the sort key of the last row on a page"""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Inverse of encode_cursor; raises ValueError on anything malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def after_created(created_column, id_column, cursor: str):
+    """WHERE clause for rows after a (created_at, id) cursor"""
+    created_at, row_id = decode_cursor(cursor, 2)
+    try:
+        created_at = datetime.fromisoformat(created_at)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+    return or_(
+        created_column > created_at,
+        and_(created_column == created_at, id_column > row_id)
+    )
+
+
+def page_limit(limit: Optional[int]) -> int:
+    """Clamp a requested page size to the configured bounds"""
+    if not limit or limit < 1:
+        return settings.page_size_default
+    return min(limit, settings.page_size_max)
+
+
+def split_values(value: Optional[str]) -> List[str]:
+    """Comma-separated query parameter to a list"""
+    return [v.strip() for v in value.split(",") if v.strip()] if value else []
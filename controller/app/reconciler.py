@@ -0,0 +1,189 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import select, update
+from app.database import AsyncSessionLocal, Node, Instance
+from app.agent_client import agent_client, agent_url_for
+from app.events import broker, instance_payload
+from app.scheduler import capacity_index, ACTIVE_STATUSES
+from app.config import settings
+
+
+class Reconciler:
+    """Background loop that keeps Node/Instance rows in line with what agents report
+
+    Each pass polls every agent's /agent/instances concurrently, counts missed
+    heartbeats per node and only writes rows whose state actually changed.
+    """
+
+    def __init__(self):
+        self.missed: Dict[str, int] = {}
+        # Agent instances with no row, adopted once seen on two consecutive passes
+        self.unknown: Set[str] = set()
+        self.passes = 0
+        self.last_changes = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.reconcile_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Reconcile pass failed: {e}")
+            # Jitter keeps multiple controllers from polling agents in lockstep
+            jitter = settings.reconcile_interval * settings.reconcile_jitter
+            await asyncio.sleep(settings.reconcile_interval + random.uniform(-jitter, jitter))
+
+    async def _poll(self, semaphore: asyncio.Semaphore, node_id: str, address: str):
+        async with semaphore:
+            try:
+                return node_id, await agent_client.list_instances(agent_url_for(address))
+            except Exception:
+                return node_id, None
+
+    async def reconcile_once(self) -> int:
+        """Run one reconciliation pass and return the number of rows changed"""
+        async with AsyncSessionLocal() as db:
+            await capacity_index.ensure_loaded(db)
+            nodes = (await db.execute(select(Node.id, Node.address, Node.status))).all()
+            # Read instance rows before polling so rows created mid-pass are left alone
+            rows = (await db.execute(
+                select(Instance.id, Instance.node_id, Instance.status, Instance.mav_udp, Instance.created_at)
+                .where(Instance.status.in_(ACTIVE_STATUSES))
+            )).all()
+
+        semaphore = asyncio.Semaphore(settings.reconcile_concurrency)
+        reports = dict(await asyncio.gather(
+            *(self._poll(semaphore, node_id, address) for node_id, address, _ in nodes)
+        ))
+
+        node_status: Dict[str, List[str]] = {"online": [], "offline": []}
+        for node_id, _, status in nodes:
+            if reports.get(node_id) is None:
+                self.missed[node_id] = self.missed.get(node_id, 0) + 1
+                if self.missed[node_id] >= settings.reconcile_max_missed and status != "offline":
+                    node_status["offline"].append(node_id)
+            else:
+                self.missed[node_id] = 0
+                if status != "online":
+                    node_status["online"].append(node_id)
+
+        # Diff agent reports against active rows of the nodes that answered
+        reported: Dict[str, dict] = {}
+        for node_id, instances in reports.items():
+            for info in instances or []:
+                reported[info["instance_id"]] = {**info, "node_id": node_id}
+
+        instance_status: Dict[str, List[Tuple[str, str, Optional[int]]]] = {
+            "running": [], "stopped": [], "error": []
+        }
+        start_deadline = datetime.utcnow() - timedelta(seconds=settings.instance_start_grace)
+        known = set()
+        for instance_id, node_id, status, mav_udp, created_at in rows:
+            known.add(instance_id)
+            # Rows being stopped belong to their stop operation
+            if status == "stopping" or reports.get(node_id) is None:
+                continue
+            info = reported.get(instance_id)
+            running = info is not None and info["status"] == "running"
+            if status == "starting":
+                # Only promote once the agent reports it; give up after the grace period
+                if running:
+                    instance_status["running"].append((instance_id, node_id, mav_udp))
+                elif created_at and created_at < start_deadline:
+                    instance_status["error"].append((instance_id, node_id, mav_udp))
+            elif not running:
+                instance_status["stopped"].append((instance_id, node_id, mav_udp))
+
+        # Rows stopped by the controller but still running on the agent are left to the stop path
+        orphans = [info for instance_id, info in reported.items()
+                   if instance_id not in known and info["status"] == "running"]
+        orphan_ids = {info["instance_id"] for info in orphans}
+        adopt = [info for info in orphans if info["instance_id"] in self.unknown]
+        self.unknown = orphan_ids - {info["instance_id"] for info in adopt}
+
+        changes = await self._apply(node_status, instance_status, adopt)
+        self.passes += 1
+        self.last_changes = changes
+        return changes
+
+    async def _apply(self, node_status: Dict[str, List[str]],
+                     instance_status: Dict[str, List[Tuple[str, str, Optional[int]]]],
+                     adopt: List[dict]) -> int:
+        """Write all changes of a pass in one transaction, one UPDATE per target state"""
+        changes = sum(len(ids) for ids in node_status.values()) + \
+            sum(len(items) for items in instance_status.values()) + len(adopt)
+        if not changes:
+            return 0
+
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            existing = set()
+            if adopt:
+                existing = set((await db.execute(
+                    select(Instance.id).where(Instance.id.in_([info["instance_id"] for info in adopt]))
+                )).scalars())
+            adopt = [info for info in adopt if info["instance_id"] not in existing]
+
+            for status, node_ids in node_status.items():
+                if node_ids:
+                    await db.execute(update(Node).where(Node.id.in_(node_ids)).values(status=status))
+            for status, items in instance_status.items():
+                if items:
+                    await db.execute(
+                        update(Instance)
+                        .where(Instance.id.in_([instance_id for instance_id, _, _ in items]))
+                        # Don't touch rows a user stopped (or started stopping) while this pass was polling
+                        .where(Instance.status.in_(("starting", "running")))
+                        .values(status=status, updated_at=now)
+                    )
+            adopted = [
+                Instance(
+                    id=info["instance_id"],
+                    node_id=info["node_id"],
+                    container_id=info.get("container_id"),
+                    name=info.get("name") or info["instance_id"][:8],
+                    vehicle_type=info.get("vehicle_type") or "copter",
+                    model=info.get("model") or "iris",
+                    mav_udp=info.get("mav_udp"),
+                    group_id=info.get("group_id"),
+                    status="running"
+                )
+                for info in adopt
+            ]
+            db.add_all(adopted)
+            await db.commit()
+
+        for status, node_ids in node_status.items():
+            for node_id in node_ids:
+                capacity_index.set_status(node_id, status)
+                broker.publish("node", node_id, {"status": status})
+        for status, items in instance_status.items():
+            for instance_id, node_id, mav_udp in items:
+                if status != "running":
+                    capacity_index.release(node_id, mav_udp)
+                broker.publish("instance", instance_id, {"status": status, "updated_at": now.isoformat()})
+        for instance in adopted:
+            capacity_index.add_instance(instance.node_id, instance.mav_udp, grouped=instance.group_id is not None)
+            broker.publish("instance", instance.id, instance_payload(instance))
+        return changes
+
+
+# Global reconciler
+reconciler = Reconciler()
@@ -0,0 +1,117 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import delete, insert, select
+from app.database import AsyncSessionLocal, Instance, InstanceArchive
+from app.metrics import registry
+from app.config import settings
+
+# Instances in these states are never touched again and can leave the hot table
+TERMINAL_STATUSES = ("stopped", "error")
+ARCHIVE_FIELDS = tuple(column.key for column in Instance.__table__.columns)
+
+instances_archived = registry.counter("controller_instances_archived_total", "Instances moved to instance_archive")
+archive_purged = registry.counter("controller_instance_archive_purged_total", "Archived instances deleted")
+
+
+class Archiver:
+    """Background job that moves old stopped/error instances into instance_archive
+
+    Rows go over in batches of archive_batch_size, each batch a single
+    DELETE ... RETURNING plus INSERT in one short transaction, so lists and
+    lookups on `instances` only ever see live and recent rows.
+    """
+
+    def __init__(self):
+        self.passes = 0
+        self.last_archived = 0
+        self._archived = instances_archived.labels()
+        self._purged = archive_purged.labels()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.archive_once()
+                await self.purge_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Instance archival failed: {e}")
+            await asyncio.sleep(settings.archive_interval)
+
+    async def archive_batch(self, cutoff: datetime) -> int:
+        async with AsyncSessionLocal() as db:
+            ids = select(Instance.id).where(
+                Instance.status.in_(TERMINAL_STATUSES), Instance.updated_at < cutoff
+            ).limit(settings.archive_batch_size)
+            # The WHERE is repeated so a row restarted since the SELECT stays put
+            rows = (await db.execute(
+                delete(Instance)
+                .where(Instance.id.in_(ids.scalar_subquery()))
+                .where(Instance.status.in_(TERMINAL_STATUSES), Instance.updated_at < cutoff)
+                .returning(*Instance.__table__.columns)
+                .execution_options(synchronize_session=False)
+            )).all()
+            if rows:
+                now = datetime.utcnow()
+                await db.execute(
+                    insert(InstanceArchive),
+                    [{**dict(zip(ARCHIVE_FIELDS, row)), "archived_at": now} for row in rows]
+                )
+            await db.commit()
+        return len(rows)
+
+    async def archive_once(self) -> int:
+        """Archive every instance past archive_after_hours and return how many moved"""
+        cutoff = datetime.utcnow() - timedelta(hours=settings.archive_after_hours)
+        total = 0
+        while True:
+            moved = await self.archive_batch(cutoff)
+            total += moved
+            self._archived.inc(moved)
+            if moved < settings.archive_batch_size:
+                break
+            # Let other writers in between batches
+            await asyncio.sleep(0)
+        self.passes += 1
+        self.last_archived = total
+        return total
+
+    async def purge_once(self) -> int:
+        """Delete archived rows past archive_retention_days, if set"""
+        if settings.archive_retention_days <= 0:
+            return 0
+        cutoff = datetime.utcnow() - timedelta(days=settings.archive_retention_days)
+        total = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                ids = select(InstanceArchive.id).where(InstanceArchive.archived_at < cutoff) \
+                    .limit(settings.archive_batch_size)
+                result = await db.execute(
+                    delete(InstanceArchive).where(InstanceArchive.id.in_(ids.scalar_subquery()))
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+            total += result.rowcount
+            self._purged.inc(result.rowcount)
+            if result.rowcount < settings.archive_batch_size:
+                return total
+            await asyncio.sleep(0)
+
+
+# Global archiver
+archiver = Archiver()
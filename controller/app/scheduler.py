@@ -0,0 +1,372 @@
+import asyncio
+import json
+from typing import Dict, List, Optional, Set
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import Node, Instance
+from app.agent_client import agent_client, agent_url_for
+from app.heartbeats import heartbeats
+from app.snapshot import fleet_versions
+from app.config import settings
+
+# Instance states that hold resources on a node
+ACTIVE_STATUSES = ("starting", "running", "stopping")
+
+# Node columns the index keeps
+CAPACITY_COLUMNS = (
+    Node.id, Node.address, Node.status, Node.tags, Node.cpu_cores, Node.memory_gb,
+    Node.cpu_percent, Node.memory_percent, Node.last_seen
+)
+
+
+class PlacementError(Exception):
+    """Raised when no node can take a new instance"""
+
+
+class NodeCapacity:
+    """In-memory view of one node's resources and allocations"""
+
+    def __init__(self, node_id: str, address: str, status: str, tags: Set[str],
+                 cpu_cores: int, memory_gb: int):
+        self.node_id = node_id
+        self.address = address
+        self.status = status
+        self.tags = tags
+        self.cpu_cores = cpu_cores or 0
+        self.memory_gb = memory_gb or 0
+        # Instance-equivalents reserved; a density group vehicle counts as density_vehicle_weight
+        self.instances = 0.0
+        self.used_ports: Set[int] = set()
+        # Ports of vehicles in density groups, which release a vehicle's weight rather than a whole instance
+        self.grouped_ports: Set[int] = set()
+        # Load from the latest heartbeat (percent), None until one arrives
+        self.cpu_percent: Optional[float] = None
+        self.memory_percent: Optional[float] = None
+
+    @property
+    def total_ports(self) -> int:
+        # One MAVLink port per block of mav_ports_per_instance ports
+        return (settings.mav_port_end - settings.mav_port_start + 1) // max(1, settings.mav_ports_per_instance)
+
+    @property
+    def free_ports(self) -> int:
+        return self.total_ports - len(self.used_ports)
+
+    def utilization(self, extra: int = 0) -> float:
+        """Fraction of the node's tightest resource in use (0.0 - 1.0+)"""
+        count = self.instances + extra
+        ratios = [len(self.used_ports) / self.total_ports if self.total_ports > 0 else 1.0]
+        # A node that reported 0 cores/memory is only limited by ports
+        if self.cpu_cores:
+            ratios.append(count * settings.instance_cpu_cores / self.cpu_cores)
+        if self.memory_gb:
+            ratios.append(count * settings.instance_memory_gb / self.memory_gb)
+        # A node busier than its reservations suggest is treated as that busy
+        for percent in (self.cpu_percent, self.memory_percent):
+            if percent is not None:
+                ratios.append(percent / 100)
+        return max(ratios)
+
+    def fits(self, mav_udp: Optional[int] = None, weight: float = 1.0, ports: int = 1) -> bool:
+        if self.status != "online" or self.free_ports < ports:
+            return False
+        # Calls to an agent whose circuit breaker is open would fail straight away
+        if not agent_client.accepting(agent_url_for(self.address)):
+            return False
+        if mav_udp is not None and mav_udp in self.used_ports:
+            return False
+        if self.cpu_cores and (self.instances + weight) * settings.instance_cpu_cores > self.cpu_cores:
+            return False
+        if self.memory_gb and (self.instances + weight) * settings.instance_memory_gb > self.memory_gb:
+            return False
+        return True
+
+
+class PlacementPolicy:
+    """Base class for placement policies; the highest scoring node wins"""
+    name = "base"
+
+    def score(self, node: NodeCapacity) -> float:
+        raise NotImplementedError
+
+
+class SpreadPolicy(PlacementPolicy):
+    """Prefer the least loaded node"""
+    name = "spread"
+
+    def score(self, node: NodeCapacity) -> float:
+        return -node.utilization(extra=1)
+
+
+class BinPackPolicy(PlacementPolicy):
+    """Prefer the most loaded node that still fits"""
+    name = "binpack"
+
+    def score(self, node: NodeCapacity) -> float:
+        return node.utilization(extra=1)
+
+
+PLACEMENT_POLICIES: Dict[str, PlacementPolicy] = {}
+
+
+def register_policy(policy: PlacementPolicy):
+    """Make a placement policy selectable by name"""
+    PLACEMENT_POLICIES[policy.name] = policy
+
+
+def get_policy(name: Optional[str] = None) -> PlacementPolicy:
+    """Look up a policy by name, falling back to the configured default"""
+    name = name or settings.placement_policy
+    if name not in PLACEMENT_POLICIES:
+        raise ValueError(f"Unknown placement policy '{name}'")
+    return PLACEMENT_POLICIES[name]
+
+
+register_policy(SpreadPolicy())
+register_policy(BinPackPolicy())
+
+
+class Placement:
+    """A capacity reservation on a node, held until the agent answers"""
+
+    def __init__(self, node_id: str, address: str, mav_udp: Optional[int] = None):
+        self.node_id = node_id
+        self.address = address
+        self.mav_udp = mav_udp
+
+
+class CapacityIndex:
+    def __init__(self):
+        self.nodes: Dict[str, NodeCapacity] = {}
+        self.nodes_by_tag: Dict[str, Set[str]] = {}
+        self.loaded = False
+        # fleet_versions "nodes" version the node rows were last read at
+        self.nodes_version = 0
+        self._load_lock = asyncio.Lock()
+
+    def _index_tags(self, capacity: NodeCapacity, add: bool = True):
+        for tag in capacity.tags:
+            node_ids = self.nodes_by_tag.setdefault(tag, set())
+            if add:
+                node_ids.add(capacity.node_id)
+            else:
+                node_ids.discard(capacity.node_id)
+
+    async def load(self, db: AsyncSession):
+        """Rebuild the index from the database"""
+        version = fleet_versions.versions["nodes"]
+        nodes = (await db.execute(select(Node))).scalars().all()
+        active = await db.execute(
+            select(Instance.node_id, Instance.mav_udp, Instance.group_id)
+            .where(Instance.status.in_(ACTIVE_STATUSES))
+        )
+
+        # Swap in the new state without awaiting so no request sees a half-built index
+        self.nodes.clear()
+        self.nodes_by_tag.clear()
+        for node in nodes:
+            self.update_node(node)
+        for node_id, mav_udp, group_id in active:
+            self.add_instance(node_id, mav_udp, grouped=group_id is not None)
+        self.nodes_version = max(self.nodes_version, version)
+        self.loaded = True
+
+    async def refresh_nodes(self, db: AsyncSession):
+        """Re-read node rows other workers wrote, keeping this worker's allocations"""
+        version = fleet_versions.versions["nodes"]
+        nodes = (await db.execute(select(*CAPACITY_COLUMNS))).all()
+        missing = [node.id for node in nodes if node.id not in self.nodes]
+        active = []
+        if missing:
+            active = (await db.execute(
+                select(Instance.node_id, Instance.mav_udp, Instance.group_id)
+                .where(Instance.node_id.in_(missing), Instance.status.in_(ACTIVE_STATUSES))
+            )).all()
+        self._add_nodes(nodes, active)
+        for node in nodes:
+            self.update_node(node)
+            # A heartbeat buffered here but not yet flushed is newer than the row
+            heartbeat = heartbeats.view(node.id, node.last_seen)
+            if heartbeat:
+                self.heartbeat(node.id, heartbeat)
+        self.nodes_version = max(self.nodes_version, version)
+
+    async def ensure_loaded(self, db: AsyncSession):
+        if not self.loaded:
+            # A second concurrent load would wipe reservations made after the first one finished
+            async with self._load_lock:
+                if not self.loaded:
+                    await self.load(db)
+            return
+        # Registrations and status changes on other workers move the shared nodes version
+        version = dict(await fleet_versions.current(("nodes",), {}))["nodes"]
+        if version > self.nodes_version:
+            async with self._load_lock:
+                if version > self.nodes_version:
+                    await self.refresh_nodes(db)
+
+    async def ensure_node(self, db: AsyncSession, node_id: str) -> Optional[NodeCapacity]:
+        """A node's entry, read from the database if another worker registered it
+
+        None if the node has no row at all.
+        """
+        await self.ensure_loaded(db)
+        capacity = self.nodes.get(node_id)
+        if capacity is not None:
+            return capacity
+        node = await db.get(Node, node_id)
+        if node is None:
+            return None
+        active = (await db.execute(
+            select(Instance.node_id, Instance.mav_udp, Instance.group_id)
+            .where(Instance.node_id == node_id, Instance.status.in_(ACTIVE_STATUSES))
+        )).all()
+        self._add_nodes([node], active)
+        return self.nodes[node_id]
+
+    def _add_nodes(self, nodes: List[Node], active):
+        """Index nodes that are missing, with their active instances
+
+        Runs without awaiting, so a node indexed meanwhile keeps its allocations.
+        """
+        added = set()
+        for node in nodes:
+            if node.id not in self.nodes:
+                self.update_node(node)
+                added.add(node.id)
+        for node_id, mav_udp, group_id in active:
+            if node_id in added:
+                self.add_instance(node_id, mav_udp, grouped=group_id is not None)
+
+    def update_node(self, node: Node):
+        """Insert or refresh a node's static attributes, keeping its allocations"""
+        tags = set(json.loads(node.tags) if node.tags else [])
+        capacity = self.nodes.get(node.id)
+        if capacity is None:
+            capacity = NodeCapacity(node.id, node.address, node.status, tags,
+                                    node.cpu_cores, node.memory_gb)
+            self.nodes[node.id] = capacity
+        else:
+            self._index_tags(capacity, add=False)
+            capacity.address = node.address
+            capacity.status = node.status
+            capacity.tags = tags
+            capacity.cpu_cores = node.cpu_cores or 0
+            capacity.memory_gb = node.memory_gb or 0
+        if node.cpu_percent is not None or node.memory_percent is not None:
+            capacity.cpu_percent = node.cpu_percent
+            capacity.memory_percent = node.memory_percent
+        self._index_tags(capacity)
+
+    def set_status(self, node_id: str, status: str):
+        """Track a node going online/offline without reloading it"""
+        capacity = self.nodes.get(node_id)
+        if capacity:
+            capacity.status = status
+
+    def heartbeat(self, node_id: str, values: Dict):
+        """Apply a node's heartbeat: it is online and reports this load"""
+        capacity = self.nodes.get(node_id)
+        if capacity:
+            capacity.status = "online"
+            capacity.cpu_percent = values.get("cpu_percent")
+            capacity.memory_percent = values.get("memory_percent")
+
+    def candidates(self, tags: Optional[List[str]] = None) -> List[NodeCapacity]:
+        """Nodes carrying every requested tag"""
+        if not tags:
+            return list(self.nodes.values())
+        node_ids = None
+        for tag in tags:
+            tagged = self.nodes_by_tag.get(tag, set())
+            node_ids = set(tagged) if node_ids is None else node_ids & tagged
+            if not node_ids:
+                return []
+        return [self.nodes[node_id] for node_id in node_ids]
+
+    def reserve(self, policy: PlacementPolicy, tags: Optional[List[str]] = None,
+                mav_udp: Optional[int] = None) -> Placement:
+        """Pick a node and hold capacity on it for one instance"""
+        best = None
+        best_score = None
+        for capacity in self.candidates(tags):
+            if not capacity.fits(mav_udp):
+                continue
+            score = policy.score(capacity)
+            if best is None or score > best_score:
+                best, best_score = capacity, score
+
+        if best is None:
+            raise PlacementError("No online node has capacity for the instance")
+
+        best.instances += 1
+        if mav_udp is not None:
+            best.used_ports.add(mav_udp)
+        return Placement(best.node_id, best.address, mav_udp)
+
+    def reserve_group(self, policy: PlacementPolicy, count: int, tags: Optional[List[str]] = None,
+                      node_id: Optional[str] = None) -> Placement:
+        """Pick a node (or check node_id) and hold capacity on it for a density group of count vehicles"""
+        weight = count * settings.density_vehicle_weight
+        if node_id:
+            candidates = [self.nodes[node_id]] if node_id in self.nodes else []
+        else:
+            candidates = self.candidates(tags)
+        best = None
+        best_score = None
+        for capacity in candidates:
+            if not capacity.fits(weight=weight, ports=count):
+                continue
+            score = policy.score(capacity)
+            if best is None or score > best_score:
+                best, best_score = capacity, score
+
+        if best is None:
+            raise PlacementError(f"No online node has capacity for a group of {count} vehicles")
+
+        best.instances += weight
+        return Placement(best.node_id, best.address)
+
+    def confirm_group(self, node_id: str, ports: List[int]):
+        """Record the ports the agent assigned to a group's vehicles"""
+        capacity = self.nodes.get(node_id)
+        if capacity:
+            capacity.used_ports.update(ports)
+            capacity.grouped_ports.update(ports)
+
+    def release_group(self, node_id: str, count: int):
+        """Return a group reservation whose start failed"""
+        capacity = self.nodes.get(node_id)
+        if capacity:
+            capacity.instances = max(0.0, capacity.instances - count * settings.density_vehicle_weight)
+
+    def confirm(self, placement: Placement, mav_udp: Optional[int]):
+        """Record the port the agent actually assigned to a reservation"""
+        capacity = self.nodes.get(placement.node_id)
+        if capacity and mav_udp is not None:
+            capacity.used_ports.add(mav_udp)
+            placement.mav_udp = mav_udp
+
+    def add_instance(self, node_id: str, mav_udp: Optional[int], grouped: bool = False):
+        """Account for an instance started outside of reserve()"""
+        capacity = self.nodes.get(node_id)
+        if capacity:
+            capacity.instances += settings.density_vehicle_weight if grouped else 1
+            if mav_udp is not None:
+                capacity.used_ports.add(mav_udp)
+                if grouped:
+                    capacity.grouped_ports.add(mav_udp)
+
+    def release(self, node_id: str, mav_udp: Optional[int]):
+        """Return an instance's capacity to its node"""
+        capacity = self.nodes.get(node_id)
+        if capacity:
+            grouped = mav_udp is not None and mav_udp in capacity.grouped_ports
+            capacity.instances = max(0.0, capacity.instances - (settings.density_vehicle_weight if grouped else 1))
+            if mav_udp is not None:
+                capacity.used_ports.discard(mav_udp)
+                capacity.grouped_ports.discard(mav_udp)
+
+
+# Global capacity index
+capacity_index = CapacityIndex()
@@ -0,0 +1,114 @@
+import asyncio
+import gzip
+import json
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Mapping, Optional
+from fastapi import Request, Response
+from app.database import Node, Instance, InstanceArchive
+from app.heartbeats import heartbeats
+from app.config import settings
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Columns selected by the list endpoints, in response field order
+NODE_COLUMNS = (
+    Node.id, Node.name, Node.address, Node.tags, Node.last_seen, Node.status,
+    Node.cpu_cores, Node.memory_gb, Node.disk_gb,
+    Node.running_instances, Node.cpu_percent, Node.memory_percent,
+)
+INSTANCE_COLUMNS = (
+    Instance.id, Instance.node_id, Instance.container_id, Instance.name, Instance.vehicle_type,
+    Instance.model, Instance.mav_udp, Instance.group_id, Instance.status, Instance.created_at, Instance.updated_at,
+)
+INSTANCE_FIELDS = tuple(column.key for column in INSTANCE_COLUMNS)
+ARCHIVE_COLUMNS = tuple(getattr(InstanceArchive, field) for field in INSTANCE_FIELDS) + (InstanceArchive.archived_at,)
+ARCHIVE_FIELDS = INSTANCE_FIELDS + ("archived_at",)
+
+# Payloads above this size are compressed off the event loop
+GZIP_OFFLOAD_SIZE = 256 * 1024
+
+
+def _default(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize to compact JSON bytes, with orjson when it is installed"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(",", ":"), default=_default).encode()
+
+
+def loads(data):
+    return orjson.loads(data) if ORJSON_AVAILABLE else json.loads(data)
+
+
+def node_row(row: Mapping) -> Dict[str, Any]:
+    """Response dict for a row selected with NODE_COLUMNS, plus any newer heartbeat"""
+    node = dict(row)
+    node["tags"] = loads(node["tags"]) if node["tags"] else []
+    heartbeat = heartbeats.view(node["id"], node["last_seen"])
+    if heartbeat:
+        node.update(heartbeat)
+    return node
+
+
+def instance_row(row) -> Dict[str, Any]:
+    """Response dict for a row selected with INSTANCE_COLUMNS"""
+    return dict(zip(INSTANCE_FIELDS, row))
+
+
+def archive_row(row) -> Dict[str, Any]:
+    """Response dict for a row selected with ARCHIVE_COLUMNS"""
+    return dict(zip(ARCHIVE_FIELDS, row))
+
+
+def decode_body(body: bytes, content_encoding: str, max_size: int) -> bytes:
+    """Request body, gunzipped for Content-Encoding: gzip; ValueError if too large or unsupported"""
+    content_encoding = content_encoding.strip().lower()
+    if content_encoding == "gzip":
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = decompressor.decompress(body, max_size + 1)
+        except zlib.error:
+            raise ValueError("Invalid gzip body")
+    elif content_encoding not in ("", "identity"):
+        raise ValueError(f"Unsupported Content-Encoding: {content_encoding}")
+    if len(body) > max_size:
+        raise ValueError("Request body too large")
+    return body
+
+
+def should_gzip(request: Request, body: bytes) -> bool:
+    return bool(settings.gzip_min_size) and len(body) >= settings.gzip_min_size and \
+        "gzip" in request.headers.get("accept-encoding", "")
+
+
+async def gzip_body(body: bytes) -> bytes:
+    if len(body) >= GZIP_OFFLOAD_SIZE:
+        return await asyncio.to_thread(gzip.compress, body, settings.gzip_level, mtime=0)
+    return gzip.compress(body, settings.gzip_level, mtime=0)
+
+
+def bytes_response(body: bytes, headers: Dict[str, str], gzipped: bool = False,
+                   status_code: int = 200) -> Response:
+    headers = {**headers, "Vary": "Accept-Encoding"}
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, status_code=status_code, headers=headers, media_type="application/json")
+
+
+async def json_response(request: Request, content: Any, status_code: int = 200,
+                        headers: Optional[Dict[str, str]] = None) -> Response:
+    """JSON bytes response that skips response_model validation, gzipped when large"""
+    body = dumps(content)
+    if should_gzip(request, body):
+        return bytes_response(await gzip_body(body), headers or {}, gzipped=True, status_code=status_code)
+    return bytes_response(body, headers or {}, status_code=status_code)
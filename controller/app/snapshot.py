@@ -0,0 +1,212 @@
+import asyncio
+from typing import Dict, Iterable, Optional, Set, Tuple
+from fastapi import Request, Response
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+from app.database import AsyncSessionLocal, FleetVersion, FLEET_RESOURCES
+from app.cache import TTLCache
+from app.metrics import registry
+from app.serializers import dumps, should_gzip, gzip_body, bytes_response
+from app.config import settings
+
+snapshot_responses = registry.counter(
+    "controller_snapshot_responses_total", "List responses by snapshot cache result", ("result",)
+)
+
+Versions = Tuple[Tuple[str, int], ...]
+
+
+# --- Version bumps ---
+#
+# Every transaction that writes nodes or instances bumps their row in
+# fleet_versions just before it commits, so the versions are shared by all
+# controller workers and only move forward once the change is visible.
+
+def _mark(session: Session, table_name: Optional[str]):
+    if table_name in FLEET_RESOURCES:
+        session.info.setdefault("fleet_changes", set()).add(table_name)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session: Session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        _mark(session, getattr(obj, "__tablename__", None))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_statement(state):
+    # Bulk UPDATE/INSERT/DELETE statements bypass the unit of work
+    if state.is_update or state.is_delete or state.is_insert:
+        table = getattr(state.statement, "table", None)
+        _mark(state.session, getattr(table, "name", None))
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_versions(session: Session):
+    # before_commit runs ahead of the final flush, so flush to see its changes
+    session.flush()
+    changes: Set[str] = session.info.pop("fleet_changes", None)
+    if not changes:
+        return
+    session.execute(
+        update(FleetVersion).where(FleetVersion.resource.in_(changes))
+        .values(version=FleetVersion.version + 1)
+    )
+    rows = session.execute(
+        select(FleetVersion.resource, FleetVersion.version).where(FleetVersion.resource.in_(changes))
+    ).all()
+    session.info["fleet_versions"] = dict(rows)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_versions(session: Session):
+    versions = session.info.pop("fleet_versions", None)
+    if versions:
+        fleet_versions.observe(versions)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_versions(session: Session):
+    session.info.pop("fleet_changes", None)
+    session.info.pop("fleet_versions", None)
+
+
+class FleetVersions:
+    """Newest known version of each fleet resource
+
+    Commits in this worker are seen straight away; other workers' commits are
+    picked up by polling fleet_versions every snapshot_poll_interval seconds,
+    or at once when a client presents an ETag newer than ours.
+    """
+
+    def __init__(self):
+        self.versions: Dict[str, int] = dict.fromkeys(FLEET_RESOURCES, 0)
+        self._task: Optional[asyncio.Task] = None
+
+    def observe(self, versions: Dict[str, int]):
+        for resource, version in versions.items():
+            if version > self.versions.get(resource, 0):
+                self.versions[resource] = version
+
+    async def refresh(self):
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(select(FleetVersion.resource, FleetVersion.version))).all()
+        self.observe(dict(rows))
+
+    async def current(self, resources: Iterable[str], claimed: Dict[str, int]) -> Versions:
+        """Versions of the resources, re-read if the client has seen newer ones"""
+        if settings.snapshot_poll_interval <= 0 or any(
+            version > self.versions.get(resource, 0) for resource, version in claimed.items()
+        ):
+            await self.refresh()
+        return tuple((resource, self.versions[resource]) for resource in resources)
+
+    def start(self):
+        if self._task is None and settings.snapshot_poll_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Fleet version refresh failed: {e}")
+            await asyncio.sleep(settings.snapshot_poll_interval)
+
+
+def make_etag(versions: Versions) -> str:
+    return 'W/"' + ".".join(f"{resource}-{version}" for resource, version in versions) + '"'
+
+
+def parse_etags(header: Optional[str]) -> Tuple[Set[str], Dict[str, int]]:
+    """ETags in an If-None-Match header, and the newest version each one claims"""
+    tags: Set[str] = set()
+    claimed: Dict[str, int] = {}
+    for tag in (header or "").split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if not tag:
+            continue
+        tags.add(tag)
+        for part in tag.split("."):
+            resource, _, version = part.rpartition("-")
+            if resource in FLEET_RESOURCES and version.isdigit():
+                claimed[resource] = max(claimed.get(resource, 0), int(version))
+    return tags, claimed
+
+
+class CachedBody:
+    __slots__ = ("body", "gzipped", "headers")
+
+    def __init__(self, body: bytes, headers: Dict[str, str]):
+        self.body = body
+        self.gzipped: Optional[bytes] = None
+        self.headers = headers
+
+    async def response(self, request: Request) -> Response:
+        if should_gzip(request, self.body):
+            if self.gzipped is None:
+                self.gzipped = await gzip_body(self.body)
+            return bytes_response(self.gzipped, self.headers, gzipped=True)
+        return bytes_response(self.body, self.headers)
+
+
+class SnapshotCache:
+    """Rendered list responses keyed by URL and the fleet versions they were read at
+
+    Bodies are shared by every caller, so they must not depend on the user.
+    A new version makes old entries unreachable; they age out of the LRU.
+    """
+
+    def __init__(self):
+        self.cache = TTLCache(settings.snapshot_cache_size, settings.snapshot_cache_ttl)
+        self._results = {result: snapshot_responses.labels(result) for result in ("not_modified", "hit", "miss")}
+
+    async def versions(self, request: Request, resources: Iterable[str]) -> Versions:
+        """Read before querying, so a body is never older than the version it is cached under"""
+        _, claimed = parse_etags(request.headers.get("if-none-match"))
+        return await fleet_versions.current(resources, claimed)
+
+    async def lookup(self, request: Request, versions: Versions) -> Optional[Response]:
+        """A 304 or cached response for the request, or None if it must be built"""
+        etag = make_etag(versions)
+        tags, _ = parse_etags(request.headers.get("if-none-match"))
+        if etag[2:].strip('"') in tags or "*" in tags:
+            self._results["not_modified"].inc()
+            return Response(status_code=304, headers={
+                "ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"
+            })
+        entry = self.cache.get((request.url.path, request.url.query, versions))
+        if entry is None:
+            return None
+        self._results["hit"].inc()
+        return await entry.response(request)
+
+    async def store(self, request: Request, versions: Versions, content,
+                    headers: Optional[Dict[str, str]] = None) -> Response:
+        self._results["miss"].inc()
+        headers = {**(headers or {}), "ETag": make_etag(versions), "Cache-Control": "no-cache"}
+        entry = CachedBody(dumps(content), headers)
+        self.cache.set((request.url.path, request.url.query, versions), entry)
+        return await entry.response(request)
+
+    def stats(self):
+        return self.cache.stats()
+
+
+# Global version tracker and list response cache
+fleet_versions = FleetVersions()
+snapshot_cache = SnapshotCache()
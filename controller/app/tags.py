@@ -0,0 +1,25 @@
+from typing import Iterable, List
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import NodeTag
+
+
+def tagged_node_ids(tags: Iterable[str]):
+    """Subquery of the ids of nodes carrying every one of the tags"""
+    tags = sorted(set(tags))
+    query = select(NodeTag.node_id)
+    if len(tags) == 1:
+        return query.where(NodeTag.tag == tags[0])
+    return query.where(NodeTag.tag.in_(tags)).group_by(NodeTag.node_id).having(func.count() == len(tags))
+
+
+async def sync_node_tags(db: AsyncSession, node_id: str, tags: List[str], new: bool = False):
+    """Make a node's node_tags rows match its tag list (written on the next flush)"""
+    wanted = set(tags)
+    existing = set() if new else set(
+        (await db.execute(select(NodeTag.tag).where(NodeTag.node_id == node_id))).scalars()
+    )
+    removed = existing - wanted
+    if removed:
+        await db.execute(delete(NodeTag).where(NodeTag.node_id == node_id, NodeTag.tag.in_(removed)))
+    db.add_all(NodeTag(node_id=node_id, tag=tag) for tag in wanted - existing)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Compare controller -> agent call latency with and without connection pooling.
+
+Run from the controller directory:
+    python -m benchmarks.bench_agent_pool --calls 2000 --concurrency 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app.agent_client import AgentClient
+from benchmarks.fake_agent import create_fake_agent, ServerThread
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def unpooled_get_status(agent_url: str) -> dict:
+    """The pre-pooling behaviour: a fresh client and connection per call"""
+    async with httpx.AsyncClient(verify=False, timeout=30) as client:
+        response = await client.get(f"{agent_url}/agent/status")
+        response.raise_for_status()
+        return response.json()
+
+
+async def run(call, agent_url: str, calls: int, concurrency: int):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await call(agent_url)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(calls)))
+    elapsed = time.perf_counter() - started
+    return latencies, elapsed
+
+
+def report(label: str, latencies, elapsed: float):
+    print(
+        f"{label:<10} p50={statistics.median(latencies):7.2f}ms "
+        f"p99={percentile(latencies, 99):7.2f}ms "
+        f"throughput={len(latencies) / elapsed:8.1f} req/s"
+    )
+
+
+async def main(args):
+    with ServerThread(create_fake_agent()) as server:
+        latencies, elapsed = await run(unpooled_get_status, server.url, args.calls, args.concurrency)
+        report("unpooled", latencies, elapsed)
+
+        client = AgentClient()
+        try:
+            latencies, elapsed = await run(client.get_status, server.url, args.calls, args.concurrency)
+            report("pooled", latencies, elapsed)
+        finally:
+            await client.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AgentClient pooling benchmark")
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
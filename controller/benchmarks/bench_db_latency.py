@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Show how controller request latency reacts to database latency.
+
+Artificial latency is added to every SQL statement. By default it is an
+awaited delay inside the async driver (how a slow Postgres looks to the
+async session path); --blocking sleeps on the event loop thread instead,
+which is what the old sync session path did. /health is probed throughout
+to show whether unrelated requests are stalled.
+
+Run from the controller directory:
+    python -m benchmarks.bench_db_latency --delays 0 5 20 50
+    python -m benchmarks.bench_db_latency --blocking
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+# Use a throwaway database before the app creates its engines
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+
+import aiosqlite
+import httpx
+from sqlalchemy import event
+
+from app.main import app
+from app.auth import create_access_token, get_password_hash
+from app.database import SessionLocal, async_engine, User, Instance
+from benchmarks.bench_agent_pool import percentile
+
+DB_DELAY = 0.0
+BLOCKING = False
+
+
+def install_latency():
+    original_execute = aiosqlite.Connection._execute
+
+    async def delayed_execute(self, fn, *args, **kwargs):
+        if DB_DELAY and not BLOCKING:
+            await asyncio.sleep(DB_DELAY)
+        return await original_execute(self, fn, *args, **kwargs)
+
+    aiosqlite.Connection._execute = delayed_execute
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def blocking_delay(*args):
+        if DB_DELAY and BLOCKING:
+            time.sleep(DB_DELAY)
+
+
+def seed(instances: int) -> str:
+    db = SessionLocal()
+    username = f"bench-{uuid.uuid4().hex[:6]}"
+    db.add(User(
+        id=str(uuid.uuid4()), username=username, email=f"{username}@example.com",
+        hashed_password=get_password_hash("bench")
+    ))
+    db.add_all([
+        Instance(id=str(uuid.uuid4()), node_id="node-0", name=f"sim-{i}", mav_udp=14560 + i, status="running")
+        for i in range(instances)
+    ])
+    db.commit()
+    db.close()
+    return create_access_token({"sub": username})
+
+
+async def measure(client: httpx.AsyncClient, headers: dict, concurrency: int, duration: float):
+    list_latencies, health_latencies = [], []
+    deadline = time.perf_counter() + duration
+
+    async def lister():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await client.get("/api/v1/instances", headers=headers)
+            response.raise_for_status()
+            list_latencies.append((time.perf_counter() - start) * 1000)
+
+    async def prober():
+        # Latency is measured from when the probe was due, so event loop stalls are counted
+        while time.perf_counter() < deadline:
+            due = time.perf_counter() + 0.01
+            await asyncio.sleep(0.01)
+            await client.get("/health")
+            health_latencies.append((time.perf_counter() - due) * 1000)
+
+    await asyncio.gather(prober(), *(lister() for _ in range(concurrency)))
+    return list_latencies, health_latencies
+
+
+async def main(args):
+    global DB_DELAY, BLOCKING
+    BLOCKING = args.blocking
+    install_latency()
+    headers = {"Authorization": f"Bearer {seed(args.instances)}"}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://controller") as client:
+        print(f"mode={'blocking' if BLOCKING else 'async'} concurrency={args.concurrency}")
+        for delay_ms in args.delays:
+            DB_DELAY = delay_ms / 1000
+            list_latencies, health_latencies = await measure(client, headers, args.concurrency, args.duration)
+            print(
+                f"db_delay={delay_ms:4.0f}ms "
+                f"list p50={statistics.median(list_latencies):7.1f}ms p99={percentile(list_latencies, 99):7.1f}ms "
+                f"rps={len(list_latencies) / args.duration:7.1f} | "
+                f"health p50={statistics.median(health_latencies):6.1f}ms "
+                f"p99={percentile(health_latencies, 99):6.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Controller latency vs database latency")
+    parser.add_argument("--delays", type=float, nargs="+", default=[0, 5, 20, 50], help="Per-statement DB delay in ms")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=3.0, help="Seconds per delay step")
+    parser.add_argument("--instances", type=int, default=20)
+    parser.add_argument("--blocking", action="store_true", help="Sleep on the event loop like a sync driver")
+    asyncio.run(main(parser.parse_args()))
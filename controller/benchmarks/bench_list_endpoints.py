@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Compare the list endpoints' fast read path with the ORM + response_model path.
+
+The fast path (/api/v1/nodes, /api/v1/instances) selects only the response
+columns and serializes rows straight to JSON bytes. The ORM path is mounted
+here as it was before: full ORM objects validated one by one through the
+pydantic response models. Both are called through the full ASGI stack and
+their bodies are checked to be identical before timing.
+
+Run from the controller directory:
+    python -m benchmarks.bench_list_endpoints --nodes 1000 --instances 20000 --limits 100 1000 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+# Use a throwaway database before the app creates its engines
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+
+import httpx
+from fastapi import Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.main import app
+from app.auth import create_access_token, get_password_hash, get_current_active_user
+from app.database import SessionLocal, get_db, User, Node, Instance
+from app.models import NodeResponse, InstanceResponse
+from app.serializers import ORJSON_AVAILABLE
+from benchmarks.bench_agent_pool import percentile
+
+
+@app.get("/bench/orm/nodes", response_model=List[NodeResponse])
+async def orm_nodes(limit: int, current_user: User = Depends(get_current_active_user),
+                    db: AsyncSession = Depends(get_db)):
+    nodes = (await db.execute(select(Node).order_by(Node.id).limit(limit))).scalars().all()
+    return [
+        NodeResponse(
+            id=node.id, name=node.name, address=node.address,
+            tags=json.loads(node.tags) if node.tags else [],
+            last_seen=node.last_seen, status=node.status, cpu_cores=node.cpu_cores,
+            memory_gb=node.memory_gb, disk_gb=node.disk_gb, running_instances=node.running_instances,
+            cpu_percent=node.cpu_percent, memory_percent=node.memory_percent
+        )
+        for node in nodes
+    ]
+
+
+@app.get("/bench/orm/instances", response_model=List[InstanceResponse])
+async def orm_instances(limit: int, current_user: User = Depends(get_current_active_user),
+                        db: AsyncSession = Depends(get_db)):
+    query = select(Instance).order_by(Instance.created_at, Instance.id).limit(limit)
+    return (await db.execute(query)).scalars().all()
+
+
+def seed(nodes: int, instances: int) -> str:
+    db = SessionLocal()
+    username = f"bench-{uuid.uuid4().hex[:6]}"
+    db.add(User(
+        id=str(uuid.uuid4()), username=username, email=f"{username}@example.com",
+        hashed_password=get_password_hash("bench")
+    ))
+    db.add_all([
+        Node(id=f"node-{i:05d}", name=f"node-{i}", address=f"10.0.{i // 250}.{i % 250}",
+             tags=json.dumps(["px4-agent", f"zone-{i % 4}"]), status="online",
+             cpu_cores=16, memory_gb=64, disk_gb=200)
+        for i in range(nodes)
+    ])
+    created = datetime.utcnow() - timedelta(days=1)
+    db.add_all([
+        Instance(id=str(uuid.uuid4()), node_id=f"node-{i % nodes:05d}", container_id=uuid.uuid4().hex,
+                 name=f"sim-{i}", mav_udp=14560 + i % 10, status="running" if i % 3 else "stopped",
+                 created_at=created + timedelta(milliseconds=i), updated_at=created)
+        for i in range(instances)
+    ])
+    db.commit()
+    db.close()
+    return create_access_token({"sub": username})
+
+
+async def timed(client: httpx.AsyncClient, path: str, params: dict, headers: dict, requests: int):
+    latencies = []
+    size = 0
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = await client.get(path, params=params, headers=headers)
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+        size = int(response.headers.get("content-length", len(response.content)))
+    return latencies, size
+
+
+async def main(args):
+    token = seed(args.nodes, args.instances)
+    auth = {"Authorization": f"Bearer {token}"}
+    print(f"nodes={args.nodes} instances={args.instances} orjson={ORJSON_AVAILABLE}")
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://controller") as client:
+        for resource in ("nodes", "instances"):
+            for limit in args.limits:
+                params = {"limit": limit}
+                plain = {**auth, "Accept-Encoding": "identity"}
+                fast = await client.get(f"/api/v1/{resource}", params=params, headers=plain)
+                orm = await client.get(f"/bench/orm/{resource}", params=params, headers=plain)
+                assert fast.json() == orm.json(), f"{resource} bodies differ"
+
+                runs = [
+                    ("orm", f"/bench/orm/{resource}", plain),
+                    ("fast", f"/api/v1/{resource}", plain),
+                    ("fast+gzip", f"/api/v1/{resource}", {**auth, "Accept-Encoding": "gzip"}),
+                ]
+                for label, path, headers in runs:
+                    latencies, size = await timed(client, path, params, headers, args.requests)
+                    print(
+                        f"{resource:<10} limit={limit:<5} {label:<10} "
+                        f"p50={statistics.median(latencies):8.2f}ms p99={percentile(latencies, 99):8.2f}ms "
+                        f"body={size / 1024:8.1f}KiB"
+                    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List endpoint read path benchmark")
+    parser.add_argument("--nodes", type=int, default=1000)
+    parser.add_argument("--instances", type=int, default=20000)
+    parser.add_argument("--limits", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--requests", type=int, default=30, help="Requests per measurement")
+    asyncio.run(main(parser.parse_args()))
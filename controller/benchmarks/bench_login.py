@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Measure /api/v1/instances latency while a burst of logins is running.
+
+By default bcrypt runs on the bounded password hashing pool; --inline runs
+it on the event loop the way the handlers used to.
+
+Run from the controller directory:
+    python -m benchmarks.bench_login --logins 50
+    python -m benchmarks.bench_login --logins 50 --inline
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+# Use a throwaway database before the app creates its engines
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+
+import httpx
+
+from app import auth
+from app.main import app
+from app.database import SessionLocal, User
+from benchmarks.bench_agent_pool import percentile
+
+
+def seed(users: int):
+    db = SessionLocal()
+    hashed = auth.get_password_hash("bench-password")
+    names = [f"bench-{uuid.uuid4().hex[:6]}" for _ in range(users)]
+    db.add_all([
+        User(id=str(uuid.uuid4()), username=name, email=f"{name}@example.com", hashed_password=hashed)
+        for name in names
+    ])
+    db.commit()
+    db.close()
+    return names
+
+
+async def main(args):
+    if args.inline:
+        async def run_inline(fn, *fn_args):
+            return fn(*fn_args)
+        auth.run_in_hash_pool = run_inline
+
+    names = seed(args.users)
+    headers = {"Authorization": f"Bearer {auth.create_access_token({'sub': names[0]})}"}
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://controller") as client:
+        list_latencies, login_latencies, rejected = [], [], 0
+        done = asyncio.Event()
+
+        async def lister():
+            while not done.is_set():
+                start = time.perf_counter()
+                response = await client.get("/api/v1/instances", headers=headers)
+                response.raise_for_status()
+                list_latencies.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(0.005)
+
+        async def login(i: int):
+            nonlocal rejected
+            start = time.perf_counter()
+            response = await client.post("/auth/login", json={
+                "username": names[i % len(names)], "password": "bench-password"
+            })
+            if response.status_code == 503:
+                rejected += 1
+            else:
+                response.raise_for_status()
+                login_latencies.append((time.perf_counter() - start) * 1000)
+
+        listers = [asyncio.create_task(lister()) for _ in range(args.listers)]
+        started = time.perf_counter()
+        await asyncio.gather(*(login(i) for i in range(args.logins)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await asyncio.gather(*listers)
+
+    print(f"mode={'inline' if args.inline else 'pool'} logins={args.logins} elapsed={elapsed:.2f}s "
+          f"login_throughput={len(login_latencies) / elapsed:.1f}/s rejected={rejected}")
+    if login_latencies:
+        print(f"login     p50={statistics.median(login_latencies):8.1f}ms p99={percentile(login_latencies, 99):8.1f}ms")
+    print(f"instances p50={statistics.median(list_latencies):8.1f}ms p99={percentile(list_latencies, 99):8.1f}ms "
+          f"samples={len(list_latencies)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Login burst vs concurrent request latency")
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--listers", type=int, default=4, help="Concurrent /api/v1/instances pollers")
+    parser.add_argument("--inline", action="store_true", help="Run bcrypt on the event loop")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,182 @@
+"""
+Stub PX4 agent for controller benchmarks.
+
+Implements the agent HTTP API without Docker so controller -> agent
+round-trips can be measured on localhost.
+
+With per_host=True one server stands in for a whole fleet: each node is
+registered with its own loopback address (127.x.y.z) and the agent state is
+kept per Host header. Run it standalone with:
+    python -m benchmarks.fake_agent --port 18443 --per-host --latency 0.05
+"""
+import argparse
+import asyncio
+import random
+import socket
+import threading
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+
+
+def create_fake_agent(node_id: str = "fake-node", latency: float = 0.0, jitter: float = 0.0,
+                      failure_rate: float = 0.0, per_host: bool = False,
+                      port_start: int = 14560, port_end: int = 14570) -> FastAPI:
+    """Build a FastAPI app that mimics the agent endpoints
+
+    latency/jitter delay start, stop and status calls (seconds, jitter is
+    uniform +/-); failure_rate is the fraction of those calls answered 500.
+    """
+    app = FastAPI(title="Fake PX4 Agent")
+    nodes = {}
+
+    def node_state(request: Request) -> dict:
+        name = request.url.hostname if per_host else node_id
+        state = nodes.get(name)
+        if state is None:
+            state = nodes[name] = {"node_id": name, "instances": {}}
+        return state
+
+    async def simulate():
+        if latency or jitter:
+            await asyncio.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+        if failure_rate and random.random() < failure_rate:
+            raise HTTPException(status_code=500, detail="Injected failure")
+
+    @app.get("/health")
+    async def health_check(request: Request):
+        return {"status": "healthy", "node_id": node_state(request)["node_id"]}
+
+    @app.get("/agent/status")
+    async def get_agent_status(request: Request):
+        await simulate()
+        state = node_state(request)
+        used = {info["mav_udp"] for info in state["instances"].values()}
+        return {
+            "node_id": state["node_id"],
+            "name": state["node_id"],
+            "status": "online",
+            "running_instances": len(state["instances"]),
+            "total_cpu_cores": 8,
+            "total_memory_gb": 32,
+            "total_disk_gb": 100,
+            "available_ports": [p for p in range(port_start, port_end) if p not in used]
+        }
+
+    @app.get("/agent/instances")
+    async def list_instances(request: Request):
+        return list(node_state(request)["instances"].values())
+
+    @app.post("/agent/start")
+    async def start_instance(request: Request, body: dict):
+        await simulate()
+        instances = node_state(request)["instances"]
+        instance_id = body.get("instance_id") or str(uuid.uuid4())
+        used = {info["mav_udp"] for info in instances.values()}
+        mav_udp = body.get("mav_udp") or next(
+            (p for p in range(port_start, port_end) if p not in used), port_start
+        )
+        info = {
+            "instance_id": instance_id,
+            "container_id": uuid.uuid4().hex,
+            "name": body.get("name") or instance_id[:8],
+            "model": body.get("model") or "iris",
+            "vehicle_type": body.get("vehicle_type") or "copter",
+            "mav_udp": mav_udp,
+            "status": "running"
+        }
+        instances[instance_id] = info
+        return info
+
+    @app.post("/agent/start-group")
+    async def start_group(request: Request, body: dict):
+        await simulate()
+        instances = node_state(request)["instances"]
+        count = body["count"]
+        instance_ids = body.get("instance_ids") or [str(uuid.uuid4()) for _ in range(count)]
+        if all(instance_id in instances for instance_id in instance_ids):
+            return [instances[instance_id] for instance_id in instance_ids]
+        # Vehicles get consecutive ports, like the agent's port blocks; like start, never refuses
+        used = {info["mav_udp"] for info in instances.values()}
+        first = next((p for p in range(port_start, port_end - count + 1)
+                      if not used.intersection(range(p, p + count))), port_start)
+        group_id = body.get("group_id") or str(uuid.uuid4())
+        container_id = uuid.uuid4().hex
+        vehicles = []
+        for n, instance_id in enumerate(instance_ids):
+            info = {
+                "instance_id": instance_id,
+                "container_id": container_id,
+                "name": f"{body.get('name') or group_id[:8]}_{n}",
+                "model": body.get("model") or "iris",
+                "vehicle_type": body.get("vehicle_type") or "copter",
+                "mav_udp": first + n,
+                "status": "running",
+                "group_id": group_id,
+                "px4_instance": first + n - port_start + 1
+            }
+            instances[instance_id] = info
+            vehicles.append(info)
+        return vehicles
+
+    @app.post("/agent/stop")
+    async def stop_instance(request: Request, body: dict):
+        await simulate()
+        info = node_state(request)["instances"].pop(body.get("instance_id"), None)
+        return {
+            "status": "stopped",
+            "container_id": body.get("container_id") or (info or {}).get("container_id"),
+            "instance_id": body.get("instance_id")
+        }
+
+    return app
+
+
+def free_port() -> int:
+    """Ask the OS for an unused TCP port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ServerThread:
+    """Run a uvicorn server in a background thread"""
+
+    def __init__(self, app: FastAPI, port: int = None):
+        self.port = port or free_port()
+        config = uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake PX4 agent")
+    # 0.0.0.0 so the server answers on every 127.x.y.z loopback address in --per-host mode
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--node-id", default="fake-node")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--per-host", action="store_true", help="Keep separate state per Host header")
+    args = parser.parse_args()
+    uvicorn.run(
+        create_fake_agent(args.node_id, args.latency, args.jitter, args.failure_rate, args.per_host),
+        host=args.host, port=args.port, log_level="warning"
+    )
@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+Load-test the controller against a fake agent fleet.
+
+For each fleet size the controller runs as its own uvicorn process on a fresh
+SQLite database, next to a fake agent process that answers for every node
+(benchmarks.fake_agent --per-host). The harness registers the nodes through
+/api/v1/register, seeds historical instance rows, then drives mixed
+start/stop/list/login traffic for a fixed time and reports throughput and
+tail latencies per operation.
+
+Results are written as JSON; pass an earlier file with --compare to flag
+regressions.
+
+Run from the controller directory:
+    python -m benchmarks.load_test --nodes 10 100 1000 --rows 100000 --duration 30
+    python -m benchmarks.load_test --nodes 100 --compare benchmarks/results/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Keep the imported models from creating a database in the working directory
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'load-test.db')}")
+
+import httpx
+from sqlalchemy import create_engine
+
+from app.database import Base, Instance
+from benchmarks.bench_agent_pool import percentile
+from benchmarks.fake_agent import free_port
+
+CONTROLLER_DIR = Path(__file__).resolve().parents[1]
+RESULTS_DIR = CONTROLLER_DIR / "benchmarks" / "results"
+AGENT_API_KEY = "load-test-agent-key"
+PASSWORD = "load-test-password"
+
+# Relative weight of each operation in the traffic mix
+DEFAULT_MIX = {
+    "start": 2.0,
+    "start_group": 0.5,
+    "stop": 2.0,
+    "list_instances": 4.0,
+    "list_nodes": 1.0,
+    "get_instance": 2.0,
+    "summary": 1.0,
+    "login": 0.2,
+    "heartbeat": 3.0,
+}
+
+
+def node_address(i: int) -> str:
+    """A distinct loopback address per node so each gets its own agent URL"""
+    return f"127.{1 + i // 62500}.{(i // 250) % 250}.{i % 250 + 1}"
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown operation {name!r}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def wait_for(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+class Fleet:
+    """The controller and fake agent processes for one scenario"""
+
+    def __init__(self, args, nodes: int, workdir: str):
+        self.database_url = f"sqlite:///{os.path.join(workdir, 'controller.db')}"
+        self.agent_port = free_port()
+        self.controller_port = free_port()
+        self.url = f"http://127.0.0.1:{self.controller_port}"
+        self.processes = []
+        self.agent_args = [
+            sys.executable, "-m", "benchmarks.fake_agent", "--per-host",
+            "--port", str(self.agent_port),
+            "--latency", str(args.agent_latency),
+            "--jitter", str(args.agent_jitter),
+            "--failure-rate", str(args.agent_failure_rate),
+        ]
+        self.controller_env = {
+            **os.environ,
+            "DATABASE_URL": self.database_url,
+            "AGENT_API_KEY": AGENT_API_KEY,
+            "AGENT_SCHEME": "http",
+            "AGENT_PORT": str(self.agent_port),
+            "AGENT_POOL_MAX_CLIENTS": str(max(1024, nodes)),
+            "RECONCILE_ENABLED": str(not args.no_reconcile),
+            "RECONCILE_INTERVAL": str(args.reconcile_interval),
+        }
+
+    def __enter__(self):
+        self.processes.append(subprocess.Popen(self.agent_args, cwd=CONTROLLER_DIR))
+        self.processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+             "--port", str(self.controller_port), "--log-level", "warning"],
+            cwd=CONTROLLER_DIR, env=self.controller_env
+        ))
+        wait_for(f"http://127.0.0.1:{self.agent_port}/health")
+        wait_for(f"{self.url}/health")
+        return self
+
+    def __exit__(self, *exc):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+async def register_nodes(client: httpx.AsyncClient, count: int, concurrency: int, attempts: int = 3) -> int:
+    """Register every node, retrying failures like an agent would; returns the failed attempts"""
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+
+    async def register(i: int):
+        nonlocal failures
+        async with semaphore:
+            for attempt in range(attempts):
+                try:
+                    response = await client.post("/api/v1/register", json={
+                        "node_id": f"load-node-{i}",
+                        "name": f"load-node-{i}",
+                        "address": node_address(i),
+                        "tags": ["px4-agent", f"zone-{i % 4}"],
+                        "api_key": AGENT_API_KEY,
+                        "cpu_cores": 16,
+                        "memory_gb": 64,
+                        "disk_gb": 200
+                    })
+                    if response.status_code == 200:
+                        return
+                except httpx.HTTPError:
+                    pass
+                failures += 1
+                await asyncio.sleep(0.5 * (attempt + 1))
+            raise RuntimeError(f"load-node-{i} could not register after {attempts} attempts")
+
+    await asyncio.gather(*(register(i) for i in range(count)))
+    return failures
+
+
+def seed_instances(database_url: str, nodes: int, rows: int, chunk: int = 5000) -> list:
+    """Insert stopped instance rows straight into the database and return their IDs"""
+    engine = create_engine(database_url)
+    Base.metadata.create_all(bind=engine)
+    ids = []
+    created = datetime.utcnow() - timedelta(days=30)
+    with engine.begin() as conn:
+        for offset in range(0, rows, chunk):
+            batch = []
+            for i in range(offset, min(rows, offset + chunk)):
+                instance_id = str(uuid.uuid4())
+                ids.append(instance_id)
+                batch.append({
+                    "id": instance_id,
+                    "node_id": f"load-node-{i % nodes}",
+                    "container_id": uuid.uuid4().hex,
+                    "name": f"seed-{i}",
+                    "vehicle_type": "copter",
+                    "model": "iris",
+                    "mav_udp": 14560 + i % 10,
+                    "status": "stopped",
+                    "created_at": created + timedelta(seconds=i),
+                    "updated_at": created + timedelta(seconds=i),
+                })
+            conn.execute(Instance.__table__.insert(), batch)
+    engine.dispose()
+    return ids
+
+
+class Traffic:
+    """Closed-loop workers issuing a weighted mix of controller requests"""
+
+    def __init__(self, client: httpx.AsyncClient, username: str, nodes: int, seeded: list, mix: dict):
+        self.client = client
+        self.username = username
+        self.nodes = nodes
+        self.seeded = seeded
+        self.operations = list(mix)
+        self.weights = [mix[name] for name in self.operations]
+        self.started = []  # (node_id, instance_id) of instances this run started
+        self.latencies = {name: [] for name in self.operations}
+        self.outcomes = {name: {"ok": 0, "rejected": 0, "errors": 0} for name in self.operations}
+
+    async def start(self):
+        response = await self.client.post("/api/v1/instances/start", json={"model": "iris"})
+        if response.status_code == 202:
+            body = response.json()
+            self.started.append((body["node_id"], body["instance_id"]))
+        return response
+
+    async def start_group(self):
+        response = await self.client.post("/api/v1/instances/group", json={"model": "iris", "count": 4})
+        if response.status_code == 200:
+            self.started.extend((result["node_id"], result["instance_id"])
+                                for result in response.json()["results"] if result["status"] == "started")
+        return response
+
+    async def stop(self):
+        if not self.started:
+            return await self.start()
+        node_id, instance_id = self.started.pop(random.randrange(len(self.started)))
+        return await self.client.post(f"/api/v1/nodes/{node_id}/stop", json={"instance_id": instance_id})
+
+    async def list_instances(self):
+        params = {"limit": 100}
+        if random.random() < 0.5:
+            params["status"] = "running"
+        return await self.client.get("/api/v1/instances", params=params)
+
+    async def list_nodes(self):
+        return await self.client.get("/api/v1/nodes", params={"limit": 100})
+
+    async def get_instance(self):
+        pool = self.started if self.started and random.random() < 0.5 else None
+        instance_id = random.choice(pool)[1] if pool else random.choice(self.seeded)
+        return await self.client.get(f"/api/v1/instances/{instance_id}")
+
+    async def summary(self):
+        return await self.client.get("/api/v1/summary")
+
+    async def login(self):
+        return await self.client.post("/auth/login", json={"username": self.username, "password": PASSWORD})
+
+    async def heartbeat(self):
+        return await self.client.post(f"/api/v1/nodes/load-node-{random.randrange(self.nodes)}/heartbeat", json={
+            "api_key": AGENT_API_KEY,
+            "running_instances": random.randint(0, 10),
+            "cpu_percent": random.uniform(0, 100),
+            "memory_percent": random.uniform(0, 100)
+        })
+
+    async def worker(self, deadline: float):
+        while time.perf_counter() < deadline:
+            name = random.choices(self.operations, self.weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await getattr(self, name)()
+                status_code = response.status_code
+            except httpx.HTTPError:
+                status_code = None
+            self.latencies[name].append((time.perf_counter() - start) * 1000)
+            if status_code is not None and status_code < 400:
+                self.outcomes[name]["ok"] += 1
+            elif status_code == 503:
+                # No capacity / saturated pool: expected under load, counted apart from errors
+                self.outcomes[name]["rejected"] += 1
+            else:
+                self.outcomes[name]["errors"] += 1
+
+    async def run(self, duration: float, concurrency: int) -> float:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(self.worker(deadline) for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+
+def summarize(latencies: list, outcomes: dict, elapsed: float) -> dict:
+    if not latencies:
+        return {"count": 0, **outcomes}
+    return {
+        "count": len(latencies),
+        **outcomes,
+        "throughput": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2),
+    }
+
+
+def scrape_loop_lag(url: str) -> dict:
+    """Event-loop lag seen by the controller during the run, from /metrics"""
+    try:
+        text = httpx.get(f"{url}/metrics", timeout=5).text
+    except httpx.HTTPError:
+        return {}
+    values = {}
+    for line in text.splitlines():
+        if line.startswith("controller_event_loop_lag_seconds_sum"):
+            values["sum"] = float(line.split()[-1])
+        elif line.startswith("controller_event_loop_lag_seconds_count"):
+            values["count"] = float(line.split()[-1])
+    if not values.get("count"):
+        return {}
+    return {"loop_lag_mean_ms": round(values["sum"] / values["count"] * 1000, 2)}
+
+
+async def run_scenario(args, nodes: int) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        fleet = Fleet(args, nodes, workdir)
+        with fleet:
+            async with httpx.AsyncClient(base_url=fleet.url, timeout=60) as client:
+                setup_started = time.perf_counter()
+                register_failures = await register_nodes(client, nodes, args.concurrency)
+                register_time = time.perf_counter() - setup_started
+                seeded = seed_instances(fleet.database_url, nodes, args.rows)
+
+                username = f"load-{uuid.uuid4().hex[:8]}"
+                response = await client.post("/auth/register", json={
+                    "username": username, "email": f"{username}@example.com", "password": PASSWORD
+                })
+                response.raise_for_status()
+                response = await client.post("/auth/login", json={"username": username, "password": PASSWORD})
+                response.raise_for_status()
+                client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+
+                traffic = Traffic(client, username, nodes, seeded or ["missing"], args.mix)
+                elapsed = await traffic.run(args.duration, args.concurrency)
+
+            all_latencies = [ms for samples in traffic.latencies.values() for ms in samples]
+            totals = {key: sum(o[key] for o in traffic.outcomes.values()) for key in ("ok", "rejected", "errors")}
+            return {
+                "nodes": nodes,
+                "rows": args.rows,
+                "register_seconds": round(register_time, 2),
+                "register_failures": register_failures,
+                **summarize(all_latencies, totals, elapsed),
+                **scrape_loop_lag(fleet.url),
+                "operations": {
+                    name: summarize(traffic.latencies[name], traffic.outcomes[name], elapsed)
+                    for name in traffic.operations
+                },
+            }
+
+
+def print_scenario(name: str, result: dict):
+    print(f"\n{name}: {result['throughput']:.1f} req/s, p50={result['p50_ms']}ms p99={result['p99_ms']}ms "
+          f"errors={result['errors']} rejected={result['rejected']} "
+          f"(registered in {result['register_seconds']}s, {result['register_failures']} failed attempts)")
+    print(f"  {'operation':<16}{'count':>8}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'err':>6}{'503':>6}")
+    for op, stats in result["operations"].items():
+        if not stats["count"]:
+            continue
+        print(f"  {op:<16}{stats['count']:>8}{stats['throughput']:>9.1f}{stats['p50_ms']:>9.1f}"
+              f"{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['max_ms']:>9.1f}"
+              f"{stats['errors']:>6}{stats['rejected']:>6}")
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Regressions of p99 latency or throughput beyond the threshold, per scenario and operation"""
+    regressions = []
+    for name, result in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        pairs = [("overall", result, base)] + [
+            (op, stats, base["operations"].get(op)) for op, stats in result["operations"].items()
+        ]
+        for op, current, previous in pairs:
+            if not previous or not current.get("count") or not previous.get("count"):
+                continue
+            p99_change = current["p99_ms"] / previous["p99_ms"] - 1 if previous["p99_ms"] else 0.0
+            rate_change = current["throughput"] / previous["throughput"] - 1 if previous["throughput"] else 0.0
+            flag = ""
+            if p99_change > threshold or rate_change < -threshold:
+                flag = "  REGRESSION"
+                regressions.append(f"{name}/{op}")
+            print(f"  {name:<12}{op:<16} p99 {previous['p99_ms']:>8.1f} -> {current['p99_ms']:>8.1f}ms "
+                  f"({p99_change:+.0%})  req/s {previous['throughput']:>8.1f} -> {current['throughput']:>8.1f} "
+                  f"({rate_change:+.0%}){flag}")
+    return regressions
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=CONTROLLER_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def main(args):
+    results = {
+        "revision": git_revision(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "config": {
+            "rows": args.rows,
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "mix": args.mix,
+            "agent_latency": args.agent_latency,
+            "agent_jitter": args.agent_jitter,
+            "agent_failure_rate": args.agent_failure_rate,
+            "reconcile": not args.no_reconcile,
+        },
+        "scenarios": {},
+    }
+    for nodes in args.nodes:
+        name = f"nodes={nodes}"
+        result = await run_scenario(args, nodes)
+        results["scenarios"][name] = result
+        print_scenario(name, result)
+
+    output = Path(args.output) if args.output else \
+        RESULTS_DIR / f"load-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{results['revision']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        print(f"\nCompared with {args.compare}:")
+        regressions = compare(results, json.loads(Path(args.compare).read_text()), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Controller load test with a fake agent fleet")
+    parser.add_argument("--nodes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--rows", type=int, default=100000, help="Historical instance rows seeded per scenario")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of traffic per scenario")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent client connections")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="Operation weights, e.g. start=2,stop=2,list_instances=4,login=0.2")
+    parser.add_argument("--agent-latency", type=float, default=0.05, help="Seconds per agent call")
+    parser.add_argument("--agent-jitter", type=float, default=0.02)
+    parser.add_argument("--agent-failure-rate", type=float, default=0.0)
+    parser.add_argument("--reconcile-interval", type=float, default=15.0)
+    parser.add_argument("--no-reconcile", action="store_true")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/load-<time>-<rev>.json)")
+    parser.add_argument("--compare", help="Earlier result file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed p99/throughput change")
+    sys.exit(asyncio.run(main(parser.parse_args())))
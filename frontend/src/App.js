@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { Server, LogOut, RefreshCw } from 'lucide-react';
-import { nodeAPI, instanceAPI } from './services/api';
+import { nodeAPI, instanceAPI, summaryAPI, openEventStream } from './services/api';
 import Login from './components/Login';
 import NodeCard from './components/NodeCard';
 import InstanceList from './components/InstanceList';
@@ -9,6 +9,7 @@ function App() {
   const [isAuthenticated, setIsAuthenticated] = useState(false);
   const [nodes, setNodes] = useState([]);
   const [instances, setInstances] = useState([]);
+  const [summary, setSummary] = useState(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
 
@@ -21,18 +22,83 @@ function App() {
     }
   }, []);
 
+  // Keep nodes and instances current from the controller's event stream
+  useEffect(() => {
+    if (!isAuthenticated) {
+      return undefined;
+    }
+
+    const merge = (items, event, keep) => {
+      const index = items.findIndex(item => item.id === event.id);
+      const merged = { ...(index >= 0 ? items[index] : { id: event.id }), ...event.data };
+      const rest = index >= 0 ? [...items.slice(0, index), ...items.slice(index + 1)] : items;
+      if (!keep(merged)) {
+        return rest;
+      }
+      return index >= 0 ? [...rest.slice(0, index), merged, ...rest.slice(index)] : [...rest, merged];
+    };
+
+    // The header counters come from the summary (the lists are paged), so
+    // refetch it after streamed changes, at most once a second
+    let summaryTimer = null;
+    const summaryChanged = () => {
+      if (summaryTimer === null) {
+        summaryTimer = setTimeout(() => {
+          summaryTimer = null;
+          refreshSummary();
+        }, 1000);
+      }
+    };
+
+    const source = openEventStream();
+    source.addEventListener('snapshot', (e) => {
+      const snapshot = JSON.parse(e.data);
+      setNodes(snapshot.nodes);
+      setInstances(snapshot.instances);
+      summaryChanged();
+    });
+    source.addEventListener('node', (e) => {
+      const event = JSON.parse(e.data);
+      setNodes(current => merge(current, event, () => true));
+      summaryChanged();
+    });
+    source.addEventListener('instance', (e) => {
+      const event = JSON.parse(e.data);
+      // Stopped instances are only counted, not listed
+      setInstances(current => merge(current, event, instance => instance.status !== 'stopped'));
+      summaryChanged();
+    });
+
+    return () => {
+      source.close();
+      clearTimeout(summaryTimer);
+    };
+  }, [isAuthenticated]);
+
+  const refreshSummary = async () => {
+    try {
+      const summaryResponse = await summaryAPI.get();
+      setSummary(summaryResponse.data);
+    } catch (err) {
+      // Counters fall back to the streamed lists
+    }
+  };
+
   const fetchData = async () => {
     setLoading(true);
     setError('');
     
     try {
-      const [nodesResponse, instancesResponse] = await Promise.all([
+      // Stopped instances are only counted, not downloaded
+      const [nodesResponse, instancesResponse, summaryResponse] = await Promise.all([
         nodeAPI.list(),
-        instanceAPI.list()
+        instanceAPI.list({ status: 'starting,running,stopping,error' }),
+        summaryAPI.get()
       ]);
       
       setNodes(nodesResponse.data);
       setInstances(instancesResponse.data);
+      setSummary(summaryResponse.data);
     } catch (err) {
       setError('Failed to fetch data: ' + (err.response?.data?.detail || err.message));
       if (err.response?.status === 401) {
@@ -53,12 +119,13 @@ function App() {
     setIsAuthenticated(false);
     setNodes([]);
     setInstances([]);
+    setSummary(null);
   };
 
   const handleStartInstance = async (nodeId, instanceData) => {
     try {
       await nodeAPI.startInstance(nodeId, instanceData);
-      await fetchData(); // Refresh data
+      await refreshSummary(); // Lists update from the event stream
     } catch (err) {
       setError('Failed to start instance: ' + (err.response?.data?.detail || err.message));
     }
@@ -67,7 +134,7 @@ function App() {
   const handleStopInstance = async (nodeId, instanceData) => {
     try {
       await nodeAPI.stopInstance(nodeId, instanceData);
-      await fetchData(); // Refresh data
+      await refreshSummary(); // Lists update from the event stream
     } catch (err) {
       setError('Failed to stop instance: ' + (err.response?.data?.detail || err.message));
     }
@@ -125,7 +192,7 @@ function App() {
               </div>
               <div className="ml-4">
                 <p className="text-sm font-medium text-gray-500">Total Nodes</p>
-                <p className="text-2xl font-semibold text-gray-900">{nodes.length}</p>
+                <p className="text-2xl font-semibold text-gray-900">{summary ? summary.nodes.total : nodes.length}</p>
               </div>
             </div>
           </div>
@@ -140,7 +207,7 @@ function App() {
               <div className="ml-4">
                 <p className="text-sm font-medium text-gray-500">Online Nodes</p>
                 <p className="text-2xl font-semibold text-gray-900">
-                  {nodes.filter(n => n.status === 'online').length}
+                  {summary ? (summary.nodes.by_status.online || 0) : nodes.filter(n => n.status === 'online').length}
                 </p>
               </div>
             </div>
@@ -155,7 +222,7 @@ function App() {
               </div>
               <div className="ml-4">
                 <p className="text-sm font-medium text-gray-500">Total Instances</p>
-                <p className="text-2xl font-semibold text-gray-900">{instances.length}</p>
+                <p className="text-2xl font-semibold text-gray-900">{summary ? summary.instances.total : instances.length}</p>
               </div>
             </div>
           </div>
@@ -170,7 +237,7 @@ function App() {
               <div className="ml-4">
                 <p className="text-sm font-medium text-gray-500">Running Instances</p>
                 <p className="text-2xl font-semibold text-gray-900">
-                  {instances.filter(i => i.status === 'running').length}
+                  {summary ? (summary.instances.by_status.running || 0) : instances.filter(i => i.status === 'running').length}
                 </p>
               </div>
             </div>
@@ -39,7 +39,7 @@ export const authAPI = {
 
 // Node endpoints
 export const nodeAPI = {
-  list: () => api.get('/api/v1/nodes'),
+  list: (params) => api.get('/api/v1/nodes', { params }),
   get: (nodeId) => api.get(`/api/v1/nodes/${nodeId}`),
   startInstance: (nodeId, instanceData) => api.post(`/api/v1/nodes/${nodeId}/start`, instanceData),
   stopInstance: (nodeId, instanceData) => api.post(`/api/v1/nodes/${nodeId}/stop`, instanceData),
@@ -47,8 +47,20 @@ export const nodeAPI = {
 
 // Instance endpoints
 export const instanceAPI = {
-  list: () => api.get('/api/v1/instances'),
+  list: (params) => api.get('/api/v1/instances', { params }),
   get: (instanceId) => api.get(`/api/v1/instances/${instanceId}`),
 };
 
+// Live node/instance changes (Server-Sent Events). EventSource can't send
+// headers, so the token goes in the query string.
+export const openEventStream = () => {
+  const token = localStorage.getItem('authToken');
+  return new EventSource(`${API_BASE_URL}/api/v1/events?access_token=${encodeURIComponent(token)}`);
+};
+
+// Fleet-wide counts by status
+export const summaryAPI = {
+  get: () => api.get('/api/v1/summary'),
+};
+
 export default api;